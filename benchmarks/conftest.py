@@ -0,0 +1,25 @@
+"""
+Settings of the benchmark runs, applied before gs2gbq is imported.
+
+The rate limiter is turned off (the fakes have no quota of their own besides
+the injected errors) and the state files go to a temporary directory.
+"""
+import os
+import sys
+import tempfile
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIRECTORY = os.path.join(os.path.dirname(BENCHMARK_DIRECTORY), "gs2gbq")
+STATE_DIRECTORY = tempfile.mkdtemp(prefix="gs2gbq-bench-")
+
+for name in ["SHEETS_READ_PER_MINUTE", "SHEETS_WRITE_PER_MINUTE", "BIGQUERY_LOADS_PER_MINUTE"]:
+    os.environ.setdefault(name, "0")
+os.environ.setdefault("WATERMARK_FILE", os.path.join(STATE_DIRECTORY, "watermarks.json"))
+os.environ.setdefault("FINGERPRINT_FILE", os.path.join(STATE_DIRECTORY, "fingerprints.json"))
+os.environ.setdefault("CONFIG_CACHE_FILE", os.path.join(STATE_DIRECTORY, "jobconfig.json"))
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(STATE_DIRECTORY, "snapshots"))
+# whole runs measure the Sheets reads, see test_fetch_snapshot for the snapshots
+os.environ.setdefault("SNAPSHOT_MAX_BYTES", "0")
+os.environ.setdefault("FORCE_REFRESH", "true")
+
+sys.path[:0] = [BENCHMARK_DIRECTORY, PACKAGE_DIRECTORY]
@@ -0,0 +1,457 @@
+"""
+In-process stand-ins for the Sheets and BigQuery APIs used by gs2gbq.
+
+`FakeSpreadsheet` answers `values_batch_get`, `fetch_sheet_metadata`, the
+Drive metadata request, the CSV export and `Worksheet.get`/`append_rows`
+from a grid held in memory; `FakeBigQueryClient` accepts load and query jobs, reading the
+Parquet it is sent so that serialization is part of what is measured.
+Both can add a fixed latency to every call and answer one call in
+`error_every` with a 429 carrying a `Retry-After` header.
+
+`install` puts them in the client registry, so that `GSHandler` and
+`JobManager` run unmodified against them.
+
+`SheetsHTTPServer` serves the values and export endpoints of fake
+spreadsheets over local HTTP, and `HTTPSpreadsheet` reads through it, for
+measures where the encoding of the responses matters.
+"""
+import csv
+import io
+import json
+import itertools
+import os
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import google.api_core.exceptions
+
+from memory_conversion import synthetic_values
+from storagewrite import table_path
+
+
+def _gspread_errors():
+    """gspread's exception module, imported by the first error raised: a run without faults does not load gspread."""
+    import gspread.exceptions
+
+    return gspread.exceptions
+
+
+class FakeResponse:
+    def __init__(self, status_code: int = 200, payload: dict = None, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.payload = payload or {}
+        self.headers = headers or {}
+        self.text = str(self.payload)
+        self.content = self.text.encode()
+
+    def json(self):
+        return self.payload
+
+
+class Faults:
+    """Latency added to every call and a 429 every `error_every` calls (0 means never).
+
+    BigQuery jobs also take `job_seconds` to run once submitted.
+    """
+
+    def __init__(self, latency: float = 0, error_every: int = 0, retry_after: float = 0, job_seconds: float = 0) -> None:
+        self.latency = latency
+        self.error_every = error_every
+        self.retry_after = retry_after
+        self.job_seconds = job_seconds
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def rate_limited(self) -> bool:
+        with self._lock:
+            self.calls += 1
+            limited = bool(self.error_every) and self.calls % self.error_every == 0
+            self.errors += limited
+        if self.latency:
+            time.sleep(self.latency)
+        return limited
+
+    def response_429(self) -> FakeResponse:
+        return FakeResponse(
+            429,
+            {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}},
+            {"Retry-After": str(self.retry_after)},
+        )
+
+
+def synthetic_rows(n_rows: int, n_cols: int) -> list:
+    """Header plus `n_rows` rows of strings, as the Sheets API returns them."""
+    headers, values = synthetic_values(n_rows, n_cols)
+    return [headers] + values.tolist()
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _column_letters(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def column_ranges(n_cols: int, n_ranges: int) -> str:
+    """`A:C,D:F`-like value of the `range` column, splitting `n_cols` columns in `n_ranges` ranges."""
+    bounds = [round(i * n_cols / n_ranges) for i in range(n_ranges + 1)]
+    return ",".join(f"{_column_letters(start)}:{_column_letters(end - 1)}" for start, end in zip(bounds, bounds[1:]))
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title: str, rows: list) -> None:
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = rows
+
+    def get(self, range_name: str = None, **kwargs):
+        if self.spreadsheet.faults.rate_limited():
+            raise _gspread_errors().APIError(self.spreadsheet.faults.response_429())
+        return self.spreadsheet.read_range(self.title, range_name)
+
+    def append_rows(self, rows, **kwargs):
+        if self.spreadsheet.faults.rate_limited():
+            raise _gspread_errors().APIError(self.spreadsheet.faults.response_429())
+        self.rows.extend(list(row) for row in rows)
+
+    def append_row(self, row, **kwargs):
+        self.append_rows([row])
+
+
+class _FakeHTTPClient:
+    def __init__(self, spreadsheet) -> None:
+        self.spreadsheet = spreadsheet
+
+    def request(self, method, url, params=None, **kwargs):
+        if url.endswith("/export"):
+            if self.spreadsheet.faults.rate_limited():
+                raise _gspread_errors().APIError(self.spreadsheet.faults.response_429())
+            response = FakeResponse(200)
+            response.content = self.spreadsheet.export_csv(int(params["gid"]))
+            return response
+        return FakeResponse(200, {"modifiedTime": self.spreadsheet.modified_time, "version": str(self.spreadsheet.version)})
+
+
+class FakeSpreadsheet:
+    """A spreadsheet of worksheets given as lists of rows (header first)."""
+
+    _ids = itertools.count()
+
+    def __init__(self, worksheets: dict, faults: Faults = None) -> None:
+        self.id = f"fake-{next(self._ids)}"
+        self.worksheets = {title: FakeWorksheet(self, title, rows) for title, rows in worksheets.items()}
+        self.faults = faults or Faults()
+        self.client = _FakeHTTPClient(self)
+        self.modified_time = "2024-01-01T00:00:00.000Z"
+        self.version = 1
+        self.requests = 0
+
+    def touch(self):
+        """Simulate an edit: bumps the Drive revision."""
+        self.version += 1
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        if title not in self.worksheets:
+            raise _gspread_errors().WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def read_range(self, title: str, a1: str = None) -> list:
+        rows = self.worksheet(title).rows
+        if not a1:
+            block = [list(row) for row in rows]
+        else:
+            match = re.fullmatch(r"([A-Za-z]+)(\d*)(?::([A-Za-z]+)(\d*))?", a1)
+            first_col, first_row, last_col, last_row = match.groups()
+            first_col = _column_index(first_col)
+            last_col = _column_index(last_col or match.group(1))
+            first_row = int(first_row) if first_row else 1
+            last_row = int(last_row) if last_row else len(rows)
+            block = [row[first_col:last_col + 1] for row in rows[first_row - 1:last_row]]
+        # Like the API, trailing empty cells and rows are not returned.
+        block = [row[: max((i + 1 for i, v in enumerate(row) if v not in ("", None)), default=0)] for row in block]
+        while block and not block[-1]:
+            block.pop()
+        return block
+
+    def values_batch_get(self, ranges, params=None):
+        self.requests += 1
+        if self.faults.rate_limited():
+            raise _gspread_errors().APIError(self.faults.response_429())
+        value_ranges = []
+        for a1 in ranges:
+            title, _, cells = a1.rpartition("!")
+            if not title:
+                title, cells = cells, None
+            title = title.strip("'").replace("''", "'")
+            value_ranges.append({"range": a1, "values": self.read_range(title, cells)})
+        return {"valueRanges": value_ranges}
+
+    def fetch_sheet_metadata(self, params=None):
+        return {
+            "sheets": [
+                {
+                    "properties": {
+                        "title": title,
+                        "sheetId": gid,
+                        "gridProperties": {
+                            "rowCount": len(ws.rows),
+                            "columnCount": max((len(row) for row in ws.rows), default=0),
+                        },
+                    }
+                }
+                for gid, (title, ws) in enumerate(self.worksheets.items())
+            ]
+        }
+
+    def export_csv(self, gid: int) -> bytes:
+        """The worksheet `gid` as the export endpoint returns it: every row as wide as the widest one."""
+        self.requests += 1
+        rows = list(self.worksheets.values())[gid].rows
+        width = max((len(row) for row in rows), default=0)
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\r\n")
+        for row in rows:
+            writer.writerow(["" if v is None else v for v in row] + [""] * (width - len(row)))
+        return out.getvalue().encode()
+
+
+class SheetsHTTPServer:
+    """Local HTTP server answering the values and export requests of fake spreadsheets, by id.
+
+    Values come back as the JSON the Sheets API sends and exports as CSV.
+    """
+
+    def __init__(self) -> None:
+        self.spreadsheets = {}
+        spreadsheets = self.spreadsheets
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                query = urllib.parse.parse_qs(url.query)
+                _, spreadsheet_id, endpoint = url.path.split("/")
+                spreadsheet = spreadsheets[spreadsheet_id]
+                if endpoint == "values":
+                    body = json.dumps(FakeSpreadsheet.values_batch_get(spreadsheet, query["ranges"])).encode()
+                else:
+                    body = FakeSpreadsheet.export_csv(spreadsheet, int(query["gid"][0]))
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _HTTPClient(_FakeHTTPClient):
+    def request(self, method, url, params=None, **kwargs):
+        if not url.endswith("/export"):
+            return super().request(method, url, params, **kwargs)
+        import requests
+
+        return requests.get(f"{self.spreadsheet.server.url}/{self.spreadsheet.id}/export", params=params)
+
+
+class HTTPSpreadsheet(FakeSpreadsheet):
+    """A `FakeSpreadsheet` whose values and exports are fetched from `server`."""
+
+    def __init__(self, server: SheetsHTTPServer, worksheets: dict, faults: Faults = None) -> None:
+        super().__init__(worksheets, faults)
+        self.server = server
+        self.client = _HTTPClient(self)
+        server.spreadsheets[self.id] = self
+
+    def values_batch_get(self, ranges, params=None):
+        import requests
+
+        response = requests.get(f"{self.server.url}/{self.id}/values", params={"ranges": list(ranges)})
+        return response.json()
+
+
+class _FakeJob:
+    def __init__(self, error: Exception = None, seconds: float = 0) -> None:
+        self.error = error
+        self.done_at = time.monotonic() + seconds
+
+    def done(self, *args, **kwargs):
+        return time.monotonic() >= self.done_at
+
+    def result(self, *args, **kwargs):
+        time.sleep(max(self.done_at - time.monotonic(), 0))
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def cancel(self, *args, **kwargs):
+        if not self.done():
+            self.error = google.api_core.exceptions.BadRequest("Job execution was cancelled: User requested cancellation")
+            self.done_at = time.monotonic()
+        return True
+
+
+class _FakeTable:
+    def __init__(self, schema, num_rows: int) -> None:
+        self.schema = list(schema or [])
+        self.num_rows = num_rows
+
+
+class FakeBigQueryClient:
+    """Keeps the row count and schema of every loaded table; load errors surface on `result()` like real jobs.
+
+    Copy jobs also copy the rows a `storage_write` stand-in holds for the source table,
+    loads from `gs://` URIs read the Parquet objects of the `buckets` (`gcsstaging.LocalBucket`)
+    and the queries retyping columns change the schema of their table.
+    """
+
+    def __init__(self, faults: Faults = None, storage_write=None, buckets=()) -> None:
+        self.faults = faults or Faults()
+        self.storage_write = storage_write
+        self.buckets = {bucket.name: bucket for bucket in buckets}
+        self.tables = {}
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def _rate_limited_job(self):
+        if self.faults.rate_limited():
+            error = google.api_core.exceptions.TooManyRequests(
+                "Exceeded rate limits", response=self.faults.response_429()
+            )
+            return _FakeJob(error)
+        return None
+
+    def _job(self, table_name, num_rows, job_config):
+        limited = self._rate_limited_job()
+        if limited is not None:
+            return limited
+        with self._lock:
+            self.jobs.append((table_name, num_rows))
+            previous = self.tables.get(table_name)
+            appending = previous is not None and job_config is not None and job_config.write_disposition == "WRITE_APPEND"
+            schema = previous.schema if appending else getattr(job_config, "schema", None)
+            self.tables[table_name] = _FakeTable(schema, num_rows + (previous.num_rows if appending else 0))
+        return _FakeJob(seconds=self.faults.job_seconds)
+
+    def get_table(self, table_name):
+        with self._lock:
+            if table_name not in self.tables:
+                raise google.api_core.exceptions.NotFound(table_name)
+            return self.tables[table_name]
+
+    def update_table(self, table, fields):
+        # `table` is the object get_table handed out: its new schema is already in place
+        with self._lock:
+            self.jobs.append(("update", tuple(fields)))
+        return table
+
+    def create_table(self, table, exists_ok=False):
+        with self._lock:
+            self.tables[f"{table.project}.{table.dataset_id}.{table.table_id}"] = _FakeTable(table.schema, 0)
+        return table
+
+    def delete_table(self, table_name, not_found_ok=False):
+        with self._lock:
+            self.tables.pop(table_name, None)
+        if self.storage_write is not None:
+            self.storage_write.truncate(table_path(table_name))
+
+    def load_table_from_file(self, file_obj, table_name, job_config=None):
+        import pyarrow.parquet as pq
+
+        return self._job(table_name, pq.read_metadata(file_obj).num_rows, job_config)
+
+    def load_table_from_uri(self, source_uris, table_name, job_config=None):
+        import pyarrow.parquet as pq
+
+        num_rows = 0
+        for uri in source_uris:
+            bucket = self.buckets[uri[len("gs://"):].partition("/")[0]]
+            num_rows += pq.read_metadata(io.BytesIO(bucket.read(uri))).num_rows
+        return self._job(table_name, num_rows, job_config)
+
+    def load_table_from_dataframe(self, dataframe, table_name, job_config=None):
+        from google.cloud.bigquery import _pandas_helpers
+
+        # What the real client does before uploading.
+        if job_config is not None and job_config.schema:
+            _pandas_helpers.dataframe_to_parquet(dataframe, job_config.schema, io.BytesIO())
+        else:
+            dataframe.to_parquet(io.BytesIO())
+        return self._job(table_name, len(dataframe), job_config)
+
+    def copy_table(self, source, destination, job_config=None):
+        limited = self._rate_limited_job()
+        if limited is not None:
+            return limited
+        with self._lock:
+            if source not in self.tables:
+                return _FakeJob(google.api_core.exceptions.NotFound(source))
+            self.jobs.append(("copy", destination))
+            self.tables[destination] = _FakeTable(self.tables[source].schema, self.tables[source].num_rows)
+        if self.storage_write is not None:
+            rows = self.storage_write.rows(table_path(source))
+            self.storage_write.truncate(table_path(destination))
+            if rows is not None:
+                self.storage_write._tables[table_path(destination)] = rows.to_batches()
+        return _FakeJob()
+
+    def query(self, sql, **kwargs):
+        from google.cloud import bigquery
+
+        with self._lock:
+            self.jobs.append(("query", sql))
+            # the column casts of `gshandler.retype_statement`
+            retype = re.fullmatch(r"CREATE OR REPLACE TABLE `([^`]+)` AS SELECT \* REPLACE \((.*)\) FROM `\1`", sql)
+            if retype and retype.group(1) in self.tables:
+                casts = dict(re.findall(r"CAST\(`([^`]+)` AS (\w+)\)", retype.group(2)))
+                table = self.tables[retype.group(1)]
+                table.schema = [
+                    bigquery.SchemaField(f.name, bigquery.SqlTypeNames[casts[f.name]] if f.name in casts else f.field_type)
+                    for f in table.schema
+                ]
+        return _FakeJob()
+
+
+def install(
+    registry,
+    credential_file: str,
+    spreadsheets: dict = None,
+    bigquery_clients: dict = None,
+    storage_write_client=None,
+    staging_buckets=(),
+):
+    """Serve `{url: FakeSpreadsheet}`, `{project: FakeBigQueryClient}`, a Storage Write API stand-in
+    (`storagewrite.LocalWriteClient`) and staging buckets (`gcsstaging.LocalBucket`) from `registry`
+    without credentials."""
+    credential_file = os.path.abspath(credential_file)
+    for url, spreadsheet in (spreadsheets or {}).items():
+        registry._spreadsheets[(credential_file, url)] = spreadsheet
+        for title, worksheet in spreadsheet.worksheets.items():
+            registry._worksheets[(credential_file, url, title)] = worksheet
+    for project, client in (bigquery_clients or {}).items():
+        registry._bigquery_clients[(credential_file, project)] = client
+    if storage_write_client is not None:
+        registry._storage_write_clients[credential_file] = storage_write_client
+    for bucket in staging_buckets:
+        registry._staging_buckets[(credential_file, bucket.name)] = bucket
@@ -0,0 +1,90 @@
+"""
+Peak memory of the Sheets values -> Parquet conversion, pandas vs Arrow engine.
+
+Each engine runs in its own interpreter so that the peak resident set size
+(`ru_maxrss`) only covers that engine. The synthetic sheet is generated
+before the measurement starts; the reported figure is the extra peak memory
+of the conversion on top of the raw values.
+
+    python benchmarks/memory_conversion.py --rows 100000 --cols 20
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+PACKAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gs2gbq")
+
+
+def synthetic_values(n_rows: int, n_cols: int):
+    """Object array of strings shaped like a Sheets response, cycling through int/float/date/text columns."""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    columns = []
+    for i in range(n_cols):
+        kind = i % 4
+        if kind == 0:
+            column = rng.integers(-(10**6), 10**6, n_rows).astype(str)
+        elif kind == 1:
+            column = np.char.mod("%.3f", rng.random(n_rows) * 1000)
+        elif kind == 2:
+            column = np.char.mod("2024-01-%02d", rng.integers(1, 29, n_rows))
+        else:
+            column = np.char.add("text ", rng.integers(0, 10**9, n_rows).astype(str))
+        columns.append(column.astype(object))
+    return [f"col_{i}" for i in range(n_cols)], np.stack(columns, axis=1)
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(engine: str, n_rows: int, n_cols: int):
+    sys.path.insert(0, PACKAGE_DIRECTORY)
+    import pandas as pd
+    from google.cloud.bigquery import _pandas_helpers
+
+    from arrowconv import table_to_parquet, values_to_table
+    from schema import infer_schema
+
+    headers, values = synthetic_values(n_rows, n_cols)
+    baseline = max_rss_bytes()
+    start = time.perf_counter()
+    if engine == "pandas":
+        # What load_table_from_dataframe does with the typed frame.
+        df, schema = infer_schema(pd.DataFrame(values, columns=headers))
+        _pandas_helpers.dataframe_to_parquet(df, schema, os.devnull)
+    else:
+        table, _ = values_to_table(headers, values)
+        table_to_parquet(table)
+    elapsed = time.perf_counter() - start
+    print(f"{engine},{n_rows},{n_cols},{(max_rss_bytes() - baseline) / 2**20:.1f},{elapsed:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--engine", choices=["pandas", "arrow"], help="measure one engine in this process")
+    args = parser.parse_args()
+
+    if args.engine:
+        measure(args.engine, args.rows, args.cols)
+        return
+
+    print("engine,rows,cols,extra_peak_mib,seconds")
+    for engine in ["pandas", "arrow"]:
+        subprocess.run(
+            [sys.executable, __file__, "--engine", engine, "--rows", str(args.rows), "--cols", str(args.cols)],
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+
+if __name__ == "__main__":
+    main()
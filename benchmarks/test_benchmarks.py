@@ -0,0 +1,201 @@
+"""
+Benchmarks of the read, typing and load paths against the in-process fakes.
+
+Needs pytest-benchmark. Save a run, then compare later runs against it to
+catch regressions:
+
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+Results are stored under `.benchmarks/`. A subset runs with `-k`, e.g.
+`-k "read_values and 100000"`.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from fakes import FakeBigQueryClient, FakeSpreadsheet, Faults, column_ranges, install, synthetic_rows  # noqa: E402
+from fakes import HTTPSpreadsheet, SheetsHTTPServer  # noqa: E402
+
+from memory_conversion import synthetic_values  # noqa: E402
+
+from clients import registry  # noqa: E402
+from columnpool import ColumnPool  # noqa: E402
+from conf import settings  # noqa: E402
+from gshandler import GSHandler  # noqa: E402
+from gcsstaging import LocalBucket  # noqa: E402
+from gshandler import EXPORT_FETCH, GCS_SINK, LOAD_SINK, STORAGE_WRITE_SINK, VALUES_FETCH  # noqa: E402
+from manager import JobManager  # noqa: E402
+from snapshot import SnapshotCache  # noqa: E402
+from storagewrite import LocalWriteClient, table_path  # noqa: E402
+from transform import ARROW_ENGINE, PANDAS_ENGINE, transform_values  # noqa: E402
+
+N_COLS = 20
+SHEET = "data"
+PROJECT = "bench-project"
+
+_rows_cache = {}
+
+
+def rows(n_rows: int, n_cols: int = N_COLS) -> list:
+    if (n_rows, n_cols) not in _rows_cache:
+        _rows_cache[(n_rows, n_cols)] = synthetic_rows(n_rows, n_cols)
+    return _rows_cache[(n_rows, n_cols)]
+
+
+def spreadsheet(url: str, n_rows: int, faults: Faults = None) -> FakeSpreadsheet:
+    sheet = FakeSpreadsheet({SHEET: rows(n_rows)}, faults)
+    install(registry, settings.CREDENTIAL_FILE, spreadsheets={url: sheet})
+    return sheet
+
+
+def bigquery_client(faults: Faults = None, storage_write: LocalWriteClient = None, buckets=()) -> FakeBigQueryClient:
+    client = FakeBigQueryClient(faults, storage_write, buckets)
+    install(registry, settings.CREDENTIAL_FILE, bigquery_clients={PROJECT: client})
+    return client
+
+
+@pytest.mark.parametrize("n_ranges", [1, 4])
+@pytest.mark.parametrize("n_rows", [1_000, 10_000, 100_000])
+def test_read_values(benchmark, n_rows, n_ranges):
+    url = f"https://fake/read/{n_rows}"
+    spreadsheet(url, n_rows)
+    handler = GSHandler(url, SHEET, column_ranges(N_COLS, n_ranges))
+    _, values = benchmark(handler.read_values)
+    assert values.shape == (n_rows, N_COLS)
+
+
+@pytest.fixture(scope="module")
+def sheets_server():
+    server = SheetsHTTPServer()
+    yield server
+    server.close()
+
+
+@pytest.mark.parametrize("engine", [VALUES_FETCH, EXPORT_FETCH])
+@pytest.mark.parametrize("n_rows", [10_000, 100_000])
+def test_fetch_engine(benchmark, sheets_server, n_rows, engine):
+    """The values API (JSON) against the CSV export, both served over local HTTP."""
+    url = f"https://fake/http/{n_rows}"
+    install(registry, settings.CREDENTIAL_FILE, spreadsheets={url: HTTPSpreadsheet(sheets_server, {SHEET: rows(n_rows)})})
+    handler = GSHandler(url, SHEET, column_ranges(N_COLS, 2))
+    _, values = benchmark(handler.fetch_values, engine=engine)
+    assert values.shape == (n_rows, N_COLS)
+
+
+@pytest.mark.parametrize("compression", ["zstd", ""])
+@pytest.mark.parametrize("n_rows", [10_000, 100_000])
+def test_fetch_snapshot(benchmark, tmp_path, n_rows, compression):
+    """Reading the cells of a sheet back from its snapshot, to compare with test_read_values."""
+    url = f"https://fake/snapshot/{n_rows}"
+    spreadsheet(url, n_rows)
+    headers, values = GSHandler(url, SHEET, column_ranges(N_COLS, 1)).read_values()
+    cache = SnapshotCache(str(tmp_path), compression=compression)
+    key = SnapshotCache.key(url, SHEET, column_ranges(N_COLS, 1), "revision", 2)
+    cache.put(key, headers, values)
+    _, cached = benchmark(cache.get, key)
+    assert cached.shape == (n_rows, N_COLS)
+
+
+@pytest.mark.parametrize("engine", [PANDAS_ENGINE, ARROW_ENGINE])
+@pytest.mark.parametrize("n_rows", [1_000, 10_000, 100_000])
+def test_transform(benchmark, n_rows, engine):
+    url = f"https://fake/transform/{n_rows}"
+    spreadsheet(url, n_rows)
+    headers, values = GSHandler(url, SHEET, column_ranges(N_COLS, 1)).read_values()
+    data, schema = benchmark(transform_values, engine, headers, values)
+    assert len(schema) == N_COLS
+
+
+@pytest.mark.parametrize("processes", [1, 2, 4])
+def test_transform_wide(benchmark, processes):
+    """A 300 column sheet typed in process or with its columns spread over `processes` processes."""
+    headers, values = synthetic_values(10_000, 300)
+    pool = ColumnPool(processes, min_cells=0)
+    try:
+        # start the workers outside of the measure
+        pool.transform(ARROW_ENGINE, headers, values)
+        data, schema = benchmark(pool.transform, ARROW_ENGINE, headers, values)
+    finally:
+        pool.shutdown()
+    assert len(schema) == 300
+
+
+@pytest.mark.parametrize("sink", [LOAD_SINK, GCS_SINK, STORAGE_WRITE_SINK])
+@pytest.mark.parametrize("engine", [PANDAS_ENGINE, ARROW_ENGINE])
+@pytest.mark.parametrize("n_rows", [1_000, 10_000, 100_000])
+def test_push_data_to_big_query(benchmark, tmp_path, monkeypatch, n_rows, engine, sink):
+    """The gcs sink stages 4 MB shards in a local directory standing in for the bucket."""
+    url = f"https://fake/push/{n_rows}"
+    spreadsheet(url, n_rows)
+    handler = GSHandler(url, SHEET, column_ranges(N_COLS, 1))
+    data, schema = transform_values(engine, *handler.read_values())
+    writer = LocalWriteClient()
+    bucket = LocalBucket("bench-staging", str(tmp_path))
+    monkeypatch.setattr(settings, "GCS_STAGING_BUCKET", bucket.name)
+    monkeypatch.setattr(settings, "GCS_SHARD_BYTES", 4_000_000)
+    client = bigquery_client(storage_write=writer, buckets=[bucket])
+    install(registry, settings.CREDENTIAL_FILE, storage_write_client=writer, staging_buckets=[bucket])
+    table = f"{PROJECT}.bench.push_{engine}"
+
+    def push():
+        writer.truncate(table_path(table))
+        handler.push_data_to_big_query(data, table, schema, sink=sink)
+
+    benchmark(push)
+    if sink != STORAGE_WRITE_SINK:
+        assert client.tables[table].num_rows == n_rows
+    else:
+        assert writer.rows(table_path(table)).num_rows == n_rows
+
+
+def job_manager(tmp_path, monkeypatch, n_jobs, n_rows, faults=None, **kwargs):
+    """A JobManager reading a fake job config of `n_jobs` daily jobs, each on its own fake spreadsheet."""
+    monkeypatch.setattr(settings, "LOG_BACKEND", "jsonl")
+    monkeypatch.setattr(settings, "CONFIG_CACHE_FILE", str(tmp_path / "jobconfig.json"))
+    monkeypatch.setattr(settings, "JOB_STATE_FILE", str(tmp_path / "jobs.sqlite"))
+    header = ["gs", "table", "job_id", "range", "schedule", "job_name", "sheet", "startingrow"]
+    config = [header]
+    for i in range(n_jobs):
+        url = f"https://fake/job/{i}"
+        spreadsheet(url, n_rows, faults)
+        config.append([url, f"{PROJECT}.bench.job_{i}", str(i), column_ranges(N_COLS, 2), "d", f"job_{i}", SHEET, "2"])
+    config_url = "https://fake/config"
+    install(registry, settings.CREDENTIAL_FILE, spreadsheets={config_url: FakeSpreadsheet({"jobs": config})})
+    return JobManager(config_url, str(tmp_path / "log.jsonl"), force=True, **kwargs)
+
+
+@pytest.mark.parametrize("mode", ["threads", "async"])
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.parametrize("n_jobs", [1, 8])
+def test_jobs(benchmark, tmp_path, monkeypatch, n_jobs, concurrency, mode):
+    """Whole runs with 50 ms of latency per API call."""
+    bigquery_client(Faults(latency=0.05))
+    manager = job_manager(tmp_path, monkeypatch, n_jobs, 5_000, Faults(latency=0.05), max_workers=concurrency)
+    manager.execution_mode = mode
+    monkeypatch.setattr(settings, "PIPELINE_FETCH_WORKERS", concurrency)
+    monkeypatch.setattr(settings, "PIPELINE_LOAD_WORKERS", concurrency)
+    monkeypatch.setattr(settings, "PIPELINE_TRANSFORM_PROCESSES", min(concurrency, 2))
+    benchmark.pedantic(manager.run, rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_small_jobs_batched(benchmark, tmp_path, monkeypatch, concurrency, batched):
+    """Whole runs of 16 jobs of 200 rows whose load jobs take 0.5 s, waited on in turn or in one batch."""
+    client = bigquery_client(Faults(latency=0.01, job_seconds=0.5))
+    manager = job_manager(tmp_path, monkeypatch, 16, 200, Faults(latency=0.01), max_workers=concurrency)
+    manager.batch_load_max_bytes = 10_000_000 if batched else 0
+    manager.load_batch.poll_interval = 0.05
+    benchmark.pedantic(manager.run, rounds=3, iterations=1)
+    assert all(client.tables[f"{PROJECT}.bench.job_{i}"].num_rows == 200 for i in range(16))
+
+
+@pytest.mark.parametrize("error_every", [0, 3])
+def test_jobs_with_quota_errors(benchmark, tmp_path, monkeypatch, error_every):
+    """Whole runs where one call in `error_every` is answered with a 429."""
+    faults = Faults(latency=0.01, error_every=error_every)
+    client = bigquery_client(Faults(latency=0.01, error_every=error_every))
+    manager = job_manager(tmp_path, monkeypatch, 4, 5_000, faults, max_workers=4)
+    benchmark.pedantic(manager.run, rounds=3, iterations=1)
+    assert len(client.tables) == 4
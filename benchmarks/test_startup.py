@@ -0,0 +1,75 @@
+"""
+Startup benchmarks: each round is a fresh interpreter, as for a cron run.
+
+`test_noop_run` is a whole run of a job config with nothing scheduled today,
+against the in-process fakes; it must not load BigQuery or the conversion
+modules. Both must stay within a time budget on their fastest round.
+"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+PACKAGE = os.path.join(os.path.dirname(BENCHMARKS), "gs2gbq")
+
+# seconds, for the fastest round
+IMPORT_MANAGER_BUDGET = 0.5
+NOOP_RUN_BUDGET = 0.8
+
+# modules a run without jobs has no use for; the job config is plain rows and the fakes
+# stand in for gspread
+JOB_MODULES = ["google.cloud.bigquery", "arrowconv", "schema", "pyarrow.parquet", "pandas", "gspread", "google.oauth2"]
+
+NOOP_RUN = """
+import os, sys, tempfile
+from datetime import date
+
+from fakes import FakeSpreadsheet, install
+
+from clients import registry
+from conf import settings
+from manager import JobManager
+from scheduling import WEEKDAYS
+
+directory = tempfile.mkdtemp()
+settings.LOG_BACKEND = "jsonl"
+settings.CONFIG_CACHE_FILE = os.path.join(directory, "jobconfig.json")
+settings.JOB_STATE_FILE = os.path.join(directory, "jobs.sqlite")
+tomorrow = WEEKDAYS[(date.today().weekday() + 1) % 7]
+header = ["gs", "table", "job_id", "range", "schedule", "job_name", "sheet", "startingrow"]
+config = [header] + [[f"https://fake/{i}", f"p.d.t{i}", str(i), "A:C", tomorrow, f"job_{i}", "data", "2"] for i in range(50)]
+install(registry, settings.CREDENTIAL_FILE, spreadsheets={"https://fake/config": FakeSpreadsheet({"jobs": config})})
+JobManager("https://fake/config", os.path.join(directory, "log.jsonl")).run()
+print(",".join(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+
+def python(code: str, *args) -> str:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BENCHMARKS, PACKAGE]))
+    return subprocess.run([sys.executable, "-c", code, *args], env=env, check=True, capture_output=True, text=True).stdout
+
+
+def timed(times: list, code: str, *args) -> str:
+    """`python(code, *args)`, appending its wall time to `times`."""
+    start = time.perf_counter()
+    out = python(code, *args)
+    times.append(time.perf_counter() - start)
+    return out
+
+
+def test_import_manager(benchmark):
+    times = []
+    benchmark.pedantic(timed, args=(times, "import manager"), rounds=5, iterations=1)
+    assert min(times) < IMPORT_MANAGER_BUDGET
+
+
+def test_noop_run(benchmark):
+    times = []
+    loaded = benchmark.pedantic(timed, args=(times, NOOP_RUN, *JOB_MODULES), rounds=5, iterations=1)
+    assert loaded.strip() == ""
+    assert min(times) < NOOP_RUN_BUDGET
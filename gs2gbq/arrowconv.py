@@ -0,0 +1,183 @@
+"""
+Conversion of raw Sheets values straight to typed Arrow columns.
+
+This is the pandas-free counterpart of `schema.infer_schema`: the column
+types come from the same `classify_columns`, but each column is parsed by
+Arrow compute kernels from one string array, and the resulting table is
+serialized to a Parquet buffer for the load job. No intermediate DataFrame
+is built.
+"""
+import hashlib
+import io
+import re
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from schema import (
+    BOOL,
+    DATE,
+    DATE_FORMATS,
+    DEFAULT_SAMPLE_ROWS,
+    FLOAT64,
+    INT64,
+    NUMERIC,
+    SQL_TYPE_NAMES,
+    STRING,
+    TIMESTAMP,
+    TIMESTAMP_FORMATS,
+    classify_columns,
+    sample_rows,
+)
+
+ARROW_TYPES = {
+    INT64: pa.int64(),
+    FLOAT64: pa.float64(),
+    NUMERIC: pa.decimal128(38, 9),
+    BOOL: pa.bool_(),
+    DATE: pa.date32(),
+    TIMESTAMP: pa.timestamp("us", tz="UTC"),
+    STRING: pa.string(),
+}
+
+
+def string_array(values: np.ndarray) -> pa.Array:
+    """One column of raw cells as an Arrow string array."""
+    try:
+        return pa.array(values, type=pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Sheets cells are strings already; anything else (numbers from an
+        # unformatted read) is stringified so that every column parses the same way.
+        return pa.array([v if v is None or isinstance(v, str) else str(v) for v in values], type=pa.string())
+
+
+def _day_kept(strings: pa.Array, parsed: pa.Array, fmt: str) -> bool:
+    """Whether no date was rolled over: strptime reads 02/30 as 03/01 where pandas rejects it."""
+    fields = re.findall(r"%([a-zA-Z])", fmt)
+    if "d" not in fields:
+        return True
+    days = pc.cast(pc.list_element(pc.split_pattern_regex(strings, r"\D+"), fields.index("d")), pa.int64())
+    return pc.all(pc.equal(days, pc.day(parsed))).as_py() is not False
+
+
+def _strptime(strings: pa.Array, formats, unit: str):
+    """Parse with the first format accepting every non-null string, None if none does."""
+    for fmt in formats:
+        parsed = pc.strptime(strings, format=fmt, unit=unit, error_is_null=True)
+        if parsed.null_count == strings.null_count and _day_kept(strings, parsed, fmt):
+            return parsed
+    return None
+
+
+def convert_array(raw: pa.Array, type_name: str):
+    """Parse a string array into `type_name`. Returns None when a non-empty cell does not fit."""
+    if type_name == STRING:
+        return raw
+
+    # Empty cells become nulls for every typed column.
+    strings = pc.if_else(pc.equal(pc.utf8_trim_whitespace(raw), ""), pa.scalar(None, pa.string()), pc.utf8_trim_whitespace(raw))
+    try:
+        if type_name in (INT64, FLOAT64, NUMERIC):
+            cleaned = pc.replace_substring_regex(pc.replace_substring(strings, ",", ""), r"^\+", "")
+            return pc.cast(cleaned, ARROW_TYPES[type_name])
+        if type_name == BOOL:
+            return pc.cast(pc.utf8_lower(strings), pa.bool_())
+        if type_name == DATE:
+            parsed = _strptime(strings, DATE_FORMATS, "s")
+            return None if parsed is None else pc.cast(parsed, pa.date32())
+        if type_name == TIMESTAMP:
+            try:
+                # ISO 8601, cells with and without an offset mixed: the ones without are read as UTC
+                offset = pc.match_substring_regex(strings, r"(Z|[+-]\d{2}:?\d{2})$")
+                null = pa.scalar(None, pa.string())
+                naive = pc.cast(pc.replace_substring(pc.if_else(offset, null, strings), "T", " "), pa.timestamp("us"))
+                aware = pc.cast(pc.if_else(offset, strings, null), ARROW_TYPES[TIMESTAMP])
+                return pc.if_else(offset, aware, pc.assume_timezone(naive, "UTC"))
+            except pa.ArrowInvalid:
+                pass
+            parsed = _strptime(strings, [f for f in TIMESTAMP_FORMATS if f != "ISO8601"], "us")
+            return None if parsed is None else pc.assume_timezone(parsed, "UTC")
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None
+    raise ValueError(f"Unknown type {type_name!r}")
+
+
+def values_to_table(headers, values: np.ndarray, sample_size: int = DEFAULT_SAMPLE_ROWS, types: list = None):
+    """Type a 2-D object array of sheet cells into an Arrow table.
+
+    Returns the table and one `bigquery.SchemaField` per column. With
+    `types` no inference is done, and a ValueError is raised if a column
+    does not fit.
+    """
+    return strings_to_table(headers, [string_array(values[:, i]) for i in range(values.shape[1])], sample_size, types)
+
+
+def strings_to_table(headers, columns: list, sample_size: int = DEFAULT_SAMPLE_ROWS, types: list = None):
+    """`values_to_table` from the columns of cells already as Arrow string arrays."""
+    fixed = types is not None
+    if not fixed:
+        n_rows = len(columns[0]) if columns else 0
+        rows = pa.array(sample_rows(n_rows, sample_size))
+        sample = np.empty((len(rows), len(columns)), dtype=object)
+        for i, raw in enumerate(columns):
+            sample[:, i] = raw.take(rows).to_numpy(zero_copy_only=False)
+        types = classify_columns(sample, sample_size)
+
+    arrays = []
+    schema = []
+    for name, raw, type_name in zip(headers, columns, types):
+        converted = convert_array(raw, type_name)
+        if converted is None and fixed:
+            raise ValueError(f"Column {name} does not fit its {type_name} type")
+        if converted is None:
+            type_name, converted = STRING, raw
+        arrays.append(converted)
+        schema.append(bigquery.SchemaField(name, SQL_TYPE_NAMES[type_name]))
+
+    return pa.Table.from_arrays(arrays, names=list(headers)), schema
+
+
+BIGQUERY_TO_ARROW = {
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    "NUMERIC": pa.decimal128(38, 9),
+    "BOOLEAN": pa.bool_(),
+    "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "STRING": pa.string(),
+}
+
+
+def cast_to_schema(table: pa.Table, fields) -> pa.Table:
+    """Cast the columns of `table` to the types of the matching BigQuery `fields`; other columns are kept."""
+    types = {field.name: BIGQUERY_TO_ARROW.get(field.field_type) for field in fields}
+    arrays = []
+    for name, column in zip(table.column_names, table.columns):
+        target = types.get(name)
+        arrays.append(column if target is None or column.type == target else pc.cast(column, target))
+    return pa.Table.from_arrays(arrays, names=table.column_names)
+
+
+def table_to_parquet(table: pa.Table, compression: str = "snappy") -> io.BytesIO:
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=compression)
+    buffer.seek(0)
+    return buffer
+
+
+def hash_table(table: pa.Table) -> str:
+    """Hash of the column names and the Arrow buffers of a table."""
+    digest = hashlib.sha256("\x1f".join(table.column_names).encode())
+    for column in table.columns:
+        digest.update(str(column.type).encode())
+        for chunk in column.chunks:
+            for buffer in chunk.buffers():
+                if buffer is not None:
+                    digest.update(buffer)
+    return digest.hexdigest()
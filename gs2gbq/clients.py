@@ -0,0 +1,154 @@
+import os
+import threading
+
+import metrics
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)  # Set the desired log level
+
+SHEETS_SCOPES = (
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+)
+BIGQUERY_SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+
+
+class ClientRegistry:
+    """Process-wide cache of credentials and API clients.
+
+    Everything is keyed by the (absolute) credential file, so jobs sharing a
+    service account share one token, one HTTP session and one set of opened
+    spreadsheets. Credentials are refreshed under a lock before being handed
+    out; the authorized sessions refresh them again on their own when a token
+    expires mid-call. All methods are safe to call from several threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._credentials = {}
+        self._gspread_clients = {}
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._bigquery_clients = {}
+        self._storage_write_clients = {}
+        self._staging_buckets = {}
+
+    def _cached(self, cache: dict, key, factory):
+        # One lock per key so that opening two different spreadsheets does
+        # not serialize, while two jobs on the same one only open it once.
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault((id(cache), key), threading.Lock())
+        with key_lock:
+            value = cache.get(key)
+            if value is None:
+                with metrics.timer(metrics.AUTH):
+                    value = factory()
+                cache[key] = value
+            return value
+
+    def credentials(self, credential_file: str, scopes=SHEETS_SCOPES):
+        key = (os.path.abspath(credential_file), tuple(scopes))
+
+        def _load():
+            from google.oauth2 import service_account
+
+            logger.debug(f"Loading credentials from {key[0]}")
+            return service_account.Credentials.from_service_account_file(key[0], scopes=list(scopes))
+
+        creds = self._cached(self._credentials, key, _load)
+        if not creds.valid:
+            from google.auth.transport.requests import Request
+
+            with self._lock, metrics.timer(metrics.AUTH):
+                if not creds.valid:
+                    creds.refresh(Request())
+        return creds
+
+    def project_id(self, credential_file: str) -> str:
+        return self.credentials(credential_file, BIGQUERY_SCOPES).project_id
+
+    def gspread_client(self, credential_file: str) -> "gspread.Client":
+        import gspread
+
+        creds = self.credentials(credential_file, SHEETS_SCOPES)
+        return self._cached(self._gspread_clients, os.path.abspath(credential_file), lambda: gspread.authorize(creds))
+
+    def spreadsheet(self, credential_file: str, url: str) -> "gspread.Spreadsheet":
+        return self._cached(
+            self._spreadsheets,
+            (os.path.abspath(credential_file), url),
+            lambda: self.gspread_client(credential_file).open_by_url(url),
+        )
+
+    def worksheet(self, credential_file: str, url: str, sheet_name: str) -> "gspread.Worksheet":
+        return self._cached(
+            self._worksheets,
+            (os.path.abspath(credential_file), url, sheet_name),
+            lambda: self.spreadsheet(credential_file, url).worksheet(sheet_name),
+        )
+
+    def bigquery_client(self, credential_file: str, project: str = None) -> "bigquery.Client":
+        from google.cloud import bigquery
+
+        project = project or self.project_id(credential_file)
+        return self._cached(
+            self._bigquery_clients,
+            (os.path.abspath(credential_file), project),
+            lambda: bigquery.Client(credentials=self.credentials(credential_file, BIGQUERY_SCOPES), project=project),
+        )
+
+    def storage_write_client(self, credential_file: str):
+        """Write operations of the BigQuery Storage Write API (needs google-cloud-bigquery-storage)."""
+
+        def _open():
+            from google.cloud import bigquery_storage_v1
+
+            from storagewrite import BigQueryWriteAPI
+
+            client = bigquery_storage_v1.BigQueryWriteClient(credentials=self.credentials(credential_file, BIGQUERY_SCOPES))
+            return BigQueryWriteAPI(client)
+
+        return self._cached(self._storage_write_clients, os.path.abspath(credential_file), _open)
+
+    def staging_bucket(self, credential_file: str, bucket_name: str):
+        """Cloud Storage bucket the shards of big loads are staged in (see gcsstaging)."""
+
+        def _open():
+            from google.cloud import storage
+
+            from gcsstaging import GCSBucket
+
+            client = storage.Client(
+                credentials=self.credentials(credential_file, BIGQUERY_SCOPES), project=self.project_id(credential_file)
+            )
+            return GCSBucket(client.bucket(bucket_name))
+
+        return self._cached(self._staging_buckets, (os.path.abspath(credential_file), bucket_name), _open)
+
+    def invalidate(self, credential_file: str = None, url: str = None) -> None:
+        """Drop cached spreadsheets (e.g. after a sheet was renamed), or everything."""
+        with self._lock:
+            if url is None and credential_file is None:
+                self._credentials.clear()
+                self._gspread_clients.clear()
+                self._bigquery_clients.clear()
+                self._storage_write_clients.clear()
+                self._staging_buckets.clear()
+                self._spreadsheets.clear()
+                self._worksheets.clear()
+                return
+            for cache in (self._spreadsheets, self._worksheets):
+                for key in list(cache):
+                    if (credential_file is None or key[0] == os.path.abspath(credential_file)) and (
+                        url is None or key[1] == url
+                    ):
+                        del cache[key]
+
+
+registry = ClientRegistry()
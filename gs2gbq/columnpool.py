@@ -0,0 +1,140 @@
+"""
+Column-parallel typing of wide sheets on a process pool.
+
+The columns of a sheet are split in one group per process. Each group is
+handed to its worker as an Arrow IPC stream of string columns in shared
+memory, and the typed columns come back the same way, so neither the raw
+cells nor the typed values are pickled. Column types are decided per column
+on the same sample of rows, so the result is the one of `transform_values`.
+
+Sheets of fewer than `min_cells` cells are typed in the calling process,
+where the hand-off would cost more than it saves. The pandas engine is
+always run in process.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+from transform import ARROW_ENGINE, transform_values
+
+
+def _write_shared(table: "pa.Table") -> shared_memory.SharedMemory:
+    """Copy `table` as an Arrow IPC stream into a new shared memory block."""
+    import pyarrow as pa
+
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    shm = shared_memory.SharedMemory(create=True, size=max(sink.size(), 1))
+    # Release the Arrow view of the block before anyone closes it.
+    with pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)) as stream:
+        with pa.ipc.new_stream(stream, table.schema) as writer:
+            writer.write_table(table)
+    return shm
+
+
+def _read_shared(shm: shared_memory.SharedMemory, copy: bool = False) -> "pa.Table":
+    """The table in a shared memory block; without `copy` it is only valid while the block is open."""
+    import pyarrow as pa
+
+    buffer = pa.py_buffer(bytes(shm.buf) if copy else shm.buf)
+    return pa.ipc.open_stream(buffer).read_all()
+
+
+def _type_columns(name: str, types: list = None):
+    """Worker side: type the string columns in block `name`, returns the block of the typed ones and the schema."""
+    from arrowconv import strings_to_table
+
+    shm = shared_memory.SharedMemory(name=name)
+    strings = table = error = None
+    try:
+        strings = _read_shared(shm)
+        table, schema = strings_to_table(strings.column_names, [c.combine_chunks() for c in strings.columns], types=types)
+        out = _write_shared(table)
+        out.close()
+    except Exception as e:
+        # The frames of the traceback still view the block.
+        error = e.with_traceback(None)
+    # string columns of the result are views of the block too
+    strings = table = None
+    shm.close()
+    if error is not None:
+        raise error
+    return out.name, schema
+
+
+class ColumnPool:
+    """Type the cells of one sheet with its columns spread over `processes` processes (0 means one per CPU)."""
+
+    def __init__(self, processes: int = 0, min_cells: int = 1_000_000) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.min_cells = min_cells
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forked workers must share the tracker of this process, which unlinks their blocks.
+                resource_tracker.ensure_running()
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._pool
+
+    def in_process(self, engine: str, values) -> bool:
+        return engine != ARROW_ENGINE or self.processes < 2 or values.shape[1] < 2 or values.size < self.min_cells
+
+    def transform(self, engine: str, headers, values, types=None):
+        """Same as `transform_values(engine, headers, values, types)`."""
+        if self.in_process(engine, values):
+            return transform_values(engine, headers, values, types)
+
+        import pyarrow as pa
+
+        from arrowconv import string_array
+
+        n_cols = values.shape[1]
+        n_groups = min(self.processes, n_cols)
+        bounds = [round(i * n_cols / n_groups) for i in range(n_groups + 1)]
+        groups = list(zip(bounds, bounds[1:]))
+        executor = self._executor()
+
+        blocks, futures = [], []
+        try:
+            for start, end in groups:
+                strings = pa.Table.from_arrays(
+                    [string_array(values[:, i]) for i in range(start, end)], names=[str(h) for h in headers[start:end]]
+                )
+                blocks.append(_write_shared(strings))
+                futures.append(executor.submit(_type_columns, blocks[-1].name, None if types is None else types[start:end]))
+
+            # Collect every group before raising, so that no result block is left behind.
+            results, error = [], None
+            for future in futures:
+                try:
+                    name, group_schema = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                blocks.append(shared_memory.SharedMemory(name=name))
+                results.append((blocks[-1], group_schema))
+            if error is not None:
+                raise error
+
+            columns, schema = [], []
+            for out, group_schema in results:
+                columns.extend(_read_shared(out, copy=True).columns)
+                schema.extend(group_schema)
+        finally:
+            for future in futures:
+                future.cancel()
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+        return pa.Table.from_arrays(columns, names=list(headers)), schema
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
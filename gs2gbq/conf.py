@@ -1,3 +1,4 @@
+import logging.config
 import os
 from pydantic_settings import BaseSettings
 
@@ -24,10 +25,132 @@ class Settings(BaseSettings):
     JOB_CONFIG_FILE: str = "https://docs.google.com/spreadsheets/d/1vG1SpShp8MnAZ3RW8dqi4hEwJtSCFoe7GgB1kV6x2ms/edit?usp=sharing"
     LOG_FILE: str = "https://docs.google.com/spreadsheets/d/1QU9JJXAXLEaHgz3By90c98ga5khoJni4XXiUuY-W0rA/edit?usp=sharing"
 
+    # log sink: "sheet" appends to LOG_FILE, "file" (csv) and "jsonl" write to LOG_FILE as a local path
+    LOG_BACKEND: str = "sheet"
+    # flush buffered log rows once this many are pending, 0 means only at the end of the run
+    LOG_FLUSH_ROWS: int = 500
+    # seconds, 0 means no time based flush
+    LOG_FLUSH_INTERVAL: float = 0
+
+    # last ingested row of the incremental (append/merge) jobs
+    WATERMARK_FILE: str = os.path.join(current_directory, "state", "watermarks.json")
+
+    # revision and values hash of the last load of each job, used to skip unchanged sources
+    FINGERPRINT_FILE: str = os.path.join(current_directory, "state", "fingerprints.json")
+    FINGERPRINT_MAX_ENTRIES: int = 5000
+
+    # run id, phase, status and progress of each job's last run: jobs done today are not run
+    # again (unless forced) and interrupted streamed loads carry on where they stopped
+    JOB_STATE_FILE: str = os.path.join(current_directory, "state", "jobs.sqlite")
+    # reload every scheduled job even when its source did not change
+    FORCE_REFRESH: bool = False
+
+    # last good copy of the job config, reused for CONFIG_CACHE_TTL seconds and then
+    # only read again when the Drive revision of its spreadsheet changed
+    CONFIG_CACHE_FILE: str = os.path.join(current_directory, "state", "jobconfig.json")
+    CONFIG_CACHE_TTL: float = 300
+
+    # raw cells of each sheet read, kept as Arrow IPC files keyed by spreadsheet, sheet, range, first
+    # row and revision: a retry or rerun of the same revision reads them instead of the Sheets API.
+    # The least recently used are removed past SNAPSHOT_MAX_BYTES in total, 0 disables the cache
+    SNAPSHOT_DIR: str = os.path.join(current_directory, "state", "snapshots")
+    SNAPSHOT_MAX_BYTES: int = 1_000_000_000
+    # "zstd" or "lz4", empty for uncompressed files mapped without any copy
+    SNAPSHOT_COMPRESSION: str = "zstd"
+
+    # how the cells of a sheet are read unless its job sets a `fetch` column: "values" (Sheets
+    # values API), "export" (CSV download of the worksheet, column ranges only) or "auto", which
+    # exports worksheets of at least EXPORT_MIN_CELLS cells (0 never exports)
+    FETCH_ENGINE: str = "auto"
+    EXPORT_MIN_CELLS: int = 500_000
+
+    # "arrow" types the cells straight into an Arrow table loaded as Parquet, "pandas" goes through a DataFrame
+    CONVERSION_ENGINE: str = "arrow"
+    # sheets with more rows than this are read, typed and loaded in blocks of this many rows, 0 disables streaming
+    STREAM_CHUNK_ROWS: int = 0
+    # in the threads mode, the columns of sheets of at least TRANSFORM_MIN_CELLS cells are typed
+    # in parallel on this many processes (0 means one per CPU, 1 types every sheet in process)
+    TRANSFORM_PROCESSES: int = 0
+    TRANSFORM_MIN_CELLS: int = 1_000_000
+    # frames bigger than this (in memory) are loaded in several jobs, 0 means always one job
+    LOAD_CHUNK_BYTES: int = 100_000_000
+    # full loads go to a staging table which then replaces the table in one copy job, instead of
+    # deleting the table and loading it again: readers never see it missing or half loaded
+    STAGED_WRITES: bool = True
+
+    # load sink jobs whose typed data takes at most this many bytes in memory submit their (full or
+    # append) load job and leave it running; all of them are then waited on in one loop polling every
+    # BATCH_LOAD_POLL_INTERVAL seconds, and logged at the end of the run. 0 waits on each job in turn
+    BATCH_LOAD_MAX_BYTES: int = 0
+    BATCH_LOAD_POLL_INTERVAL: float = 1.0
+
+    # jobs with the gcs sink, and load sink tables of at least GCS_MIN_BYTES in memory (0 means only
+    # gcs sink jobs), are uploaded to this Cloud Storage bucket as Parquet shards of at most
+    # GCS_SHARD_BYTES each, GCS_UPLOAD_WORKERS at a time, and loaded in one job; empty disables it
+    GCS_STAGING_BUCKET: str = ""
+    GCS_STAGING_PREFIX: str = "gs2gbq-staging"
+    GCS_MIN_BYTES: int = 500_000_000
+    GCS_SHARD_BYTES: int = 100_000_000
+    GCS_UPLOAD_WORKERS: int = 4
+    GCS_PARQUET_COMPRESSION: str = "zstd"
+
+    # jobs with the storage_write sink: "pending" streams make all the rows of a load visible at
+    # once, "committed" ones each batch as soon as it is written
+    STORAGE_WRITE_STREAM_TYPE: str = "pending"
+    # serialized Arrow batch size, requests are limited to 10 MB
+    STORAGE_WRITE_BATCH_BYTES: int = 8_000_000
+
+    # job execution: 1 worker keeps the historical one-by-one behaviour
+    MAX_WORKERS: int = 1
+    # 0 means no per destination project limit
+    MAX_WORKERS_PER_PROJECT: int = 0
+    # seconds, 0 means no timeout
+    JOB_TIMEOUT: float = 0
+
+    # per minute quotas shared by all the calls of a run, 0 means no limit
+    SHEETS_READ_PER_MINUTE: float = 60
+    SHEETS_WRITE_PER_MINUTE: float = 60
+    # load (and merge query) jobs, BigQuery allows 5 table updates per 10 seconds
+    BIGQUERY_LOADS_PER_MINUTE: float = 30
+    # retries of a call rejected for its rate limit, on top of the backoff on other API errors
+    RATE_LIMIT_MAX_RETRIES: int = 5
+
+    # "threads" runs each job start to end on the worker pool above, "async" overlaps the
+    # read, transform and load of different jobs in a pipeline
+    EXECUTION_MODE: str = "threads"
+    PIPELINE_FETCH_WORKERS: int = 4
+    # 0 means one transform process per CPU
+    PIPELINE_TRANSFORM_PROCESSES: int = 0
+    PIPELINE_LOAD_WORKERS: int = 4
+    # jobs waiting between two stages, keeps the memory of the pipeline bounded
+    PIPELINE_QUEUE_SIZE: int = 2
+
+    # per job phase timings, row/byte counts and API calls of each run, empty to disable:
+    # appended as JSON lines, and/or written as a Prometheus text file for the node_exporter textfile collector
+    METRICS_JSONL_FILE: str = ""
+    METRICS_PROMETHEUS_FILE: str = ""
+
+    # daemon mode (--daemon): time of day jobs start on their scheduled days, "HH:MM"
+    DAEMON_RUN_TIME: str = "00:00"
+    # seconds between two reads of the job config
+    DAEMON_CONFIG_REFRESH: float = 3600
+    # seconds the daemon waits after a failed cycle (job config unreachable, log not flushed)
+    DAEMON_RETRY_DELAY: float = 60
+
     class Config:
         env_file = f"{current_directory}/.env"
 
 
 
 settings = Settings()
-print(settings.model_dump())
\ No newline at end of file
+
+_logging_configured = False
+
+
+def configure_logging(path: str = logging_ini_path) -> None:
+    """Set up logging from logging.ini, once per process; called by the entry points, not on import."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    logging.config.fileConfig(path, disable_existing_loggers=False)
+    _logging_configured = True
@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+
+import utils
+
+
+class ConfigCache:
+    """Last good copy of the job config sheets, kept in a local JSON file.
+
+    An entry younger than `ttl` seconds is used as is. An older one is
+    revalidated against the Drive revision of its spreadsheet, which costs
+    one metadata call instead of reading the whole sheet.
+    """
+
+    def __init__(self, path: str, ttl: float = 300) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, sheet: str, range: str) -> str:
+        return "|".join([url.strip(), sheet, range])
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            return self._load().get(key)
+
+    def is_fresh(self, entry: dict) -> bool:
+        return bool(entry) and time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    @staticmethod
+    def table(entry: dict):
+        """The header and the rows of a cached config."""
+        return entry["columns"], entry["rows"]
+
+    def put(self, key: str, columns: list = None, rows: list = None, revision: str = None) -> None:
+        """Store the config at `revision`; without `columns`, only mark the cached copy as just revalidated."""
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key, {})
+            if columns is not None:
+                entry["columns"] = [str(c) for c in columns]
+                entry["rows"] = [list(row) for row in rows]
+            if revision is not None:
+                entry["revision"] = revision
+            entry["fetched_at"] = time.time()
+            entries[key] = entry
+            utils.write_json_atomic(self.path, entries)
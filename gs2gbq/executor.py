@@ -0,0 +1,121 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from collections import defaultdict
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)  # Set the desired log level
+
+
+def destination_project(table_name: str) -> str:
+    """Project part of `project.dataset.table`, empty for the credential's default project."""
+    parts = table_name.strip().split(".")
+    return parts[0] if len(parts) == 3 else ""
+
+
+def destination_table(table_name: str) -> str:
+    return table_name.strip().lower()
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class _Task:
+    def __init__(self, job) -> None:
+        self.job = job
+        self.started = threading.Event()
+        self.start_time = None
+        self.future = None
+
+
+class JobExecutor:
+    """Run jobs on a bounded thread pool and hand back results in submission order.
+
+    Jobs writing to the same BigQuery table are serialized, and at most
+    `max_workers_per_project` jobs run against one destination project at a
+    time. A job exceeding `job_timeout` seconds (counted from when it actually
+    starts) is reported as timed out; the worker thread can not be killed, so
+    it keeps holding its table lock until the underlying call returns.
+    """
+
+    def __init__(
+        self,
+        func,
+        max_workers: int = 1,
+        max_workers_per_project: int = 0,
+        job_timeout: float = 0,
+        table_of=lambda job: job["table"],
+    ) -> None:
+        self.func = func
+        self.max_workers = max(1, max_workers)
+        self.max_workers_per_project = max_workers_per_project
+        self.job_timeout = job_timeout
+        self.table_of = table_of
+
+        self._lock = threading.Lock()
+        self._table_locks = defaultdict(threading.Lock)
+        self._project_slots = {}
+
+    def _table_lock(self, job):
+        with self._lock:
+            return self._table_locks[destination_table(self.table_of(job))]
+
+    def _project_slot(self, job):
+        if self.max_workers_per_project <= 0:
+            return None
+        project = destination_project(self.table_of(job))
+        with self._lock:
+            if project not in self._project_slots:
+                self._project_slots[project] = threading.BoundedSemaphore(self.max_workers_per_project)
+            return self._project_slots[project]
+
+    def _execute(self, task):
+        # Table lock first, project slot second: a job waiting on a busy table
+        # must not sit on one of its project's slots.
+        with self._table_lock(task.job):
+            slot = self._project_slot(task.job)
+            if slot is not None:
+                slot.acquire()
+            try:
+                task.start_time = time.monotonic()
+                task.started.set()
+                return self.func(task.job)
+            finally:
+                if slot is not None:
+                    slot.release()
+
+    def _result(self, task):
+        if not self.job_timeout:
+            return task.future.result()
+        while not task.started.wait(0.5):
+            if task.future.done():
+                # Failed before it could start (e.g. a malformed table name).
+                return task.future.result()
+        remaining = task.start_time + self.job_timeout - time.monotonic()
+        try:
+            return task.future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            raise JobTimeout(f"Job did not finish within {self.job_timeout} seconds")
+
+    def map(self, jobs):
+        """Yield `(job, result_or_exception)` pairs in the order of `jobs`."""
+        tasks = [_Task(job) for job in jobs]
+        if not tasks:
+            return
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gs2gbq-job")
+        try:
+            for task in tasks:
+                task.future = pool.submit(self._execute, task)
+
+            for task in tasks:
+                try:
+                    yield task.job, self._result(task)
+                except Exception as e:
+                    yield task.job, e
+        finally:
+            # Do not block on abandoned (timed out) jobs.
+            pool.shutdown(wait=not self.job_timeout, cancel_futures=True)
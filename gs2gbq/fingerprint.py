@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+import time
+
+import utils
+
+
+def hash_frame(df: "pd.DataFrame") -> str:
+    """Stable hash of the header and the values of a sheet."""
+    import pandas as pd
+
+    digest = hashlib.sha256("\x1f".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df.astype(object), index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def hash_data(data) -> str:
+    """Hash of a typed DataFrame or Arrow table."""
+    import pyarrow as pa
+
+    if isinstance(data, pa.Table):
+        from arrowconv import hash_table
+
+        return hash_table(data)
+    return hash_frame(data)
+
+
+class FingerprintCache:
+    """Source revision and values hash of the last successful load of each job.
+
+    Entries live in a local JSON file and the least recently used ones are
+    evicted once there are more than `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key: str) -> dict:
+        """Entry of `key`, marked as used so it is evicted last."""
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                utils.write_json_atomic(self.path, entries)
+            return entry
+
+    def put(self, key: str, revision: str = None, values_hash: str = None) -> None:
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key, {})
+            if revision is not None:
+                entry["revision"] = revision
+            if values_hash is not None:
+                entry["values_hash"] = values_hash
+            entry["last_used"] = time.time()
+            entries[key] = entry
+
+            if len(entries) > self.max_entries:
+                by_age = sorted(entries, key=lambda k: entries[k].get("last_used", 0))
+                for old_key in by_age[: len(entries) - self.max_entries]:
+                    del entries[old_key]
+            utils.write_json_atomic(self.path, entries)
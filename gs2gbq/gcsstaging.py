@@ -0,0 +1,109 @@
+"""
+Loading big tables through a Cloud Storage staging bucket.
+
+Instead of uploading the rows with the load job itself, the table is cut
+into Parquet shards which are compressed and uploaded to the bucket in
+parallel, and a single load job reads them all from their `gs://` URIs.
+BigQuery reads the shards in parallel too, and the table is loaded in one
+job however many shards it took. The shards are deleted once the job is
+over, whether it succeeded or not.
+
+`google-cloud-storage` is only needed by `GCSBucket`; `LocalBucket` keeps
+the objects in a local directory to run the same code offline.
+"""
+import contextvars
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class GCSBucket:
+    """The object operations of a `google.cloud.storage.Bucket`."""
+
+    def __init__(self, bucket) -> None:
+        self.bucket = bucket
+        self.name = bucket.name
+
+    def upload(self, name: str, data) -> None:
+        metrics.count_call("gcs")
+        self.bucket.blob(name).upload_from_file(data, content_type="application/octet-stream")
+
+    def delete(self, names) -> None:
+        metrics.count_call("gcs")
+        # missing objects (e.g. a shard whose upload failed) are ignored
+        self.bucket.delete_blobs(list(names), on_error=lambda blob: None)
+
+
+class LocalBucket:
+    """A bucket kept in a local directory, one file per object, for tests and benchmarks."""
+
+    def __init__(self, name: str, directory: str) -> None:
+        self.name = name
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, *name.split("/"))
+
+    def upload(self, name: str, data) -> None:
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data.read())
+
+    def delete(self, names) -> None:
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    def read(self, uri: str) -> bytes:
+        """Content of the object at `gs://<name>/...`."""
+        bucket, _, name = uri[len("gs://"):].partition("/")
+        if bucket != self.name:
+            raise FileNotFoundError(uri)
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+
+def shard_prefix(prefix: str, table_name: str) -> str:
+    """Fresh object prefix for the shards of one load of `table_name`."""
+    return "/".join(part for part in [prefix.strip("/"), table_name, uuid.uuid4().hex] if part)
+
+
+def upload_shards(
+    bucket, prefix: str, table: "pa.Table", shard_rows: int, workers: int = 4, compression: str = "zstd"
+) -> list:
+    """Write `table` as Parquet shards of `shard_rows` rows under `prefix`, `workers` at a time.
+
+    Returns the names of the objects, in row order. When an upload fails,
+    the shards already written are deleted before the error is raised.
+    """
+    from arrowconv import table_to_parquet
+
+    def upload(i, start):
+        with metrics.timer(metrics.SERIALIZATION):
+            buffer = table_to_parquet(table.slice(start, shard_rows), compression)
+        metrics.count(metrics.LOAD_BYTES, buffer.getbuffer().nbytes)
+        name = f"{prefix}/part-{i:05d}.parquet"
+        bucket.upload(name, buffer)
+        return name
+
+    starts = range(0, max(table.num_rows, 1), shard_rows)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # each shard records into the metrics of the calling job
+        futures = [
+            executor.submit(contextvars.copy_context().run, upload, i, start) for i, start in enumerate(starts)
+        ]
+        names, error = [], None
+        for future in futures:
+            try:
+                names.append(future.result())
+            except Exception as e:
+                error = error or e
+    if error is not None:
+        bucket.delete(names)
+        raise error
+    return names
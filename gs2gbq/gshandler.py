@@ -1,34 +1,230 @@
-import os
-import pandas as pd
-import gspread
-import time
-import random
+import re
+import io
 
 import backoff
 
-import google
-from google.cloud import bigquery
-from google.oauth2 import service_account
+import google.api_core.exceptions
 
+import metrics
 import utils
+from clients import registry
+from ratelimit import limiter, sheets_api_error, BIGQUERY_LOAD, SHEETS_READ, SHEETS_WRITE
+from gcsstaging import shard_prefix, upload_shards
+from storagewrite import table_path, write_table
 from conf import settings
 
-import logging.config
+import logging
 
-# Get the path of the current file
-current_file_path = os.path.abspath(__file__)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)  # Set the desired log level
 
-# Get the directory containing the current file
-current_directory = os.path.dirname(current_file_path)
+FULL_MODE = "full"
+APPEND_MODE = "append"
+MERGE_MODE = "merge"
+INGESTION_MODES = (FULL_MODE, APPEND_MODE, MERGE_MODE)
 
-# Construct the path to the logging.ini file
-logging_ini_path = os.path.join(current_directory, "logging.ini")
+# how rows reach BigQuery: load jobs, load jobs reading Parquet shards staged in Cloud
+# Storage, or the Storage Write API
+LOAD_SINK = "load"
+GCS_SINK = "gcs"
+STORAGE_WRITE_SINK = "storage_write"
+SINKS = (LOAD_SINK, GCS_SINK, STORAGE_WRITE_SINK)
 
-# Use the logging.ini path in your logging configuration
-logging.config.fileConfig(logging_ini_path)
+# how the cells are read: the Sheets values API, or a CSV export of the whole worksheet
+VALUES_FETCH = "values"
+EXPORT_FETCH = "export"
+AUTO_FETCH = "auto"
+FETCH_ENGINES = (AUTO_FETCH, VALUES_FETCH, EXPORT_FETCH)
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # Set the desired log level
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files/%s"
+EXPORT_URL = "https://docs.google.com/spreadsheets/d/%s/export"
+
+STAGING_SUFFIX = "__staging"
+
+
+def staging_table_name(table_name: str) -> str:
+    """Table a `full` load is written to before it replaces `table_name`."""
+    return f"{table_name}{STAGING_SUFFIX}"
+
+
+def data_nbytes(data) -> int:
+    """In-memory size of a DataFrame or an Arrow table."""
+    import pyarrow as pa
+
+    if isinstance(data, pa.Table):
+        return data.nbytes
+    return int(data.memory_usage(index=False, deep=True).sum())
+
+
+def rows_per_chunk(data, max_bytes: int) -> int:
+    """Number of rows per load job so that each job stays under `max_bytes` (0 = no limit).
+
+    `data` is a DataFrame or an Arrow table.
+    """
+    n_rows = data.shape[0]
+    if not max_bytes or n_rows == 0:
+        return max(n_rows, 1)
+    size = data_nbytes(data)
+    n_chunks = max(1, -(-size // max_bytes))
+    return max(1, -(-n_rows // n_chunks))
+
+
+def retry_sheets(max_tries: int):
+    """Back off and retry a Sheets call on API errors; any other error is raised at once."""
+    return backoff.on_exception(
+        backoff.expo,
+        Exception,
+        max_tries=max_tries,
+        giveup=lambda e: not sheets_api_error(e),
+        on_backoff=utils.backoff_hdlr,
+        logger="logger",
+        # the caller reports the error; an unretried one is not worth a "Giving up" line
+        giveup_log_level=logging.DEBUG,
+    )
+
+
+def missing_table(e) -> bool:
+    """Whether a BigQuery error is a missing table or dataset, which no retry will fix."""
+    return isinstance(e, google.api_core.exceptions.NotFound)
+
+
+def column_names(data) -> list:
+    import pyarrow as pa
+
+    return list(data.column_names) if isinstance(data, pa.Table) else list(data.columns)
+
+
+def merge_statement(table_name: str, source_table: str, columns, key: str) -> str:
+    """MERGE `source_table` into `table_name`, updating rows whose `key` matches and inserting the others."""
+    updates = ", ".join(f"`{c}` = S.`{c}`" for c in columns if c != key)
+    names = ", ".join(f"`{c}`" for c in columns)
+    statement = f"MERGE `{table_name}` T USING `{source_table}` S ON T.`{key}` = S.`{key}`"
+    if updates:
+        statement += f" WHEN MATCHED THEN UPDATE SET {updates}"
+    return statement + f" WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({names})"
+
+
+def retype_statement(table_name: str, types: dict) -> str:
+    """Rewrite `table_name` with the columns of `types` cast to their new type, e.g. `{"id": "STRING"}`."""
+    casts = ", ".join(f"CAST(`{c}` AS {t}) AS `{c}`" for c, t in types.items())
+    return f"CREATE OR REPLACE TABLE `{table_name}` AS SELECT * REPLACE ({casts}) FROM `{table_name}`"
+
+
+def block_widths(blocks):
+    return [max((len(row) for row in block), default=0) for block in blocks]
+
+
+def assemble_ranges(blocks, widths=None):
+    """Place the value blocks of several ranges side by side in one object array.
+
+    Each block is the ragged list of rows the Sheets API returns for a range:
+    trailing empty rows and cells are omitted. Every block is padded with None
+    to its widest row, and shorter blocks are padded with None rows, so the
+    columns of each range stay aligned whatever their length. `widths` forces
+    the number of columns given to each block; longer rows are cut.
+    """
+    import numpy as np
+
+    if widths is None:
+        widths = block_widths(blocks)
+    n_rows = max((len(block) for block in blocks), default=0)
+    values = np.full((n_rows, sum(widths)), None, dtype=object)
+
+    offset = 0
+    for block, width in zip(blocks, widths):
+        for i, row in enumerate(block):
+            row = row[:width]
+            values[i, offset:offset + len(row)] = row
+        offset += width
+    return values
+
+
+# characters of a header replaced by "_", in one pass
+_HEADER_TRANSLATION = str.maketrans(dict.fromkeys("/ :;-!?\\()$^&*+#%.'`~=", "_"))
+
+
+def sanitize_header(column):
+    return column.strip().translate(_HEADER_TRANSLATION)
+
+
+def offset_range(range: str, first_row: int, last_row: int = None) -> str:
+    """Restrict a column range such as `A:H` or `B` to rows `first_row`..`last_row` (open ended if None)."""
+    match = re.fullmatch(r"([A-Za-z]+)\d*(?::([A-Za-z]+)\d*)?", range.strip())
+    if not match:
+        raise ValueError(f"Can not apply a row offset to range {range!r}")
+    first_col = match.group(1)
+    last_col = match.group(2) or first_col
+    return f"{first_col}{first_row}:{last_col}{last_row if last_row else ''}"
+
+
+def column_index(letters: str) -> int:
+    """0-based index of a column given by its letters."""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def column_span(range: str = None):
+    """`(first, last)` column indices of a column range such as `A:H` (`last` None for the whole sheet).
+
+    None when the range also bounds the rows, e.g. `A2:H100`.
+    """
+    if not range:
+        return 0, None
+    match = re.fullmatch(r"([A-Za-z]+)(?::([A-Za-z]+))?", range.strip())
+    if not match:
+        return None
+    return column_index(match.group(1)), column_index(match.group(2) or match.group(1))
+
+
+def csv_to_grid(content: bytes) -> "np.ndarray":
+    """Parse a worksheet exported as CSV into a 2-D object array of strings, with pyarrow's threaded reader."""
+    import codecs
+    import csv
+
+    import numpy as np
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    if not content:
+        return np.empty((0, 0), dtype=object)
+    # Every exported row has as many fields as the first one.
+    n_cols = len(next(csv.reader(codecs.iterdecode(io.BytesIO(content), "utf-8"))))
+    names = [f"f{i}" for i in range(n_cols)]
+    table = pa_csv.read_csv(
+        io.BytesIO(content),
+        read_options=pa_csv.ReadOptions(column_names=names, use_threads=True),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in names}, strings_can_be_null=False, quoted_strings_can_be_null=False
+        ),
+    )
+    grid = np.empty(table.shape, dtype=object)
+    for i, column in enumerate(table.columns):
+        grid[:, i] = column.to_numpy(zero_copy_only=False)
+    return grid
+
+
+def select_ranges(grid: "np.ndarray", spans) -> "np.ndarray":
+    """The cells of the column `spans` of an exported grid, laid out as `assemble_ranges` lays out API blocks.
+
+    The API leaves out the trailing empty cells of each row of a range,
+    which come back as None, and the trailing empty rows of the ranges.
+    """
+    import numpy as np
+
+    blocks = []
+    for first, last in spans:
+        block = grid[:, first:None if last is None else last + 1].copy()
+        empty = block == ""
+        trailing = np.logical_and.accumulate(empty[:, ::-1], axis=1)[:, ::-1]
+        block[trailing] = None
+        width = int((~trailing).any(axis=0).nonzero()[0].max(initial=-1)) + 1
+        blocks.append(block[:, :width])
+    values = np.concatenate(blocks, axis=1) if blocks else np.empty((grid.shape[0], 0), dtype=object)
+    filled = (values != None).any(axis=1).nonzero()[0]  # noqa: E711
+    return values[: int(filled.max(initial=-1)) + 1]
 
 
 class GSHandler:
@@ -38,41 +234,188 @@ def __init__(self, gs_url: str, sheet: str, ranges: str = None) -> None:
         self.sheet_ranges = [r.strip() for r in ranges.split(",")] if ranges else [None]
         self.credential_file = settings.CREDENTIAL_FILE
 
+    def _a1_range(self, range: str = None) -> str:
+        sheet = "'" + self.sheet_name.replace("'", "''") + "'"
+        if not range:
+            return sheet
+        if ":" not in range:
+            range = f"{range}:{range}"
+        return f"{sheet}!{range}"
+
+    def read_data(self, starting_row: str=2, from_row: int = None):
+        """Read the configured ranges into a DataFrame of raw cells, see `read_values`."""
+        import pandas as pd
+
+        headers, values = self.read_values(starting_row, from_row)
+        return pd.DataFrame(values, columns=headers)
+
     @utils.timing_decorator
     @utils.log_execution
-    @backoff.on_exception(backoff.expo, gspread.exceptions.APIError, max_tries=8, on_backoff=utils.backoff_hdlr, logger='logger')
-    def read_data(self, starting_row: str=2):
-        def _helper(column):
-            column = column.strip()
-            for c in ["/", " ", ":", ";", "-", "!", "?", "\\", "(", ")", "$", "^", "&", "*", "+", "#", "%", ".","'", "`", "~", "="]:
-                column = column.replace(c, "_")
-            return column
-
-        gc = gspread.service_account(filename=self.credential_file)
-        sh = gc.open_by_url(self.url)
-                
-        df = pd.DataFrame()
-        for range in self.sheet_ranges:            
-            if ":" not in range:
-                range = f"{range}:{range}"
-            # data = get_worksheet_data(sh, self.sheet_name, range)         
-            data = sh.worksheet(f"{self.sheet_name}").get(range)  
-            # data = sh.worksheet(f"{self.sheet_name}").get(range, value_render_option='UNFORMATTED_VALUE')
-            df = pd.concat([df, pd.DataFrame(data)], axis=1)
-        
-        headers = df.iloc[0]
-        df = df[starting_row-1:]
-        df.columns = [_helper(h) for h in headers]
-
-        return df
+    @retry_sheets(max_tries=8)
+    @limiter.limited(SHEETS_READ)
+    def read_values(self, starting_row: str=2, from_row: int = None):
+        """Read the configured ranges, using row 1 as header.
+
+        With `from_row`, only the header row and the rows from `from_row` on
+        are requested from the API (incremental reads); otherwise the whole
+        ranges are fetched and the rows before `starting_row` dropped.
+
+        Returns the sanitized headers and a 2-D object array of the cells.
+        """
+        sh = registry.spreadsheet(self.credential_file, self.url)
+        with metrics.timer(metrics.FETCH):
+            if from_row is None:
+                response = sh.values_batch_get([self._a1_range(range) for range in self.sheet_ranges])
+                values = assemble_ranges([vr.get("values", []) for vr in response.get("valueRanges", [])])
+                headers = values[0]
+                values = values[starting_row-1:]
+            else:
+                header_ranges = [self._a1_range(offset_range(range, 1, 1)) for range in self.sheet_ranges]
+                data_ranges = [self._a1_range(offset_range(range, from_row)) for range in self.sheet_ranges]
+                response = sh.values_batch_get(header_ranges + data_ranges)
+                blocks = [vr.get("values", []) for vr in response.get("valueRanges", [])]
+                n = len(self.sheet_ranges)
+                widths = [max(w) for w in zip(block_widths(blocks[:n]), block_widths(blocks[n:]))]
+                headers = assemble_ranges(blocks[:n], widths)[0]
+                values = assemble_ranges(blocks[n:], widths)
+
+        with metrics.timer(metrics.HEADER):
+            headers = [sanitize_header(h) for h in headers]
+        return headers, values
+
+    @retry_sheets(max_tries=8)
+    @limiter.limited(SHEETS_READ)
+    def _batch_get(self, ranges):
+        sh = registry.spreadsheet(self.credential_file, self.url)
+        with metrics.timer(metrics.FETCH):
+            response = sh.values_batch_get([self._a1_range(range) for range in ranges])
+        return [vr.get("values", []) for vr in response.get("valueRanges", [])]
+
+    @retry_sheets(max_tries=8)
+    @limiter.limited(SHEETS_READ)
+    def sheet_properties(self) -> dict:
+        """Id and grid size of the worksheet, fetched fresh on every call."""
+        sh = registry.spreadsheet(self.credential_file, self.url)
+        with metrics.timer(metrics.METADATA):
+            metadata = sh.fetch_sheet_metadata(
+                params={"fields": "sheets.properties(title,sheetId,gridProperties(rowCount,columnCount))"}
+            )
+        for sheet in metadata.get("sheets", []):
+            if sheet["properties"]["title"] == self.sheet_name:
+                return sheet["properties"]
+        import gspread
+
+        raise gspread.exceptions.WorksheetNotFound(self.sheet_name)
+
+    def row_count(self) -> int:
+        """Number of rows of the worksheet grid, fetched fresh on every call."""
+        return self.sheet_properties()["gridProperties"]["rowCount"]
 
+    def exportable(self) -> bool:
+        """Whether the configured ranges can be cut out of a CSV export: columns only, no row bounds."""
+        return all(column_span(range) is not None for range in self.sheet_ranges)
+
+    def fetch_values(self, starting_row: int = 2, from_row: int = None, engine: str = AUTO_FETCH):
+        """`read_values` or `export_values`; `auto` exports sheets of at least EXPORT_MIN_CELLS cells."""
+        properties = None
+        if engine == AUTO_FETCH:
+            engine = VALUES_FETCH
+            if settings.EXPORT_MIN_CELLS and self.exportable():
+                properties = self.sheet_properties()
+                grid = properties["gridProperties"]
+                if grid["rowCount"] * grid.get("columnCount", 0) >= settings.EXPORT_MIN_CELLS:
+                    engine = EXPORT_FETCH
+        elif engine == EXPORT_FETCH and not self.exportable():
+            logging.warning(f"Can not export ranges {self.sheet_ranges} of {self.url}, reading them from the values API")
+            engine = VALUES_FETCH
+        if engine == EXPORT_FETCH:
+            return self.export_values(starting_row, from_row, gid=properties and properties["sheetId"])
+        return self.read_values(starting_row, from_row)
+
+    @utils.timing_decorator
     @utils.log_execution
-    @backoff.on_exception(backoff.expo, gspread.exceptions.APIError, max_tries=9, on_backoff=utils.backoff_hdlr, logger="logger")
+    @retry_sheets(max_tries=8)
+    @limiter.limited(SHEETS_READ)
+    def export_values(self, starting_row: int = 2, from_row: int = None, gid: int = None):
+        """Same as `read_values`, from the worksheet downloaded as CSV in one request.
+
+        The export holds every cell as displayed, like the values API, but
+        without a JSON string per cell; the ranges are cut out of it here.
+        The whole worksheet is downloaded even with `from_row`. `gid` is the
+        id of the worksheet, looked up when not given.
+        """
+        import numpy as np
+
+        if gid is None:
+            gid = self.sheet_properties()["sheetId"]
+        sh = registry.spreadsheet(self.credential_file, self.url)
+        with metrics.timer(metrics.FETCH):
+            response = sh.client.request("get", EXPORT_URL % sh.id, params={"format": "csv", "gid": gid})
+            grid = csv_to_grid(response.content)
+            if from_row is not None:
+                grid = np.concatenate([grid[:1], grid[from_row - 1:]])
+                starting_row = 2
+            values = select_ranges(grid, [column_span(range) for range in self.sheet_ranges])
+            headers = values[0]
+            values = values[starting_row-1:]
+
+        with metrics.timer(metrics.HEADER):
+            headers = [sanitize_header(h) for h in headers]
+        return headers, values
+
+    def iter_values(self, starting_row: int = 2, chunk_rows: int = 5000):
+        """Page through the configured ranges in blocks of `chunk_rows` rows.
+
+        Yields `(headers, values, first_row)` for every block holding data,
+        `first_row` being the sheet row of `values[0]`. Only one block is in
+        memory at a time; the header is fetched with the first block.
+        Trailing empty rows of a block are not returned by the API, so they
+        are dropped.
+        """
+        n_grid_rows = self.row_count()
+        n = len(self.sheet_ranges)
+        headers, widths = None, None
+        for first_row in range(starting_row, n_grid_rows + 1, chunk_rows):
+            last_row = min(first_row + chunk_rows - 1, n_grid_rows)
+            ranges = [offset_range(range, first_row, last_row) for range in self.sheet_ranges]
+            if headers is None:
+                blocks = self._batch_get([offset_range(range, 1, 1) for range in self.sheet_ranges] + ranges)
+                widths = [max(w) for w in zip(block_widths(blocks[:n]), block_widths(blocks[n:]))]
+                headers = [sanitize_header(h) for h in assemble_ranges(blocks[:n], widths)[0]]
+                blocks = blocks[n:]
+            else:
+                blocks = self._batch_get(ranges)
+            values = assemble_ranges(blocks, widths)
+            if values.shape[0]:
+                yield headers, values, first_row
+
+    @retry_sheets(max_tries=8)
+    def revision(self) -> str:
+        """Drive `modifiedTime` and `version` of the spreadsheet, fetched fresh on every call."""
+        sh = registry.spreadsheet(self.credential_file, self.url)
+        metrics.count_call("drive")
+        with metrics.timer(metrics.METADATA):
+            response = sh.client.request(
+                "get",
+                DRIVE_FILES_URL % sh.id,
+                params={"fields": "modifiedTime,version", "supportsAllDrives": True},
+            )
+        metadata = response.json()
+        return f"{metadata.get('modifiedTime')}/{metadata.get('version')}"
+
+    @utils.log_execution
+    @retry_sheets(max_tries=9)
+    @limiter.limited(SHEETS_WRITE)
     def write(self, data=None):
-        gc = gspread.service_account(filename=self.credential_file)   
-        sh = gc.open_by_url(self.url)
-        ws = sh.worksheet(f"{self.sheet_name}")
+        ws = registry.worksheet(self.credential_file, self.url, f"{self.sheet_name}")
         ws.append_row(data)
+
+    @utils.log_execution
+    @retry_sheets(max_tries=9)
+    @limiter.limited(SHEETS_WRITE)
+    def write_rows(self, rows):
+        ws = registry.worksheet(self.credential_file, self.url, f"{self.sheet_name}")
+        ws.append_rows(rows)
             
     @utils.timing_decorator
     @utils.log_execution
@@ -80,62 +423,376 @@ def write(self, data=None):
         backoff.expo,
         google.api_core.exceptions.GoogleAPICallError,
         max_tries=8,
+        giveup=missing_table,
         on_backoff=utils.backoff_hdlr,
         logger="logger"
     )
-    def push_data_to_big_query(self, sheet_df: pd.DataFrame, table_name: str, schema=None):
+    def push_data_to_big_query(
+        self,
+        sheet_df,
+        table_name: str,
+        schema=None,
+        mode: str = FULL_MODE,
+        key: str = None,
+        sink: str = LOAD_SINK,
+        staged: bool = None,
+    ):
         """
 
         Parameters
         ----------
         sheet_df
+            A DataFrame, or an Arrow table which is sent as Parquet as is.
         table_name
         schema
+        mode
+            `full` replaces the table, `append` adds the rows to it and
+            `merge` upserts them on the `key` column.
+        key
+            Column used to match rows in `merge` mode.
+        sink
+            `load` runs load jobs, `gcs` one load job reading the rows from
+            Parquet shards staged in GCS_STAGING_BUCKET (which `load` also
+            does for tables of GCS_MIN_BYTES or more), `storage_write` appends
+            the rows through the Storage Write API (`full` and `append` modes
+            only).
+        staged
+            Write a `full` load to a staging table first and replace the table
+            with it in one copy job, so that it is never missing or half
+            loaded. Defaults to the STAGED_WRITES setting.
 
         Returns
         -------
 
         """
-        credentials = service_account.Credentials.from_service_account_file(
-            self.credential_file,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        if len(table_name.split(".")) == 3:
-            project_id, dataset, table_name = table_name.split(".")
-        else:
-            project_id = credentials.project_id
-            dataset, table_name = table_name.split(".")
+        if mode not in INGESTION_MODES:
+            raise ValueError(f"Unknown ingestion mode {mode!r}, expected one of {', '.join(INGESTION_MODES)}")
+        if mode == MERGE_MODE and not key:
+            raise ValueError("The merge mode needs a key column")
+        if sink not in SINKS:
+            raise ValueError(f"Unknown sink {sink!r}, expected one of {', '.join(SINKS)}")
+        if sink == STORAGE_WRITE_SINK and mode == MERGE_MODE:
+            raise ValueError("The merge mode needs load jobs, it can not use the storage_write sink")
+        if sink == GCS_SINK and not settings.GCS_STAGING_BUCKET:
+            raise ValueError("The gcs sink needs a GCS_STAGING_BUCKET")
+        if staged is None:
+            staged = settings.STAGED_WRITES
+        import pyarrow as pa
+        from google.cloud import bigquery
+
+        from arrowconv import cast_to_schema
+
+        client, table_name = self._bigquery_table(table_name)
+
+        try:
+            table = client.get_table(table_name)
+        except google.api_core.exceptions.NotFound:
+            table = None
+        table_exists = table is not None
+
+        if sink == STORAGE_WRITE_SINK:
+            if mode != FULL_MODE and table_exists:
+                table = self._add_new_columns(client, table, table_name, sheet_df, schema)
+            self._write_rows(client, sheet_df, table_name, table, schema, mode, staged)
+            logging.info("Job finished.")
+            return
+
+        if mode == MERGE_MODE and table_exists:
+            # Appends add new columns with ALLOW_FIELD_ADDITION; the merge delta has the table's columns only.
+            table = self._add_new_columns(client, table, table_name, sheet_df, schema)
+        if mode != FULL_MODE and table_exists:
+            # Use the types of the existing table, so the delta can not
+            # disagree with what was loaded before.
+            schema = None
+            if isinstance(sheet_df, pa.Table):
+                sheet_df = cast_to_schema(sheet_df, table.schema)
 
-        client = bigquery.Client(
-            credentials=credentials, project=project_id
-        )
         # job_config = bigquery.LoadJobConfig()
         job_config = bigquery.LoadJobConfig(
-            # Specify a (partial) schema. All columns are always written to the
-            # table. The schema is used to assist in data type definitions.
+            # Specify the schema. All columns are always written to the table.
+            # Without one, BigQuery detects the types itself.
             schema=schema
         )
                 
-        job_config.autodetect = True
+        job_config.autodetect = not schema
         job_config.schema_update_options = [
             bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION
         ]
-        table_name = f"{project_id}.{dataset}.{table_name}"
-        # Delete existing table and re-create. Idiot approach!
-        try:
-            client.delete_table(table_name)
-        except Exception as e:
-            # Silently delete table if exist
-            pass        
-
-        start =  0
-        offset = 1000
-        while start < sheet_df.shape[0]:
-            load_job = client.load_table_from_dataframe(
-                sheet_df.iloc[start:start+offset,:], table_name, job_config=job_config
-            )        
-            load_job.result()
-            start = start + offset
-            time.sleep(5)
+
+        if (mode == FULL_MODE or not table_exists) and staged:
+            staging_table = staging_table_name(table_name)
+            client.delete_table(staging_table, not_found_ok=True)
+            try:
+                if sheet_df.shape[0]:
+                    self._load(client, sheet_df, staging_table, job_config, sink)
+                else:
+                    # No load job for a header-only sheet: the table is replaced by an empty one.
+                    empty_schema = schema or [bigquery.SchemaField(name, "STRING") for name in column_names(sheet_df)]
+                    client.create_table(bigquery.Table(staging_table, schema=empty_schema))
+                self._replace_table(client, staging_table, table_name)
+            finally:
+                client.delete_table(staging_table, not_found_ok=True)
+        elif mode == FULL_MODE or not table_exists:
+            # Delete existing table and re-create. Idiot approach!
+            try:
+                client.delete_table(table_name)
+            except Exception as e:
+                # Silently delete table if exist
+                pass
+            self._load(client, sheet_df, table_name, job_config, sink)
+        elif mode == APPEND_MODE:
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+            self._load(client, sheet_df, table_name, job_config, sink)
+        else:
+            staging_table = f"{table_name}__delta"
+            # The delta gets the target's column types so that MERGE compares like with like.
+            job_config.schema = [field for field in table.schema if field.name in set(column_names(sheet_df))]
+            job_config.autodetect = False
+            job_config.schema_update_options = None
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+            try:
+                if self._through_bucket(sheet_df, sink):
+                    self._load_from_bucket(client, sheet_df, staging_table, job_config)
+                else:
+                    self._run_job(self._load_job, client, sheet_df, staging_table, job_config)
+                self._run_job(client.query, merge_statement(table_name, staging_table, column_names(sheet_df), key))
+            finally:
+                client.delete_table(staging_table, not_found_ok=True)
         logging.info("Job finished.")
 
+    def _add_new_columns(self, client, table, table_name, data, schema):
+        """Add the columns of `data` the table does not have yet, typed as in `schema`; returns the table.
+
+        Merges and Storage Write appends only write the columns the table
+        has, so a column added to the sheet has to reach the table first.
+        """
+        known = {field.name for field in table.schema}
+        new = [name for name in column_names(data) if name not in known]
+        if not new:
+            return table
+        fields = {field.name: field for field in schema or []}
+        untyped = [name for name in new if name not in fields]
+        if untyped:
+            raise ValueError(f"Columns {', '.join(untyped)} are not in {table_name} and have no type to be added with")
+        table.schema = list(table.schema) + [fields[name] for name in new]
+        table = client.update_table(table, ["schema"])
+        logging.info(f"Added the columns {', '.join(new)} to {table_name}")
+        return table
+
+    @backoff.on_exception(
+        backoff.expo,
+        google.api_core.exceptions.GoogleAPICallError,
+        max_tries=8,
+        giveup=missing_table,
+        on_backoff=utils.backoff_hdlr,
+        logger="logger"
+    )
+    def submit_load(self, data, table_name: str, schema=None, mode: str = FULL_MODE):
+        """Start one load job of `data` into the table and return it without waiting for it.
+
+        For small tables batched by `loadbatch.LoadBatch`: `full` mode
+        replaces the table (rows and schema) with the job itself, which is
+        atomic, and `append` mode adds the rows with the types of the
+        existing table. The caller waits on the returned job.
+        """
+        import pyarrow as pa
+        from google.cloud import bigquery
+
+        from arrowconv import cast_to_schema
+
+        if mode not in (FULL_MODE, APPEND_MODE):
+            raise ValueError(f"Only full and append loads can be submitted without waiting, not {mode!r}")
+        client, table_name = self._bigquery_table(table_name)
+        job_config = bigquery.LoadJobConfig(schema=schema)
+        if mode == FULL_MODE:
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+        else:
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+            job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+            try:
+                table = client.get_table(table_name)
+            except google.api_core.exceptions.NotFound:
+                table = None
+            if table is not None:
+                job_config.schema = None
+                if isinstance(data, pa.Table):
+                    data = cast_to_schema(data, table.schema)
+        job_config.autodetect = not job_config.schema
+        return limiter.call(BIGQUERY_LOAD, self._load_job, client, data, table_name, job_config)
+
+    def _write_rows(self, client, data, table_name, table, schema, mode, staged):
+        """Append the rows with the Storage Write API, (re)creating the table first in `full` mode."""
+        import pandas as pd
+        import pyarrow as pa
+        from google.cloud import bigquery
+
+        from arrowconv import cast_to_schema
+
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        target = table_name
+        if mode == FULL_MODE or table is None:
+            if not schema:
+                raise ValueError("The storage_write sink needs a schema to create the table")
+            # The API only appends: replacing the table means creating it again.
+            if staged:
+                target = staging_table_name(table_name)
+            client.delete_table(target, not_found_ok=True)
+            client.create_table(bigquery.Table(target, schema=schema))
+        else:
+            schema = [field for field in table.schema if field.name in set(data.column_names)]
+        data = cast_to_schema(data, schema)
+
+        api = registry.storage_write_client(self.credential_file)
+        try:
+            n_rows = write_table(
+                api, table_path(target), data, settings.STORAGE_WRITE_STREAM_TYPE, settings.STORAGE_WRITE_BATCH_BYTES
+            )
+            if target != table_name:
+                self._replace_table(client, target, table_name)
+        finally:
+            if target != table_name:
+                client.delete_table(target, not_found_ok=True)
+        logging.info(f"Wrote {n_rows} rows to {table_name} with the Storage Write API")
+
+    def _bigquery_table(self, table_name: str):
+        """The client of the table's project and its `project.dataset.table` name."""
+        if len(table_name.split(".")) == 3:
+            project_id, dataset, table_name = table_name.split(".")
+        else:
+            project_id = registry.project_id(self.credential_file)
+            dataset, table_name = table_name.split(".")
+        return registry.bigquery_client(self.credential_file, project_id), f"{project_id}.{dataset}.{table_name}"
+
+    def replace_table(self, source: str, table_name: str) -> None:
+        """Replace `table_name` (data and schema) with `source` in one copy job."""
+        client, source = self._bigquery_table(source)
+        _, table_name = self._bigquery_table(table_name)
+        self._replace_table(client, source, table_name)
+
+    def table_schema(self, table_name: str):
+        """Schema of the table, None if it does not exist."""
+        client, table_name = self._bigquery_table(table_name)
+        try:
+            return client.get_table(table_name).schema
+        except google.api_core.exceptions.NotFound:
+            return None
+
+    def retype_columns(self, table_name: str, types: dict) -> None:
+        """Cast the columns of `types` (name to BigQuery type) to their new type in the table, in one query job."""
+        client, table_name = self._bigquery_table(table_name)
+        self._run_job(client.query, retype_statement(table_name, types))
+        logging.info(f"Retyped the columns {types} of {table_name}")
+
+    def drop_table(self, table_name: str) -> None:
+        client, table_name = self._bigquery_table(table_name)
+        client.delete_table(table_name, not_found_ok=True)
+
+    def _replace_table(self, client, source: str, table_name: str) -> None:
+        from google.cloud import bigquery
+
+        # Readers see the old table until the copy job commits, then the new one.
+        job_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        self._run_job(lambda: client.copy_table(source, table_name, job_config=job_config))
+        logging.info(f"Replaced {table_name} with {source}")
+
+    @staticmethod
+    def _through_bucket(data, sink: str) -> bool:
+        if sink == GCS_SINK:
+            return True
+        return (
+            sink == LOAD_SINK
+            and bool(settings.GCS_STAGING_BUCKET)
+            and bool(settings.GCS_MIN_BYTES)
+            and data_nbytes(data) >= settings.GCS_MIN_BYTES
+        )
+
+    def _load(self, client, data, table_name, job_config, sink=LOAD_SINK):
+        if self._through_bucket(data, sink):
+            self._load_from_bucket(client, data, table_name, job_config)
+        else:
+            self._load_in_chunks(client, data, table_name, job_config)
+
+    def _load_from_bucket(self, client, data, table_name, job_config):
+        """Stage the data in GCS_STAGING_BUCKET as Parquet shards and load them all in one job.
+
+        The shards are deleted once the job is over, successful or not.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        from google.cloud import bigquery
+
+        from arrowconv import cast_to_schema
+
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        if job_config.schema:
+            data = cast_to_schema(data, job_config.schema)
+        bucket = registry.staging_bucket(self.credential_file, settings.GCS_STAGING_BUCKET)
+        names = upload_shards(
+            bucket,
+            shard_prefix(settings.GCS_STAGING_PREFIX, table_name),
+            data,
+            rows_per_chunk(data, settings.GCS_SHARD_BYTES),
+            settings.GCS_UPLOAD_WORKERS,
+            settings.GCS_PARQUET_COMPRESSION,
+        )
+        try:
+            job_config.source_format = bigquery.SourceFormat.PARQUET
+            uris = [f"gs://{bucket.name}/{name}" for name in names]
+            self._run_job(lambda: client.load_table_from_uri(uris, table_name, job_config=job_config))
+        finally:
+            bucket.delete(names)
+        logging.info(f"Loaded {data.num_rows} rows into {table_name} from {len(names)} staged shards")
+
+    def _load_in_chunks(self, client, sheet_df, table_name, job_config):
+        """Load the frame as Parquet in as few load jobs as possible.
+
+        The whole frame goes in one job unless its in-memory size exceeds
+        LOAD_CHUNK_BYTES, in which case it is split into evenly sized row
+        chunks under that size. A chunk rejected as too large is split in two
+        and retried, without any fixed sleep between jobs.
+        """
+        import pyarrow as pa
+        from google.cloud import bigquery
+
+        job_config.source_format = bigquery.SourceFormat.PARQUET
+        n_rows = sheet_df.shape[0]
+        chunk_rows = rows_per_chunk(sheet_df, settings.LOAD_CHUNK_BYTES)
+        start = 0
+        while start < n_rows:
+            chunk = sheet_df.slice(start, chunk_rows) if isinstance(sheet_df, pa.Table) else sheet_df.iloc[start:start + chunk_rows, :]
+            try:
+                self._run_job(self._load_job, client, chunk, table_name, job_config)
+            except google.api_core.exceptions.GoogleAPICallError as e:
+                too_large = e.code == 413 or "too large" in str(e).lower()
+                if not too_large or chunk_rows == 1:
+                    raise
+                chunk_rows = max(1, chunk_rows // 2)
+                logging.info(f"Load of {chunk.shape[0]} rows into {table_name} too large, retrying with {chunk_rows} rows per job")
+                continue
+            start += chunk.shape[0]
+
+    @staticmethod
+    def _run_job(submit, *args):
+        """Submit a BigQuery job within the load job quota and wait for it."""
+        def _submit_and_wait():
+            job = submit(*args)
+            with metrics.timer(metrics.LOAD_WAIT):
+                return job.result()
+
+        return limiter.call(BIGQUERY_LOAD, _submit_and_wait)
+
+    def _load_job(self, client, data, table_name, job_config):
+        import pyarrow as pa
+        from google.cloud import bigquery
+
+        from arrowconv import table_to_parquet
+
+        if isinstance(data, pa.Table):
+            job_config.source_format = bigquery.SourceFormat.PARQUET
+            with metrics.timer(metrics.SERIALIZATION):
+                buffer = table_to_parquet(data)
+            metrics.count(metrics.LOAD_BYTES, buffer.getbuffer().nbytes)
+            return client.load_table_from_file(buffer, table_name, job_config=job_config)
+        return client.load_table_from_dataframe(data, table_name, job_config=job_config)
@@ -1,25 +1,8 @@
-import os
-
-import numpy as np
-import pandas as pd
-
 import utils
+from configcache import ConfigCache
 from gshandler import GSHandler
 
-import logging.config
-
-# Get the path of the current file
-current_file_path = os.path.abspath(__file__)
-
-# Get the directory containing the current file
-current_directory = os.path.dirname(current_file_path)
-
-# Construct the path to the logging.ini file
-logging_ini_path = os.path.join(current_directory, "logging.ini")
-
-# Use the logging.ini path in your logging configuration
-logging.config.fileConfig(logging_ini_path)
-
+import logging
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # Set the desired log level
@@ -28,7 +11,16 @@
 FAIL = False
 
 JOB_CONFIG_SHEET = "jobs"
-DEFAULT_CONFIG_RANGE = "A:H"
+
+REQUIRED_COLUMNS = ["gs", "table", "job_id", "range", "schedule", "job_name", "sheet", "startingrow"]
+# mode: full (default), append or merge; key: the column merge matches rows on;
+# sink: load (default, load jobs), gcs (load jobs from Parquet shards staged in
+# Cloud Storage) or storage_write (Storage Write API); fetch: values (Sheets
+# values API), export (CSV export) or auto (export for big sheets, FETCH_ENGINE by default)
+OPTIONAL_COLUMNS = ["mode", "key", "sink", "fetch"]
+
+# every known column, so that none of the optional ones is cut off
+DEFAULT_CONFIG_RANGE = "A:" + chr(ord("A") + len(REQUIRED_COLUMNS) + len(OPTIONAL_COLUMNS) - 1)
 
 
 class configCheck:
@@ -37,36 +29,87 @@ def __init__(self, outcome, msg) -> None:
         self.msg = msg
 
 
+class JobRow(dict):
+    """One job of the config: its cells by column, read as `row["table"]` or `row.table`."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
 class ConfigLoader:
+    """The jobs of the config sheet, as a list of `JobRow`s in `config`."""
+
     @utils.log_execution
     def __init__(
         self,
         config_file_path: str,
         sheet: str = JOB_CONFIG_SHEET,
         range: str = DEFAULT_CONFIG_RANGE,
+        cache: ConfigCache = None,
     ) -> None:
         handler = GSHandler(config_file_path, sheet, range)
-        self.config = handler.read_data()
+        if cache is None:
+            self._set(*self._read(handler))
+        else:
+            self._load_cached(handler, cache, ConfigCache.key(config_file_path, sheet, range))
+        for column in OPTIONAL_COLUMNS:
+            for row in self.config:
+                row.setdefault(column, "")
+
+    @staticmethod
+    def _read(handler):
+        headers, values = handler.read_values()
+        return list(headers), values.tolist()
+
+    def _set(self, columns, rows):
+        self.columns = list(columns)
+        self.config = [JobRow(zip(self.columns, row)) for row in rows]
+
+    def _load_cached(self, handler, cache, key):
+        """Use the cached config while it is fresh or its sheet unchanged, the sheet otherwise.
+
+        When the API can not be reached, the last good copy is used whatever its age.
+        """
+        entry = cache.get(key)
+        if cache.is_fresh(entry):
+            logging.info("Using the cached job config")
+            self._set(*cache.table(entry))
+            return
+        try:
+            revision = handler.revision()
+            if entry and entry.get("revision") == revision:
+                logging.info(f"Job config unchanged since revision {revision}, using the cached copy")
+                cache.put(key)
+                self._set(*cache.table(entry))
+                return
+            columns, rows = self._read(handler)
+        except Exception as e:
+            if not entry:
+                raise
+            logging.warning(f"Can not read the job config ({str(e)}), using the copy of revision {entry.get('revision')}")
+            self._set(*cache.table(entry))
+            return
+
+        self._set(columns, rows)
+        # Only a config passing the sanity check becomes the last good copy.
+        if self.sanity_check().outcome == PASS:
+            cache.put(key, columns, rows, revision)
 
     def sanity_check(self):
         """Check if the config file is in the right format"""
         msg = []
-        if self.config.empty:
+        if not self.config or not self.columns:
             msg.append("Can not load the config file")
             return configCheck(FAIL, msg)
 
-        if set(self.config.columns) != {
-            "gs",
-            "table",
-            "job_id",
-            "range",
-            "schedule",
-            "job_name",
-            "sheet",
-            "startingrow"
-        }:
+        columns = set(self.columns)
+        if not set(REQUIRED_COLUMNS) <= columns or not columns <= set(REQUIRED_COLUMNS + OPTIONAL_COLUMNS):
             msg.append(
                 "The config file should contain gs, table, job_id, range, schedule, job_name, sheet, startingrow as columns"
+                " and optionally mode, key, sink, fetch"
             )
             return configCheck(FAIL, msg)
 
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+# phases a job goes through, recorded as it enters them
+PREPARE = "prepare"
+FETCH = "fetch"
+LOAD = "load"
+DONE = "done"
+
+RUNNING = "RUNNING"
+# statuses of a job that needs not run again the same day
+FINISHED_STATUSES = ("SUCCESS", "UNCHANGED")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_state (
+    job_key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    status TEXT NOT NULL,
+    revision TEXT,
+    values_hash TEXT,
+    rows_loaded INTEGER NOT NULL DEFAULT 0,
+    -- sheet row the next block of an interrupted streamed load starts at
+    next_row INTEGER,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class JobStateStore:
+    """Where each job got to in its last run, kept in a local SQLite file.
+
+    One row per job: the run id and date, the phase reached, the final
+    status, the source revision and values hash, the rows loaded and, while
+    a streamed load is under way, the sheet row its next block starts at.
+    A run that dies or fails half way leaves that offset, from which the
+    next run can carry on.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql: str, *params):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    return conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+
+    def get(self, job_key: str) -> dict:
+        rows = self._execute("SELECT * FROM job_state WHERE job_key = ?", job_key)
+        return dict(rows[0]) if rows else None
+
+    def done_on(self, job_key: str, day: date = None) -> bool:
+        """Whether the job already finished successfully on `day` (today by default)."""
+        state = self.get(job_key)
+        day = (day or date.today()).isoformat()
+        return state is not None and state["run_date"] == day and state["status"] in FINISHED_STATUSES
+
+    def resume_point(self, job_key: str, revision: str):
+        """`(rows_loaded, next_row)` of an interrupted streamed load of the same source revision, else None."""
+        state = self.get(job_key)
+        if state is None or state["status"] in FINISHED_STATUSES or state["next_row"] is None:
+            return None
+        if state["revision"] != revision:
+            return None
+        return state["rows_loaded"], state["next_row"]
+
+    def interrupted(self, job_key: str) -> bool:
+        """Whether the last run of the job left a streamed load half done, whatever its revision."""
+        state = self.get(job_key)
+        return state is not None and state["status"] not in FINISHED_STATUSES and state["next_row"] is not None
+
+    def start(self, job_key: str, run_id: str, revision: str = None, keep_offset: bool = False) -> None:
+        """Record the start of a run of the job; the offset of an interrupted load is kept with `keep_offset`."""
+        offset = "" if keep_offset else ", rows_loaded = 0, next_row = NULL"
+        self._execute(
+            "INSERT INTO job_state (job_key, run_id, run_date, phase, status, revision, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (job_key) DO UPDATE SET run_id = excluded.run_id, run_date = excluded.run_date,"
+            " phase = excluded.phase, status = excluded.status, revision = excluded.revision,"
+            f" updated_at = excluded.updated_at{offset}",
+            job_key, run_id, date.today().isoformat(), PREPARE, RUNNING, revision, time.time(),
+        )
+
+    def phase(self, job_key: str, run_id: str, phase: str) -> None:
+        self._execute(
+            "UPDATE job_state SET phase = ?, updated_at = ? WHERE job_key = ? AND run_id = ?",
+            phase, time.time(), job_key, run_id,
+        )
+
+    def checkpoint(self, job_key: str, run_id: str, rows_loaded: int, next_row: int) -> None:
+        """Record a block of a streamed load as committed."""
+        self._execute(
+            "UPDATE job_state SET rows_loaded = ?, next_row = ?, updated_at = ? WHERE job_key = ? AND run_id = ?",
+            rows_loaded, next_row, time.time(), job_key, run_id,
+        )
+
+    def loaded(self, job_key: str, run_id: str, rows_loaded: int, values_hash: str = None) -> None:
+        self._execute(
+            "UPDATE job_state SET rows_loaded = ?, values_hash = ?, next_row = NULL, updated_at = ?"
+            " WHERE job_key = ? AND run_id = ?",
+            rows_loaded, values_hash, time.time(), job_key, run_id,
+        )
+
+    def finish(self, job_key: str, run_id: str, status: str) -> None:
+        """Record the outcome of the job; only the run that started it can finish it."""
+        self._execute(
+            "UPDATE job_state SET phase = ?, status = ?, updated_at = ? WHERE job_key = ? AND run_id = ?",
+            DONE, status, time.time(), job_key, run_id,
+        )
@@ -0,0 +1,120 @@
+"""
+Waiting on the load jobs of many small tables at once.
+
+A small table spends most of its load job waiting for BigQuery to pick the
+job up and commit it, not transferring rows. Instead of each worker waiting
+on its own job with `result()`, the jobs of a run are submitted as soon as
+their data is ready and left running; `LoadBatch.wait` then polls all of
+them in a single loop, so their startup latencies overlap.
+
+A job still running past the timeout is cancelled, then waited on until it
+stops: an append job may still commit its rows as it is being cancelled,
+and only its final state tells whether the rows are in the table.
+"""
+import threading
+import time
+
+from executor import JobTimeout, destination_table
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)  # Set the desired log level
+
+
+class PendingLoad:
+    """A submitted load job of `table`; `finish()` runs once it succeeded and gives the outcome."""
+
+    def __init__(self, table: str, job, finish) -> None:
+        self.table = table
+        self.job = job
+        self.finish = finish
+        self.submitted_at = time.monotonic()
+        self.cancelled_at = None
+        # result of `finish`, or the exception of the job (JobTimeout once cancelled past the timeout)
+        self.outcome = None
+
+
+class LoadBatch:
+    """Load jobs submitted without waiting, resolved together by `wait`.
+
+    Only one load per table is pending at a time: `wait_table` resolves the
+    pending load of a table before another one is submitted to it, so that
+    loads of the same table still run in order.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, timeout: float = 0, cancel_grace: float = 60) -> None:
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        # seconds a cancelled job is given to stop
+        self.cancel_grace = cancel_grace
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def add(self, pending: PendingLoad) -> PendingLoad:
+        with self._lock:
+            self._pending[destination_table(pending.table)] = pending
+        return pending
+
+    def wait_table(self, table: str) -> None:
+        with self._lock:
+            pending = self._pending.pop(destination_table(table), None)
+        if pending is not None:
+            self._poll([pending])
+
+    def wait(self) -> list:
+        """Poll the pending loads until each one is done, or cancelled past `timeout` seconds; returns them."""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        if pending:
+            logger.info(f"Waiting on {len(pending)} batched load jobs")
+            self._poll(pending)
+        return pending
+
+    def _poll(self, pending: list) -> None:
+        while pending:
+            running = []
+            for load in pending:
+                now = time.monotonic()
+                if load.job.done():
+                    self._resolve(load)
+                    continue
+                if load.cancelled_at is None and self.timeout and now - load.submitted_at > self.timeout:
+                    self._cancel(load)
+                elif load.cancelled_at is not None and now - load.cancelled_at > self.cancel_grace:
+                    load.outcome = JobTimeout(
+                        f"Load job of {load.table} still running {self.cancel_grace} seconds after it was cancelled,"
+                        " its rows may yet be committed"
+                    )
+                    continue
+                running.append(load)
+            pending = running
+            if pending:
+                time.sleep(self.poll_interval)
+
+    def _cancel(self, load: PendingLoad) -> None:
+        logger.warning(f"Load job of {load.table} did not finish within {self.timeout} seconds, cancelling it")
+        load.cancelled_at = time.monotonic()
+        try:
+            load.job.cancel()
+        except Exception as e:
+            logger.error(f"Can not cancel the load job of {load.table}: {str(e)}")
+
+    def _resolve(self, load: PendingLoad) -> None:
+        try:
+            load.job.result()
+        except Exception as e:
+            if load.cancelled_at is not None:
+                e = JobTimeout(f"Load job of {load.table} did not finish within {self.timeout} seconds and was cancelled")
+            load.outcome = e
+            return
+        # a job done before its cancellation took effect has loaded its rows
+        try:
+            load.outcome = load.finish()
+        except Exception as e:
+            load.outcome = e
@@ -0,0 +1,110 @@
+import atexit
+import csv
+import json
+import threading
+import time
+from datetime import datetime
+
+from gshandler import GSHandler
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)  # Set the desired log level
+
+SHEET_BACKEND = "sheet"
+FILE_BACKEND = "file"
+JSONL_BACKEND = "jsonl"
+
+
+class SheetSink:
+    """Append rows to a worksheet with a single `append_rows` call per flush."""
+
+    def __init__(self, gs_url: str, sheet: str) -> None:
+        self.gs_log = GSHandler(gs_url, sheet)
+
+    def write_rows(self, rows):
+        self.gs_log.write_rows(rows)
+
+
+class FileSink:
+    """Append rows to a local CSV file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def write_rows(self, rows):
+        with open(self.path, "a", newline="") as f:
+            csv.writer(f).writerows(rows)
+
+
+class JsonlSink:
+    """Append rows to a local JSON lines file, one object per row."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def write_rows(self, rows):
+        now = datetime.now().isoformat()
+        with open(self.path, "a") as f:
+            for row in rows:
+                f.write(json.dumps({"time": now, "row": row}, default=str) + "\n")
+
+
+def make_sink(backend: str, target: str, sheet: str = None):
+    if backend == SHEET_BACKEND:
+        return SheetSink(target, sheet)
+    if backend == FILE_BACKEND:
+        return FileSink(target)
+    if backend == JSONL_BACKEND:
+        return JsonlSink(target)
+    raise ValueError(f"Unknown log backend {backend!r}, expected one of sheet, file, jsonl")
+
+
+class BufferedLogSink:
+    """Collect log rows in memory and hand them to `sink` in batches.
+
+    Rows are flushed when `flush_rows` rows are pending, when the oldest
+    pending row is older than `flush_interval` seconds (checked on every
+    write, 0 disables it), on an explicit `flush()` and at interpreter exit.
+    A failed flush keeps its rows so the next flush retries them.
+    """
+
+    def __init__(self, sink, flush_rows: int = 500, flush_interval: float = 0) -> None:
+        self.sink = sink
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._first_row_time = None
+        self._lock = threading.Lock()
+        atexit.register(self._flush_at_exit)
+
+    def write_row(self, row):
+        with self._lock:
+            if not self._rows:
+                self._first_row_time = time.monotonic()
+            self._rows.append(list(row))
+            due = (self.flush_rows and len(self._rows) >= self.flush_rows) or (
+                self.flush_interval and time.monotonic() - self._first_row_time >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                self.sink.write_rows(rows)
+            except Exception:
+                self._rows = rows + self._rows
+                raise
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Could not flush {len(self._rows)} log rows: {str(e)}")
+            for row in self._rows:
+                logger.error(f"Unflushed log row: {row}")
@@ -1,136 +1,545 @@
-import os
-from datetime import datetime, date
+import argparse
+import functools
+from datetime import datetime, date, timedelta
 import time
 
-from google.cloud import bigquery
 from typing import Any
-import pandas as pd
 
+import metrics
 import utils
-from conf import settings
-from gshandler import GSHandler
+from conf import configure_logging, settings
+from gshandler import GSHandler, FULL_MODE, APPEND_MODE, MERGE_MODE, INGESTION_MODES, LOAD_SINK, SINKS
+from gshandler import FETCH_ENGINES, data_nbytes, sanitize_header, staging_table_name
+from executor import JobExecutor, JobTimeout
+from loadbatch import LoadBatch, PendingLoad
+from pipeline import AsyncPipeline
+from ratelimit import limiter
+from scheduling import ScheduleIndex, compile_schedule, parse_run_time
+from logsink import BufferedLogSink, make_sink
+from transform import transform_values
+from columnpool import ColumnPool
+from fingerprint import FingerprintCache, hash_data
+from snapshot import SnapshotCache
+from watermark import WatermarkStore
+import jobstate
+from jobstate import JobStateStore
+from configcache import ConfigCache
 from jobconfig import ConfigLoader, configCheck, PASS, FAIL
 
-import logging.config
+import logging
 
 LOG_SHEET = "Sheet1"
 
-# Get the path of the current file
-current_file_path = os.path.abspath(__file__)
-
-# Get the directory containing the current file
-current_directory = os.path.dirname(current_file_path)
-
-# Construct the path to the logging.ini file
-logging_ini_path = os.path.join(current_directory, "logging.ini")
-
-# Use the logging.ini path in your logging configuration
-logging.config.fileConfig(logging_ini_path)
+THREADS_MODE = "threads"
+ASYNC_MODE = "async"
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # Set the desired log level
 
 
 class LogWriter:
-    def __init__(self, gs_url: str) -> None:
-        self.gs_log = GSHandler(gs_url, LOG_SHEET)
+    def __init__(self, log_file: str, backend: str = None) -> None:
+        sink = make_sink(backend or settings.LOG_BACKEND, log_file, LOG_SHEET)
+        self.buffer = BufferedLogSink(sink, settings.LOG_FLUSH_ROWS, settings.LOG_FLUSH_INTERVAL)
 
-    @utils.log_execution
     def write_row(self, row_data):
-        self.gs_log.write(row_data)
+        self.buffer.write_row(row_data)
+
+    @utils.log_execution
+    def flush(self):
+        self.buffer.flush()
+
+
+class JobContext:
+    """State of one job as it moves through the prepare, fetch, transform and load phases."""
+
+    def __init__(self, row, job_metrics: metrics.JobMetrics = None) -> None:
+        self.row = row
+        self.metrics = job_metrics or metrics.JobMetrics(row)
+        self.start_time = time.time()
+        self.gs_handler = GSHandler(row["gs"], row["sheet"], row["range"])
+        self.starting_row = 2
+        try:
+            self.starting_row = int(row["startingrow"])
+        except Exception as e:
+            pass
+        self.mode = (row.get("mode") or FULL_MODE).strip().lower()
+        self.key = sanitize_header(row.get("key") or "") or None
+        self.sink = (row.get("sink") or LOAD_SINK).strip().lower()
+        self.fetch = (row.get("fetch") or settings.FETCH_ENGINE).strip().lower()
+        self.job_key = WatermarkStore.job_key(row)
+        self.run_id = None
+
+        self.fingerprint = None
+        self.revision = None
+        self.first_row = self.starting_row
+        self.from_row = None
+        # (rows loaded, next sheet row) of an interrupted streamed load to carry on
+        self.resume = None
+        self.load_mode = self.mode
+        self.stream = False
+        self.headers = None
+        self.values = None
+        # final log row when the job stops early
+        self.result = None
+
+    def log_row(self, status, *extra):
+        return [self.row["job_name"], self.row["gs"], self.row["sheet"], self.row["range"], status, *extra]
+
+
+def _recorded(method):
+    """Record the metrics of the job whose context is the first argument of `method`."""
+
+    @functools.wraps(method)
+    def wrapper(self, ctx, *args, **kwargs):
+        with metrics.recording(ctx.metrics):
+            return method(self, ctx, *args, **kwargs)
+
+    return wrapper
 
 
 class JobManager:
-    def __init__(self, job_config_url, log_file) -> None:
-        self.job_config_handler = ConfigLoader(job_config_url)
+    def __init__(
+        self,
+        job_config_url,
+        log_file,
+        max_workers: int = None,
+        max_workers_per_project: int = None,
+        job_timeout: float = None,
+        force: bool = None,
+    ) -> None:
+        self.job_config_url = job_config_url
+        self.config_cache = ConfigCache(settings.CONFIG_CACHE_FILE, settings.CONFIG_CACHE_TTL)
+        self.job_config_handler = ConfigLoader(job_config_url, cache=self.config_cache)
         self.log_handler = LogWriter(log_file)
+        self.max_workers = settings.MAX_WORKERS if max_workers is None else max_workers
+        self.max_workers_per_project = (
+            settings.MAX_WORKERS_PER_PROJECT if max_workers_per_project is None else max_workers_per_project
+        )
+        self.job_timeout = settings.JOB_TIMEOUT if job_timeout is None else job_timeout
+        self.watermarks = WatermarkStore(settings.WATERMARK_FILE)
+        self.fingerprints = FingerprintCache(settings.FINGERPRINT_FILE, settings.FINGERPRINT_MAX_ENTRIES)
+        self.job_state = JobStateStore(settings.JOB_STATE_FILE)
+        self.snapshots = SnapshotCache(settings.SNAPSHOT_DIR, settings.SNAPSHOT_MAX_BYTES, settings.SNAPSHOT_COMPRESSION)
+        self.run_id = None
+        self.force = settings.FORCE_REFRESH if force is None else force
+        self.engine = settings.CONVERSION_ENGINE
+        self.column_pool = ColumnPool(settings.TRANSFORM_PROCESSES, settings.TRANSFORM_MIN_CELLS)
+        self.stream_chunk_rows = settings.STREAM_CHUNK_ROWS
+        self.execution_mode = settings.EXECUTION_MODE
+        self.batch_load_max_bytes = settings.BATCH_LOAD_MAX_BYTES
+        self.load_batch = LoadBatch(settings.BATCH_LOAD_POLL_INTERVAL, self.job_timeout)
+        # metrics of the jobs of the current run, by id of their config row
+        self._job_metrics = {}
+
+    @staticmethod
+    def is_scheduled_today(row, current_date: date = None) -> bool:
+        return compile_schedule(row["schedule"]).matches(current_date or date.today())
+
+    def transform(self, headers, values, types=None):
+        with metrics.timer(metrics.COERCION):
+            return self.column_pool.transform(self.engine, headers, values, types)
+
+    def stream_job(
+        self,
+        gs_handler,
+        table,
+        first_row,
+        load_mode,
+        key=None,
+        watermark_key=None,
+        sink=LOAD_SINK,
+        resume=None,
+        checkpoint=None,
+    ):
+        """Read, type and load the sheet block by block, keeping one block in memory.
+
+        The first block decides the column types and is loaded with
+        `load_mode`; the following ones are appended (or merged). A block
+        with cells that do not fit those types widens the columns concerned,
+        in the rows already loaded too (see `widen_block`). With
+        `watermark_key` the watermark follows every loaded block, so that an
+        interrupted incremental job carries on from there. With STAGED_WRITES
+        the blocks of a `full` load go to a staging table which replaces the
+        table once all of them are loaded. Returns the number of rows loaded
+        and the sheet row of the last one.
+
+        `checkpoint(n_rows, next_row)` is called after each loaded block.
+        A `full` load interrupted after some blocks is carried on from
+        `resume=(n_rows, next_row)`, provided the table it was loading into is
+        still there: a staging table with checkpointed blocks is only dropped
+        once the load is done, not when it fails.
+        """
+        from schema import schema_types
+
+        staged = load_mode == FULL_MODE and settings.STAGED_WRITES
+        target = staging_table_name(table) if staged else table
+        types = None
+        n_rows, last_row = 0, first_row - 1
+        if resume and load_mode == FULL_MODE:
+            existing = gs_handler.table_schema(target)
+            if existing is not None:
+                n_rows, first_row = resume
+                last_row = first_row - 1
+                types = schema_types(existing)
+                logging.info(f"Resuming the load of {table} at row {first_row}, {n_rows} rows already loaded")
+        done = False
+        try:
+            for headers, values, block_row in gs_handler.iter_values(first_row, self.stream_chunk_rows):
+                try:
+                    data, schema = self.transform(headers, values, types)
+                except ValueError:
+                    data, schema = self.widen_block(gs_handler, target, headers, values, types)
+                types = schema_types(schema)
+                block_mode = load_mode if n_rows == 0 or load_mode == MERGE_MODE else APPEND_MODE
+                gs_handler.push_data_to_big_query(data, target, schema, mode=block_mode, key=key, sink=sink, staged=False)
+                n_rows += values.shape[0]
+                last_row = block_row + values.shape[0] - 1
+                if watermark_key and not staged:
+                    self.watermarks.set(watermark_key, last_row)
+                if checkpoint is not None:
+                    checkpoint(n_rows, last_row + 1)
+                logging.info(f"Loaded rows {block_row} to {last_row} of {table}")
+            if staged and n_rows:
+                gs_handler.replace_table(target, table)
+                if watermark_key:
+                    # only now are the rows in the table
+                    self.watermarks.set(watermark_key, last_row)
+            done = True
+        finally:
+            if staged and (done or checkpoint is None or n_rows == 0):
+                gs_handler.drop_table(target)
+        return n_rows, last_row
+
+    def widen_block(self, gs_handler, table, headers, values, types):
+        """Type a block some cells of which do not fit `types`, which the rows loaded in `table` have.
+
+        The block is typed on its own, and every column it has cells in gets
+        the common type of both (e.g. FLOAT64 for INT64 and FLOAT64 cells,
+        STRING for INT64 and text cells); the table is retyped to match.
+        """
+        from schema import common_type, schema_types
+
+        _, block_schema = self.transform(headers, values)
+        filled = ((values != None) & (values != "")).any(axis=0)  # noqa: E711
+        widened = [
+            common_type(type_name, block_type) if has_cells else type_name
+            for type_name, block_type, has_cells in zip(types, schema_types(block_schema), filled)
+        ]
+        data, schema = self.transform(headers, values, widened)
+        gs_handler.retype_columns(
+            table, {field.name: new for field, old, new in zip(schema, types, widened) if old != new}
+        )
+        return data, schema
+
+    def _metrics_of(self, row) -> metrics.JobMetrics:
+        return self._job_metrics.get(id(row)) or metrics.JobMetrics(row)
+
+    def prepare(self, row) -> JobContext:
+        """Work out what a job has to read; sets `ctx.result` when there is nothing to do."""
+        job_metrics = self._metrics_of(row)
+        with metrics.recording(job_metrics):
+            return self._prepare(row, job_metrics)
+
+    def _prepare(self, row, job_metrics) -> JobContext:
+        logging.info("====================================================================================================================")
+        logging.info(f"Starting jobid {row.job_id} to ingest {row.gs}")
+        ctx = JobContext(row, job_metrics)
+        if ctx.mode not in INGESTION_MODES or (ctx.mode == MERGE_MODE and not ctx.key):
+            raise ValueError(f"Invalid ingestion mode {ctx.mode!r} (key {ctx.key!r})")
+        if ctx.sink not in SINKS:
+            raise ValueError(f"Invalid sink {ctx.sink!r}")
+        if ctx.fetch not in FETCH_ENGINES:
+            raise ValueError(f"Invalid fetch engine {ctx.fetch!r}")
+        if not self.force and self.job_state.done_on(ctx.job_key):
+            logging.info(f"Jobid {row.job_id} already done today, skipping")
+            ctx.result = ctx.log_row("DONE")
+            return ctx
+
+        if ctx.mode != FULL_MODE:
+            # keeps appending after the watermark of a job keyed the old way, instead of from its first row
+            self.watermarks.adopt(ctx.job_key, WatermarkStore.legacy_key(row))
+        last_row = self.watermarks.get(ctx.job_key) if ctx.mode != FULL_MODE else None
+        ctx.fingerprint = None if self.force else self.fingerprints.get(ctx.job_key)
+        ctx.revision = ctx.gs_handler.revision()
+        ctx.run_id = self.run_id or datetime.now().isoformat()
+        ctx.resume = self.job_state.resume_point(ctx.job_key, ctx.revision)
+        if ctx.resume is None and settings.STAGED_WRITES and self.job_state.interrupted(ctx.job_key):
+            # The source changed since: the blocks the interrupted load staged are stale.
+            ctx.gs_handler.drop_table(staging_table_name(row["table"]))
+        self.job_state.start(ctx.job_key, ctx.run_id, ctx.revision, keep_offset=ctx.resume is not None)
+        if ctx.fingerprint and ctx.fingerprint.get("revision") == ctx.revision:
+            logging.info(f"Source of jobid {row.job_id} unchanged since revision {ctx.revision}, skipping")
+            ctx.result = ctx.log_row("UNCHANGED")
+            return ctx
+
+        if last_row is None:
+            # First run of an incremental job (or a full job): reload everything.
+            ctx.first_row, ctx.load_mode, ctx.from_row = ctx.starting_row, FULL_MODE, None
+        else:
+            ctx.first_row, ctx.load_mode = max(ctx.starting_row, last_row + 1), ctx.mode
+            ctx.from_row = ctx.first_row
+
+        ctx.stream = bool(self.stream_chunk_rows) and (
+            ctx.gs_handler.row_count() - ctx.first_row + 1 > self.stream_chunk_rows
+        )
+        return ctx
+
+    @_recorded
+    def fetch(self, ctx: JobContext):
+        """Read the raw cells of a non streamed job into the context, from its snapshot if there is one."""
+        row = ctx.row
+        self.job_state.phase(ctx.job_key, ctx.run_id, jobstate.FETCH)
+        key = SnapshotCache.key(row["gs"], row["sheet"], row["range"], ctx.revision, ctx.first_row)
+        with metrics.timer(metrics.FETCH):
+            snapshot = self.snapshots.get(key)
+        if snapshot is not None:
+            metrics.count(metrics.SNAPSHOT_HITS)
+            ctx.headers, ctx.values = snapshot
+            logging.info(f"Read {ctx.values.shape[0]} rows from the snapshot of revision {ctx.revision}")
+            return
+        ctx.headers, ctx.values = ctx.gs_handler.fetch_values(ctx.starting_row, from_row=ctx.from_row, engine=ctx.fetch)
+        try:
+            self.snapshots.put(key, ctx.headers, ctx.values)
+        except OSError as e:
+            # A full disk must not fail the job.
+            logging.error(f"Line {utils.lineno()}: can not write the snapshot of {row['gs']}: {str(e)}")
+        logging.info(f"Read {ctx.values.shape[0]} rows from row {ctx.first_row} in {ctx.load_mode} mode")
+
+    @_recorded
+    def load(self, ctx: JobContext, data=None, schema=None):
+        """Load the typed data (or stream the whole job) and record its watermark and fingerprint.
+
+        The load of a small table may be left running in `self.load_batch`:
+        the job result is then a `PendingLoad`, resolved by `run_jobs`.
+        """
+        row = ctx.row
+        self.job_state.phase(ctx.job_key, ctx.run_id, jobstate.LOAD)
+        # a load of the same table left pending by an earlier job goes first
+        self.load_batch.wait_table(row["table"])
+        if ctx.stream:
+            # Too big to hold at once: no values hash, the blocks are loaded as they come.
+            n_rows, last_row = self.stream_job(
+                ctx.gs_handler, row["table"], ctx.first_row, ctx.load_mode, ctx.key,
+                ctx.job_key if ctx.mode != FULL_MODE else None, ctx.sink,
+                resume=ctx.resume,
+                checkpoint=functools.partial(self.job_state.checkpoint, ctx.job_key, ctx.run_id),
+            )
+            values_hash = None
+        else:
+            n_rows = data.shape[0]
+            last_row = ctx.first_row + n_rows - 1
+
+            # An edit elsewhere in the spreadsheet bumps its revision; for full
+            # reloads, compare the values themselves before loading again.
+            values_hash = hash_data(data) if ctx.load_mode == FULL_MODE else None
+            if ctx.fingerprint and values_hash and ctx.fingerprint.get("values_hash") == values_hash:
+                self.fingerprints.put(ctx.job_key, ctx.revision)
+                logging.info(f"Values of jobid {row.job_id} unchanged, skipping")
+                return ctx.log_row("UNCHANGED")
+
+            if (n_rows or ctx.load_mode == FULL_MODE) and self.batched(ctx, data):
+                job = ctx.gs_handler.submit_load(data, row["table"], schema, mode=ctx.load_mode)
+                logging.info(f"Submitted the load of jobid {row.job_id} to the batch")
+                finish = functools.partial(self._finish_batched, ctx, n_rows, last_row, values_hash)
+                return self.load_batch.add(PendingLoad(row["table"], job, finish))
+            if n_rows or ctx.load_mode == FULL_MODE:
+                ctx.gs_handler.push_data_to_big_query(
+                    data, row["table"], schema, mode=ctx.load_mode, key=ctx.key, sink=ctx.sink
+                )
+        return self._loaded(ctx, n_rows, last_row, values_hash)
+
+    def batched(self, ctx: JobContext, data) -> bool:
+        """Whether the load of the job is left running and waited on with the other small ones of the run."""
+        return (
+            bool(self.batch_load_max_bytes)
+            and ctx.sink == LOAD_SINK
+            and ctx.load_mode in (FULL_MODE, APPEND_MODE)
+            and data_nbytes(data) <= self.batch_load_max_bytes
+        )
+
+    def _finish_batched(self, ctx: JobContext, n_rows, last_row, values_hash):
+        with metrics.recording(ctx.metrics):
+            return self._loaded(ctx, n_rows, last_row, values_hash)
+
+    def _loaded(self, ctx: JobContext, n_rows, last_row, values_hash):
+        """Record the watermark, fingerprint and state of a loaded job, returns its log row."""
+        row = ctx.row
+        metrics.count(metrics.ROWS, n_rows)
+        if ctx.mode != FULL_MODE:
+            self.watermarks.set(ctx.job_key, last_row)
+        self.fingerprints.put(ctx.job_key, ctx.revision, values_hash)
+        self.job_state.loaded(ctx.job_key, ctx.run_id, n_rows, values_hash)
+
+        elapsed = time.time() - ctx.start_time
+        logging.info(f"Took {elapsed} seconds to ingest {row['gs']}")
+        return ctx.log_row("SUCCESS", f"{elapsed}")
+
+    def run_job(self, row):
+        """Ingest one scheduled row and return its log row. Never raises."""
+        with metrics.recording(self._metrics_of(row)):
+            return self._run_job(row)
+
+    def _run_job(self, row):
+        try:
+            ctx = self.prepare(row)
+            if ctx.result:
+                return ctx.result
+            if ctx.stream:
+                return self.load(ctx)
+            self.fetch(ctx)
+            # Type all columns in one pass and hand BigQuery a complete schema
+            data, schema = self.transform(ctx.headers, ctx.values)
+            ctx.values = None
+            return self.load(ctx, data, schema)
+        except Exception as e:
+            logging.error(f"Line {utils.lineno()}: {str(e)}")
+            return [row["job_name"], row["gs"], row["sheet"], row["range"], "FAIL"]
+
+    def executor(self):
+        if self.execution_mode == ASYNC_MODE:
+            return AsyncPipeline(
+                self.prepare,
+                self.fetch,
+                functools.partial(transform_values, self.engine),
+                self.load,
+                fetch_workers=settings.PIPELINE_FETCH_WORKERS,
+                transform_processes=settings.PIPELINE_TRANSFORM_PROCESSES,
+                load_workers=settings.PIPELINE_LOAD_WORKERS,
+                queue_size=settings.PIPELINE_QUEUE_SIZE,
+                max_workers_per_project=self.max_workers_per_project,
+                job_timeout=self.job_timeout,
+                record_transform=lambda ctx, seconds: ctx.metrics.add_time(metrics.COERCION, seconds),
+            )
+        return JobExecutor(
+            self.run_job,
+            max_workers=self.max_workers,
+            max_workers_per_project=self.max_workers_per_project,
+            job_timeout=self.job_timeout,
+        )
 
     @utils.log_execution
     def run(self):
-        self.log_handler.write_row([""])
-        self.log_handler.write_row([f"NEW RUN on {datetime.now()}"])
-        self.log_handler.write_row([""])
+        try:
+            self._run()
+        finally:
+            self.log_handler.flush()
+            self.column_pool.shutdown()
+            for name, stats in limiter.stats().items():
+                logging.info(f"Rate limiter {name}: {stats}")
 
+    def _scheduled_jobs(self):
+        """Rows of the job config, None if it does not pass the sanity check."""
         config_check_result = self.job_config_handler.sanity_check()
         if config_check_result.outcome == FAIL:
             self.log_handler.write_row(config_check_result.msg)
+            return None
+        return list(self.job_config_handler.config)
+
+    def _run(self):
+        self.log_handler.write_row([""])
+        self.log_handler.write_row([f"NEW RUN on {datetime.now()}"])
+        self.log_handler.write_row([""])
+
+        jobs = self._scheduled_jobs()
+        if jobs is None:
             return
+        current_date = date.today()
+        self.run_jobs([row for row in jobs if self.is_scheduled_today(row, current_date)])
 
-        cfg = self.job_config_handler.config
-        for _, row in cfg.iterrows():
-            # Get the current date
-            current_date = date.today()
-
-            if not row["schedule"]:
-                # self.log_handler.write_row(
-                #         [row["gs"], row["sheet"], row["range"], "NOT SCHEDULED"]
-                #     )
-                continue
-
-            row["schedule"] = row["schedule"].strip().replace(" ", "")
-
-            scheduled_to_run_today = False
-            if row["schedule"] == "d":
-                scheduled_to_run_today = True
-            elif any(day.lower() in row["schedule"].lower().split(",") for day in ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]):
-                wd = current_date.weekday()
-                dic_mapping = {0: "Mo", 1: "Tu", 2: "We", 3: "Th", 4: "Fr", 5: "Sa", 6: "Su"}
-                if dic_mapping[wd].lower() in row["schedule"].lower().split(","):
-                    scheduled_to_run_today = True
-            elif row["schedule"] == "m" and current_date.day == 1:
-                scheduled_to_run_today = True
-            else:
-                try:
-                    days = [int(d) for d in row["schedule"].split(",")]                    
-                except Exception:
-                    days = []                
-                if current_date.day in days:  
-                    scheduled_to_run_today = True
+    def run_jobs(self, jobs):
+        run_id = self.run_id = datetime.now().isoformat()
+        self._job_metrics = {id(row): metrics.JobMetrics(row) for row in jobs}
+        executor = self.executor()
+        results = executor.map(jobs)
+        if self.batch_load_max_bytes:
+            # Batched loads are only known once every job has been through
+            # its load phase: wait on all of them before logging.
+            results = list(results)
+            pending = self.load_batch.wait()
+            if pending:
+                failed = sum(isinstance(load.outcome, Exception) for load in pending)
+                logging.info(f"{len(pending)} batched loads done, {failed} failed")
+            results = [(row, result.outcome if isinstance(result, PendingLoad) else result) for row, result in results]
+        # Results come back in config order, so the log sheet keeps one
+        # ordered record per job whatever the concurrency.
+        for row, result in results:
+            if isinstance(result, JobTimeout):
+                logging.error(f"Job {row.job_id}: {str(result)}")
+                result = [row["job_name"], row["gs"], row["sheet"], row["range"], "TIMEOUT", f"{self.job_timeout}"]
+            elif isinstance(result, Exception):
+                logging.error(f"Job {row.job_id}: {str(result)}")
+                result = [row["job_name"], row["gs"], row["sheet"], row["range"], "FAIL"]
+            self._job_metrics[id(row)].finish(result[4])
+            self.job_state.finish(WatermarkStore.job_key(row), run_id, result[4])
+            self.log_handler.write_row(result)
+        self.export_metrics(run_id, list(self._job_metrics.values()))
 
-            if not scheduled_to_run_today:
-                continue
+    def export_metrics(self, run_id, job_metrics):
+        try:
+            if settings.METRICS_JSONL_FILE:
+                metrics.write_jsonl(settings.METRICS_JSONL_FILE, run_id, job_metrics)
+            if settings.METRICS_PROMETHEUS_FILE:
+                metrics.write_prometheus(settings.METRICS_PROMETHEUS_FILE, job_metrics)
+        except Exception as e:
+            # Metrics must never fail a run.
+            logging.error(f"Line {utils.lineno()}: can not export metrics: {str(e)}")
 
-            logging.info("====================================================================================================================")
-            logging.info(f"Starting jobid {row.job_id} to ingest {row.gs}")
+    @utils.log_execution
+    def run_forever(self, run_time: str = None, config_refresh: float = None):
+        """Stay up and run each job when it is due, instead of being started by cron every day.
 
+        Jobs due today are run at start. The job config is read again every
+        `config_refresh` seconds, the schedules being compiled once per read.
+        """
+        run_time = parse_run_time(run_time or settings.DAEMON_RUN_TIME)
+        config_refresh = settings.DAEMON_CONFIG_REFRESH if config_refresh is None else config_refresh
+        # everything due up to this time has been run
+        checked_until = datetime.combine(date.today(), datetime.min.time()) - timedelta(microseconds=1)
+        index, loaded_at = None, None
+        while True:
             try:
-                start_time = time.time()
-                gs_handler = GSHandler(row["gs"], row["sheet"], row["range"])
-                starting_row = 2
-                try:
-                    starting_row = int(row["startingrow"])
-                except Exception as e:
-                    pass
-
-                df = gs_handler.read_data(starting_row)
-                # Convert numeric columns to appropriate data types
-                schema = []
-                for col in df.columns:
-                    try:
-                        # Try to convert to numeric
-                        df[col] = pd.to_numeric(df[col])
-                    except Exception:
-                        # If not numeric, try to convert to datetime
-                        try:
-                            df[col] = pd.to_date(df[col])
-                        except Exception:                            
-                            schema.append(bigquery.SchemaField( col,bigquery.enums.SqlTypeNames.STRING))
-                        
-                gs_handler.push_data_to_big_query(df, row["table"], schema)
-
-                end_time = time.time()
-                
-                self.log_handler.write_row(
-                    [row["job_name"], row["gs"], row["sheet"], row["range"], "SUCCESS", f"{end_time - start_time}"]
-                )
-                logging.info(f"Took {end_time - start_time} seconds to ingest {row['gs']}")
-            except Exception as e:                
-                logging.error(f"Line {utils.lineno()}: {str(e)}")
-                self.log_handler.write_row(
-                    [row["job_name"], row["gs"], row["sheet"], row["range"], "FAIL"]
-                )
+                if index is None or time.time() - loaded_at >= config_refresh:
+                    if loaded_at is not None:
+                        self.job_config_handler = ConfigLoader(self.job_config_url, cache=self.config_cache)
+                    loaded_at = time.time()
+                    jobs = self._scheduled_jobs()
+                    index = ScheduleIndex(jobs or [], after=checked_until + timedelta(microseconds=1), run_time=run_time)
+                    self.log_handler.flush()
+
+                next_time = index.next_time()
+                wake_at = loaded_at + config_refresh
+                if next_time is not None:
+                    wake_at = min(wake_at, next_time.timestamp())
+                if wake_at > time.time():
+                    logging.info(f"Next job due at {next_time}, sleeping until {datetime.fromtimestamp(wake_at)}")
+                    # the clock moved on since the check
+                    time.sleep(max(0, wake_at - time.time()))
+
+                now = datetime.now()
+                due = index.pop_due(now)
+                checked_until = now
+                if due:
+                    self.log_handler.write_row([""])
+                    self.log_handler.write_row([f"NEW RUN on {now}"])
+                    self.log_handler.write_row([""])
+                    self.run_jobs(due)
+                    self.log_handler.flush()
+            except Exception as e:
+                # An unreachable API must not stop the daemon: try again after a while.
+                logging.error(f"Line {utils.lineno()}: daemon cycle failed: {str(e)}")
+                time.sleep(settings.DAEMON_RETRY_DELAY)
 
 
 if __name__ == "__main__":
-    manager = JobManager(settings.JOB_CONFIG_FILE, settings.LOG_FILE)
-    manager.run()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Ingest the scheduled Google Sheets into BigQuery")
+    parser.add_argument("--force", action="store_true", help="reload jobs even when their source is unchanged")
+    parser.add_argument("--daemon", action="store_true", help="keep running and start each job when it is due")
+    args = parser.parse_args()
+
+    manager = JobManager(settings.JOB_CONFIG_FILE, settings.LOG_FILE, force=args.force or None)
+    if args.daemon:
+        manager.run_forever()
+    else:
+        manager.run()
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+Per-job metrics: time spent in each phase, row and byte counts, API calls
+and retries.
+
+The metrics of the running job are held in a context variable, set by the
+manager around each phase of a job (`recording`), so that the handler, the
+client registry and the rate limiter record into it without being handed
+anything. Outside of a job the recording calls do nothing.
+
+At the end of a run the metrics are appended to a JSON lines file and/or
+written to a Prometheus text file (for the node_exporter textfile
+collector).
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+# phases
+AUTH = "auth"
+METADATA = "metadata"
+FETCH = "fetch"
+HEADER = "header"
+COERCION = "coercion"
+SERIALIZATION = "serialization"
+LOAD_WAIT = "load_wait"
+
+# counters
+ROWS = "rows"
+LOAD_BYTES = "load_bytes"
+RATE_LIMIT_RETRIES = "rate_limit_retries"
+BACKOFFS = "backoffs"
+# sheets read from a local snapshot instead of the Sheets API
+SNAPSHOT_HITS = "snapshot_hits"
+
+_current = contextvars.ContextVar("gs2gbq_job_metrics", default=None)
+
+
+class JobMetrics:
+    def __init__(self, row=None) -> None:
+        self.job_id = str(row["job_id"]) if row is not None else ""
+        self.job_name = str(row["job_name"]) if row is not None else ""
+        self.table = str(row["table"]) if row is not None else ""
+        self.started_at = time.time()
+        self.duration = None
+        self.status = None
+        self.phases = {}
+        self.counters = {}
+        self.api_calls = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def count_call(self, api: str, n: int = 1) -> None:
+        with self._lock:
+            self.api_calls[api] = self.api_calls.get(api, 0) + n
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self.duration = time.time() - self.started_at
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "job_name": self.job_name,
+                "table": self.table,
+                "status": self.status,
+                "started_at": self.started_at,
+                "duration": self.duration,
+                "phases": dict(self.phases),
+                "counters": dict(self.counters),
+                "api_calls": dict(self.api_calls),
+            }
+
+
+@contextlib.contextmanager
+def recording(job_metrics: JobMetrics):
+    """Record into `job_metrics` within the block (in the current thread or task)."""
+    token = _current.set(job_metrics)
+    try:
+        yield job_metrics
+    finally:
+        _current.reset(token)
+
+
+def current() -> JobMetrics:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def timer(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        job_metrics = _current.get()
+        if job_metrics is not None:
+            job_metrics.add_time(phase, time.perf_counter() - start)
+
+
+def count(counter: str, n: int = 1) -> None:
+    job_metrics = _current.get()
+    if job_metrics is not None:
+        job_metrics.count(counter, n)
+
+
+def count_call(api: str, n: int = 1) -> None:
+    job_metrics = _current.get()
+    if job_metrics is not None:
+        job_metrics.count_call(api, n)
+
+
+def write_jsonl(path: str, run_id: str, jobs) -> None:
+    """Append one line per job."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as f:
+        for job_metrics in jobs:
+            f.write(json.dumps({"run_id": run_id, **job_metrics.to_dict()}, default=str) + "\n")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def prometheus_text(jobs, run_time: float = None) -> str:
+    """Gauges of the last run in the Prometheus text exposition format."""
+    samples = {
+        "gs2gbq_job_duration_seconds": ("Wall time of the job.", []),
+        "gs2gbq_job_phase_seconds": ("Time spent in each phase of the job.", []),
+        "gs2gbq_job_success": ("1 if the job succeeded, had nothing to load or was already done, 0 otherwise.", []),
+        "gs2gbq_job_rows": ("Rows loaded.", []),
+        "gs2gbq_job_load_bytes": ("Bytes of Parquet sent to BigQuery.", []),
+        "gs2gbq_job_api_calls": ("API calls, by quota.", []),
+        "gs2gbq_job_retries": ("Calls retried after a rate limit error or backed off after an API error.", []),
+    }
+    for job_metrics in jobs:
+        data = job_metrics.to_dict()
+        job = dict(job_id=data["job_id"], job_name=data["job_name"], table=data["table"])
+        samples["gs2gbq_job_duration_seconds"][1].append((_labels(**job), data["duration"] or 0))
+        samples["gs2gbq_job_success"][1].append((_labels(**job), int(data["status"] in ("SUCCESS", "UNCHANGED", "DONE"))))
+        for phase, seconds in sorted(data["phases"].items()):
+            samples["gs2gbq_job_phase_seconds"][1].append((_labels(**job, phase=phase), seconds))
+        samples["gs2gbq_job_rows"][1].append((_labels(**job), data["counters"].get(ROWS, 0)))
+        samples["gs2gbq_job_load_bytes"][1].append((_labels(**job), data["counters"].get(LOAD_BYTES, 0)))
+        for api, calls in sorted(data["api_calls"].items()):
+            samples["gs2gbq_job_api_calls"][1].append((_labels(**job, api=api), calls))
+        for kind in (RATE_LIMIT_RETRIES, BACKOFFS):
+            samples["gs2gbq_job_retries"][1].append((_labels(**job, kind=kind), data["counters"].get(kind, 0)))
+
+    lines = []
+    for name, (help_text, values) in samples.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{labels} {value}" for labels, value in values)
+    lines.append("# HELP gs2gbq_last_run_timestamp_seconds End of the last run.")
+    lines.append("# TYPE gs2gbq_last_run_timestamp_seconds gauge")
+    lines.append(f"gs2gbq_last_run_timestamp_seconds {run_time or time.time()}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str, jobs) -> None:
+    """Replace the text file atomically, as the textfile collector may read it at any time."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text(jobs))
+    os.replace(tmp_path, path)
@@ -0,0 +1,210 @@
+"""
+Asyncio pipeline overlapping the phases of different jobs.
+
+Every job goes through three stages connected by bounded queues:
+
+* fetch (thread pool): prepare the job and read its raw cells,
+* transform (process pool): type the cells,
+* load (thread pool): load the typed data into BigQuery.
+
+While a job waits on its load job, the next ones are already read and typed.
+A full queue stops the stage feeding it, so at most
+`fetch_workers + queue_size + transform_processes + queue_size + load_workers`
+jobs hold their data in memory at once.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import defaultdict
+
+from executor import JobTimeout, destination_project, destination_table
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)  # Set the desired log level
+
+# end of a stage's input
+_DONE = object()
+
+
+class _Job:
+    def __init__(self, index, job) -> None:
+        self.index = index
+        self.job = job
+        self.ctx = None
+        self.data = None
+        self.schema = None
+        self.deadline = None
+        self.table_lock = None
+        # a worker thread still running after a timeout, the table lock is released when it returns
+        self.abandoned = None
+
+
+class AsyncPipeline:
+    """Run jobs through the fetch, transform and load stages and hand back results in submission order.
+
+    `prepare(job)` returns a context whose `result` is set when the job has
+    nothing to do and whose `stream` flag hands the whole job to `load`;
+    otherwise `fetch(ctx)` fills `ctx.headers` and `ctx.values`,
+    `transform(headers, values)` (a picklable function, it runs in another
+    process) returns `(data, schema)` and `load(ctx, data, schema)` returns
+    the job result.
+
+    As with `JobExecutor`, jobs writing to the same table are serialized,
+    at most `max_workers_per_project` loads run against one destination
+    project at a time, and a job exceeding `job_timeout` seconds is reported
+    as timed out while its worker thread runs to completion.
+    """
+
+    def __init__(
+        self,
+        prepare,
+        fetch,
+        transform,
+        load,
+        fetch_workers: int = 4,
+        transform_processes: int = 0,
+        load_workers: int = 4,
+        queue_size: int = 2,
+        max_workers_per_project: int = 0,
+        job_timeout: float = 0,
+        table_of=lambda job: job["table"],
+        record_transform=None,
+    ) -> None:
+        self.prepare = prepare
+        self.fetch = fetch
+        self.transform = transform
+        self.load = load
+        self.fetch_workers = max(1, fetch_workers)
+        # 0 means one process per CPU
+        self.transform_processes = transform_processes or os.cpu_count() or 1
+        self.load_workers = max(1, load_workers)
+        self.queue_size = max(1, queue_size)
+        self.max_workers_per_project = max_workers_per_project
+        self.job_timeout = job_timeout
+        self.table_of = table_of
+        # called with the context and the seconds the transform took, metrics can not be recorded in the worker process
+        self.record_transform = record_transform
+
+    def map(self, jobs):
+        """Yield `(job, result_or_exception)` pairs in the order of `jobs`."""
+        jobs = list(jobs)
+        if not jobs:
+            return
+        results = asyncio.run(self._run(jobs))
+        for job, result in zip(jobs, results):
+            yield job, result
+
+    async def _call(self, state, pool, func, *args):
+        """Run `func` on `pool`, bounded by what is left of the job's time."""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(pool, func, *args)
+        if state.deadline is None:
+            return await future
+        remaining = state.deadline - loop.time()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(remaining, 0))
+        except asyncio.TimeoutError:
+            state.abandoned = future
+            raise JobTimeout(f"Job did not finish within {self.job_timeout} seconds")
+
+    def _finish(self, state, results, result):
+        results[state.index] = result
+        state.ctx = state.data = state.schema = None
+        if state.table_lock is None:
+            return
+        lock, state.table_lock = state.table_lock, None
+        if state.abandoned is not None and not state.abandoned.done():
+            state.abandoned.add_done_callback(lambda _: lock.release())
+        else:
+            lock.release()
+
+    async def _run(self, jobs):
+        loop = asyncio.get_running_loop()
+        results = [None] * len(jobs)
+        table_locks = defaultdict(asyncio.Lock)
+        project_slots = defaultdict(lambda: asyncio.Semaphore(self.max_workers_per_project))
+
+        pending = asyncio.Queue()
+        for index, job in enumerate(jobs):
+            pending.put_nowait(_Job(index, job))
+        to_transform = asyncio.Queue(self.queue_size)
+        to_load = asyncio.Queue(self.queue_size)
+
+        fetch_pool = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="gs2gbq-fetch")
+        load_pool = ThreadPoolExecutor(max_workers=self.load_workers, thread_name_prefix="gs2gbq-load")
+        transform_pool = ProcessPoolExecutor(max_workers=self.transform_processes)
+
+        async def fetch_stage():
+            while not pending.empty():
+                state = pending.get_nowait()
+                try:
+                    # Held from prepare to load: the watermark read when preparing
+                    # must be the one left by the previous job on the table.
+                    state.table_lock = table_locks[destination_table(self.table_of(state.job))]
+                    await state.table_lock.acquire()
+                    if self.job_timeout:
+                        state.deadline = loop.time() + self.job_timeout
+                    state.ctx = await self._call(state, fetch_pool, self.prepare, state.job)
+                    if state.ctx.result:
+                        self._finish(state, results, state.ctx.result)
+                        continue
+                    if state.ctx.stream:
+                        # read, typed and loaded block by block in the load stage
+                        await to_load.put(state)
+                        continue
+                    await self._call(state, fetch_pool, self.fetch, state.ctx)
+                except Exception as e:
+                    self._finish(state, results, e)
+                    continue
+                await to_transform.put(state)
+
+        async def transform_stage():
+            while (state := await to_transform.get()) is not _DONE:
+                ctx = state.ctx
+                try:
+                    start = loop.time()
+                    state.data, state.schema = await self._call(state, transform_pool, self.transform, ctx.headers, ctx.values)
+                    ctx.headers = ctx.values = None
+                    if self.record_transform is not None:
+                        self.record_transform(ctx, loop.time() - start)
+                except Exception as e:
+                    self._finish(state, results, e)
+                    continue
+                await to_load.put(state)
+
+        async def load_stage():
+            while (state := await to_load.get()) is not _DONE:
+                slot = None
+                if self.max_workers_per_project > 0:
+                    slot = project_slots[destination_project(self.table_of(state.job))]
+                try:
+                    if slot is not None:
+                        await slot.acquire()
+                    try:
+                        result = await self._call(state, load_pool, self.load, state.ctx, state.data, state.schema)
+                    finally:
+                        if slot is not None:
+                            slot.release()
+                except Exception as e:
+                    result = e
+                self._finish(state, results, result)
+
+        try:
+            fetchers = [asyncio.create_task(fetch_stage()) for _ in range(self.fetch_workers)]
+            transformers = [asyncio.create_task(transform_stage()) for _ in range(self.transform_processes)]
+            loaders = [asyncio.create_task(load_stage()) for _ in range(self.load_workers)]
+
+            await asyncio.gather(*fetchers)
+            for _ in transformers:
+                await to_transform.put(_DONE)
+            await asyncio.gather(*transformers)
+            for _ in loaders:
+                await to_load.put(_DONE)
+            await asyncio.gather(*loaders)
+        finally:
+            # Do not block on abandoned (timed out) jobs.
+            for pool in (fetch_pool, transform_pool, load_pool):
+                pool.shutdown(wait=not self.job_timeout, cancel_futures=True)
+        return results
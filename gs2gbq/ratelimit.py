@@ -0,0 +1,205 @@
+"""
+Process-wide rate limiting of the Sheets and BigQuery calls.
+
+Every call takes a token from the bucket of its quota before it is sent, so
+concurrent jobs share the per-minute budget instead of each finding out
+about it through 429 responses. A call rejected anyway pauses its whole
+bucket for the `Retry-After` delay (or an exponential backoff with jitter)
+and is retried. Each bucket keeps how many calls went through it and how
+long they waited.
+"""
+import email.utils
+import functools
+import random
+import sys
+import threading
+import time
+
+import google.api_core.exceptions
+
+import metrics
+from conf import settings
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHEETS_READ = "sheets_read"
+SHEETS_WRITE = "sheets_write"
+BIGQUERY_LOAD = "bigquery_load"
+
+# bucket capacity, in seconds of quota: how much of a burst goes through unthrottled
+BURST_SECONDS = 10
+# backoff on a rate limit error without Retry-After: BASE_DELAY * 2**attempt, capped
+BASE_DELAY = 1.0
+MAX_DELAY = 64.0
+
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+class TokenBucket:
+    """Token bucket refilled at `per_minute / 60` tokens per second.
+
+    Callers reserve their token up front (the count may go negative), so
+    waiting calls are served in arrival order. `per_minute=0` disables the
+    limit but keeps the statistics.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: float = None, clock=time.monotonic, sleep=time.sleep) -> None:
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = burst or max(1.0, self.rate * BURST_SECONDS)
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+        self.calls = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = self.clock()
+            self.calls += 1
+            wait = max(self._paused_until - now, 0.0)
+            if self.rate:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+            self.waited += wait
+            self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until it is available. Returns the seconds waited."""
+        wait = self._reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold every call of the bucket for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "waited": round(self.waited, 3),
+                "max_wait": round(self.max_wait, 3),
+                "mean_wait": round(self.waited / self.calls, 3) if self.calls else 0.0,
+            }
+
+
+def _status_code(e: Exception):
+    response = getattr(e, "response", None)
+    return getattr(response, "status_code", None) or getattr(e, "code", None)
+
+
+def sheets_api_error(e: Exception) -> bool:
+    """Whether `e` is a gspread APIError, without importing gspread: it is loaded by the first sheet opened."""
+    gspread = sys.modules.get("gspread")
+    return gspread is not None and isinstance(e, gspread.exceptions.APIError)
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """Whether `e` is a 429, or a BigQuery 403 for a rate (not a daily quota) limit."""
+    if isinstance(e, google.api_core.exceptions.TooManyRequests):
+        return True
+    if isinstance(e, google.api_core.exceptions.Forbidden):
+        return any(error.get("reason") in _RATE_LIMIT_REASONS for error in (e.errors or []))
+    return sheets_api_error(e) and _status_code(e) == 429
+
+
+def retry_after(e: Exception):
+    """Seconds asked for by the `Retry-After` header of the error's response, None without one."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, e: Exception = None) -> float:
+    """`Retry-After` plus up to a second of jitter, else an exponential backoff with full jitter."""
+    delay = retry_after(e) if e is not None else None
+    if delay is not None:
+        return delay + random.uniform(0, 1)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+
+
+class RateLimiter:
+    """Named token buckets shared by every thread of the process."""
+
+    def __init__(self, quotas: dict, max_retries: int = 5) -> None:
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._quotas = dict(quotas)
+        self._buckets = {}
+
+    def bucket(self, name: str) -> TokenBucket:
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = TokenBucket(name, self._quotas.get(name, 0))
+            return self._buckets[name]
+
+    def call(self, name: str, func, *args, **kwargs):
+        """Call `func` within the quota `name`, retrying it while it is rate limited."""
+        bucket = self.bucket(name)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            metrics.count_call(name)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, e)
+                logger.info(f"{name} rate limited, pausing {delay:0.1f} seconds ({attempt + 1}/{self.max_retries})")
+                bucket.pause(delay)
+                metrics.count(metrics.RATE_LIMIT_RETRIES)
+                attempt += 1
+
+    def limited(self, name: str):
+        """Decorator running every call of the function through `call`."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.call(name, func, *args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return {bucket.name: bucket.stats() for bucket in buckets}
+
+
+limiter = RateLimiter(
+    {
+        SHEETS_READ: settings.SHEETS_READ_PER_MINUTE,
+        SHEETS_WRITE: settings.SHEETS_WRITE_PER_MINUTE,
+        BIGQUERY_LOAD: settings.BIGQUERY_LOADS_PER_MINUTE,
+    },
+    max_retries=settings.RATE_LIMIT_MAX_RETRIES,
+)
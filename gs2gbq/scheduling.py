@@ -0,0 +1,125 @@
+"""
+Job schedules compiled once into day bitmasks, and an index of next runs.
+
+A `schedule` cell is one of:
+
+* `d`: every day,
+* weekdays such as `Mo,We`,
+* `m`: the first day of every month,
+* days of the month such as `1,15`.
+
+Anything else never runs. (The module is not called `schedule` so that it
+does not shadow the PyPI package of that name.)
+"""
+import functools
+import heapq
+from datetime import date, datetime, time, timedelta
+
+WEEKDAYS = ["mo", "tu", "we", "th", "fr", "sa", "su"]
+ALL_WEEKDAYS = (1 << 7) - 1
+
+# A schedule matching at least one day matches one within this many days.
+_SEARCH_DAYS = 400
+
+
+class Schedule:
+    """Days a job runs on: bit `weekday()` of `weekdays`, bit `day` of `monthdays`."""
+
+    def __init__(self, expression: str, weekdays: int = 0, monthdays: int = 0) -> None:
+        self.expression = expression
+        self.weekdays = weekdays
+        self.monthdays = monthdays
+
+    def __repr__(self) -> str:
+        return f"Schedule({self.expression!r})"
+
+    @property
+    def never(self) -> bool:
+        return not (self.weekdays or self.monthdays)
+
+    def matches(self, day: date) -> bool:
+        return bool((self.weekdays >> day.weekday()) & 1 or (self.monthdays >> day.day) & 1)
+
+    def next_run(self, after: datetime, run_time: time = time()) -> datetime:
+        """First `run_time` on a matching day at or after `after`, None for a schedule that never runs."""
+        if self.never:
+            return None
+        day = after.date()
+        if datetime.combine(day, run_time) < after:
+            day += timedelta(days=1)
+        for _ in range(_SEARCH_DAYS):
+            if self.matches(day):
+                return datetime.combine(day, run_time)
+            day += timedelta(days=1)
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def compile_schedule(expression: str) -> Schedule:
+    """Parse a `schedule` cell; see the module docstring for the syntax."""
+    expression = expression if isinstance(expression, str) else ""
+    tokens = expression.strip().replace(" ", "").lower().split(",")
+    if tokens == ["d"]:
+        return Schedule(expression, weekdays=ALL_WEEKDAYS)
+    if any(token in WEEKDAYS for token in tokens):
+        mask = 0
+        for token in tokens:
+            if token in WEEKDAYS:
+                mask |= 1 << WEEKDAYS.index(token)
+        return Schedule(expression, weekdays=mask)
+    if tokens == ["m"]:
+        return Schedule(expression, monthdays=1 << 1)
+    try:
+        days = [int(token) for token in tokens]
+    except ValueError:
+        days = []
+    mask = 0
+    for day in days:
+        if 1 <= day <= 31:
+            mask |= 1 << day
+    return Schedule(expression, monthdays=mask)
+
+
+def parse_run_time(value: str) -> time:
+    """`HH:MM` to a `time`."""
+    hour, minute = value.strip().split(":")
+    return time(int(hour), int(minute))
+
+
+class ScheduleIndex:
+    """Heap of the next run time of every job.
+
+    `pop_due(now)` hands back the jobs due at or before `now` (each once,
+    even if several of its runs were missed) and queues their following run.
+    """
+
+    def __init__(self, jobs, schedule_of=lambda job: job["schedule"], after: datetime = None, run_time: time = time()) -> None:
+        self.run_time = run_time
+        self._heap = []
+        after = after or datetime.now()
+        for position, job in enumerate(jobs):
+            schedule = compile_schedule(schedule_of(job))
+            next_run = schedule.next_run(after, run_time)
+            if next_run is not None:
+                self._push(next_run, position, job, schedule)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _push(self, when, position, job, schedule):
+        heapq.heappush(self._heap, (when, position, job, schedule))
+
+    def next_time(self) -> datetime:
+        """When the first job is due, None when no job ever runs."""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list:
+        """Jobs due at or before `now`, in config order."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, position, job, schedule = heapq.heappop(self._heap)
+            due.append((position, job))
+            next_run = schedule.next_run(now + timedelta(microseconds=1), self.run_time)
+            if next_run is not None:
+                self._push(next_run, position, job, schedule)
+        return [job for _, job in sorted(due, key=lambda item: item[0])]
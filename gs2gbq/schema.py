@@ -0,0 +1,202 @@
+"""
+Column type inference for the raw string values read from Google Sheets.
+
+All columns are classified together: a sample of their cells is stacked into
+one array, each candidate pattern is matched once over that array and the
+matches are counted per column. A column gets the first type, in
+`TYPE_PRIORITY` order, whose pattern matches all its non-empty sampled cells.
+The full column is then converted, and falls back to STRING if any non-empty
+cell outside the sample does not convert.
+"""
+import decimal
+
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+INT64 = "INT64"
+FLOAT64 = "FLOAT64"
+NUMERIC = "NUMERIC"
+BOOL = "BOOL"
+DATE = "DATE"
+TIMESTAMP = "TIMESTAMP"
+STRING = "STRING"
+
+# More specific types first: every INT64 cell also matches FLOAT64.
+TYPE_PRIORITY = [BOOL, INT64, NUMERIC, FLOAT64, DATE, TIMESTAMP]
+
+_DIGITS = r"(?:\d{1,3}(?:,\d{3})+|\d+)"
+PATTERNS = {
+    BOOL: r"(?i:true|false)",
+    # INT64 holds 18 digits safely, longer integers go to NUMERIC
+    INT64: r"[+-]?(?:\d{1,3}(?:,\d{3}){1,5}|\d{1,18})",
+    # NUMERIC: up to 29 integer digits and 9 decimals
+    NUMERIC: r"[+-]?(?:\d{1,29}|\d{0,29}\.\d{1,9})",
+    FLOAT64: rf"[+-]?(?:{_DIGITS}(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?",
+    DATE: r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{4}",
+    TIMESTAMP: r"(?:\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{4})[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?"
+    r"(?:Z|[+-]\d{2}:?\d{2})?",
+}
+
+# A decimal column is only worth NUMERIC when some cell has more significant
+# digits than a float64 holds exactly.
+LONG_DECIMAL = r"[+-]?0*(?=[\d.]{17})[\d.]+"
+
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"]
+TIMESTAMP_FORMATS = ["ISO8601", "%m/%d/%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M"]
+
+SQL_TYPE_NAMES = {
+    INT64: bigquery.enums.SqlTypeNames.INT64,
+    FLOAT64: bigquery.enums.SqlTypeNames.FLOAT64,
+    NUMERIC: bigquery.enums.SqlTypeNames.NUMERIC,
+    BOOL: bigquery.enums.SqlTypeNames.BOOL,
+    DATE: bigquery.enums.SqlTypeNames.DATE,
+    TIMESTAMP: bigquery.enums.SqlTypeNames.TIMESTAMP,
+    STRING: bigquery.enums.SqlTypeNames.STRING,
+}
+
+DEFAULT_SAMPLE_ROWS = 1000
+
+
+def _null_mask(values: np.ndarray) -> np.ndarray:
+    mask = pd.isna(values)
+    mask |= values == ""
+    return mask
+
+
+def sample_rows(n_rows: int, sample_size: int, seed: int = 0) -> np.ndarray:
+    """Row positions to classify: the first rows plus a random spread of the rest."""
+    if n_rows <= sample_size:
+        return np.arange(n_rows)
+    head = np.arange(sample_size // 2)
+    rest = np.random.default_rng(seed).choice(np.arange(sample_size // 2, n_rows), sample_size - head.size, replace=False)
+    return np.concatenate([head, np.sort(rest)])
+
+
+def classify_columns(values: np.ndarray, sample_size: int = DEFAULT_SAMPLE_ROWS) -> list:
+    """Classify the columns of a 2-D object array of sheet cells into BigQuery type names."""
+    n_rows, n_cols = values.shape
+    sample = values[sample_rows(n_rows, sample_size)]
+
+    # Column-major stacking keeps each column contiguous for the per-column counts.
+    cells = sample.T.ravel()
+    column_of = np.repeat(np.arange(n_cols), sample.shape[0])
+    present = ~_null_mask(cells)
+    n_present = np.bincount(column_of[present], minlength=n_cols)
+
+    stacked = pd.Series(cells[present], dtype=object).astype(str).str.strip()
+    present_columns = column_of[present]
+
+    types = [STRING] * n_cols
+    undecided = n_present > 0
+    for type_name in TYPE_PRIORITY:
+        if not undecided.any():
+            break
+        matches = stacked.str.fullmatch(PATTERNS[type_name]).to_numpy(dtype=bool)
+        n_matches = np.bincount(present_columns[matches], minlength=n_cols)
+        decided = undecided & (n_matches == n_present)
+        if type_name == NUMERIC and decided.any():
+            long = stacked.str.fullmatch(LONG_DECIMAL).to_numpy(dtype=bool)
+            decided &= np.bincount(present_columns[long], minlength=n_cols) > 0
+        for i in np.flatnonzero(decided):
+            types[i] = type_name
+        undecided &= ~decided
+    return types
+
+
+def _to_datetime(strings: pd.Series, formats, **kwargs):
+    for fmt in formats:
+        try:
+            return pd.to_datetime(strings, format=fmt, **kwargs)
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def convert_column(values: np.ndarray, type_name: str):
+    """Convert one column of raw cells to `type_name`. Returns None when a non-empty cell does not fit."""
+    if type_name == STRING:
+        return pd.Series(np.where(pd.isna(values), None, values), dtype=object)
+
+    nulls = _null_mask(values)
+    strings = pd.Series(np.where(nulls, None, values), dtype=object).str.strip()
+
+    if type_name == BOOL:
+        upper = strings.str.upper()
+        if not upper[~nulls].isin(["TRUE", "FALSE"]).all():
+            return None
+        return upper.map({"TRUE": True, "FALSE": False}).astype("boolean")
+
+    if type_name in (INT64, FLOAT64, NUMERIC):
+        strings = strings.str.replace(",", "", regex=False)
+        if type_name == NUMERIC:
+            try:
+                return strings.map(lambda v: None if v is None else decimal.Decimal(v))
+            except decimal.InvalidOperation:
+                return None
+        # Nullable dtypes keep 18 digit integers exact next to empty cells.
+        numbers = pd.to_numeric(strings, errors="coerce", dtype_backend="numpy_nullable")
+        if numbers[~nulls].isna().any():
+            return None
+        if type_name == INT64:
+            if not pd.api.types.is_integer_dtype(numbers.dtype):
+                return None
+            return numbers.astype("Int64")
+        return numbers.astype("float64")
+
+    if type_name == DATE:
+        dates = _to_datetime(strings, DATE_FORMATS)
+        return None if dates is None else dates.dt.date.astype(object).where(~nulls, None)
+
+    if type_name == TIMESTAMP:
+        return _to_datetime(strings, TIMESTAMP_FORMATS, utc=True)
+
+    raise ValueError(f"Unknown type {type_name!r}")
+
+
+# number types a column can be widened along, narrowest first
+NUMBER_WIDENING = [INT64, NUMERIC, FLOAT64]
+
+
+def common_type(type_name: str, other: str) -> str:
+    """Narrowest type holding the cells of both types: the wider number type, STRING otherwise."""
+    if type_name == other:
+        return type_name
+    if type_name in NUMBER_WIDENING and other in NUMBER_WIDENING:
+        return max(type_name, other, key=NUMBER_WIDENING.index)
+    return STRING
+
+
+def schema_types(schema) -> list:
+    """Type names of a list of `bigquery.SchemaField`, the reverse of SQL_TYPE_NAMES."""
+    names = {sql_type.value: type_name for type_name, sql_type in SQL_TYPE_NAMES.items()}
+    return [names[field.field_type] for field in schema]
+
+
+def infer_schema(df: pd.DataFrame, sample_size: int = DEFAULT_SAMPLE_ROWS, types: list = None):
+    """Type the columns of a frame of raw sheet cells.
+
+    Returns the converted frame and one `bigquery.SchemaField` per column.
+    With `types` (e.g. those of the first chunk of a streamed sheet) no
+    inference is done, and a ValueError is raised if a column does not fit.
+    """
+    values = df.to_numpy(dtype=object)
+    fixed = types is not None
+    if not fixed:
+        types = classify_columns(values, sample_size)
+
+    columns = []
+    schema = []
+    for i, (name, type_name) in enumerate(zip(df.columns, types)):
+        converted = convert_column(values[:, i], type_name)
+        if converted is None and fixed:
+            raise ValueError(f"Column {name} does not fit its {type_name} type")
+        if converted is None:
+            type_name = STRING
+            converted = convert_column(values[:, i], STRING)
+        columns.append(converted.reset_index(drop=True))
+        schema.append(bigquery.SchemaField(name, SQL_TYPE_NAMES[type_name]))
+
+    typed = pd.DataFrame(dict(enumerate(columns)), index=pd.RangeIndex(df.shape[0]))
+    typed.columns = df.columns
+    return typed, schema
@@ -0,0 +1,106 @@
+"""
+Local snapshots of the raw cells read from the Sheets API.
+
+A job whose load fails has already paid for its read: the cells it fetched
+are written to a compressed Arrow IPC file, keyed by the spreadsheet,
+sheet, range, first row and Drive revision they were read at. A retry, a
+forced rerun or a backfill of the same revision memory-maps that file
+instead of fetching the sheet again. Any edit of the spreadsheet bumps its
+revision, so a stale snapshot is never read; it is simply evicted.
+
+The files of the directory are kept under `max_bytes` in total, the least
+recently used ones being removed first.
+"""
+import hashlib
+import os
+import threading
+import uuid
+
+SUFFIX = ".arrow"
+
+
+class SnapshotCache:
+    """Raw cells of the sheets read lately, one Arrow IPC file each in `directory`.
+
+    `max_bytes` of 0 disables the cache. `compression` is an Arrow IPC
+    codec ("zstd", "lz4"), or empty for uncompressed files which are read
+    without any copy.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1_000_000_000, compression: str = "zstd") -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compression = compression or None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory and self.max_bytes)
+
+    @staticmethod
+    def key(url: str, sheet: str, range: str, revision: str, first_row: int) -> str:
+        return "|".join([url.strip(), sheet, range or "", revision, str(first_row)])
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + SUFFIX)
+
+    def get(self, key: str):
+        """`(headers, values)` stored under `key`, None if there is no such snapshot."""
+        if not self.enabled:
+            return None
+        import numpy as np
+        import pyarrow as pa
+
+        path = self.path(key)
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            # most recently used
+            os.utime(path)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        values = np.empty(table.shape, dtype=object)
+        for i, column in enumerate(table.columns):
+            values[:, i] = column.to_numpy(zero_copy_only=False)
+        return table.column_names, values
+
+    def put(self, key: str, headers, values: "np.ndarray") -> None:
+        """Store the headers and the 2-D object array of cells read under `key`."""
+        if not self.enabled:
+            return
+        import pyarrow as pa
+
+        from arrowconv import string_array
+
+        table = pa.Table.from_arrays(
+            [string_array(values[:, i]) for i in range(values.shape[1])], names=[str(h) for h in headers]
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used snapshots until the directory is under `max_bytes`."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,186 @@
+"""
+Writing rows through the BigQuery Storage Write API instead of load jobs.
+
+Rows are sent as serialized Arrow record batches on a write stream, so they
+land in seconds and do not count against the daily load job quota:
+
+* `pending` streams buffer the rows until the stream is committed, so a
+  job's rows appear all at once (or not at all when it fails half way);
+  retrying a failed job can not duplicate rows.
+* `committed` streams make each batch visible as soon as it is appended.
+
+The API only appends to an existing table: creating or replacing the table
+is left to the caller. `google-cloud-bigquery-storage` (2.27 or later, for
+Arrow appends) is only needed by `BigQueryWriteAPI`; `LocalWriteClient`
+keeps the written rows in memory to run the same code offline.
+"""
+import itertools
+import threading
+import time
+
+import metrics
+
+PENDING_STREAM = "pending"
+COMMITTED_STREAM = "committed"
+STREAM_TYPES = (PENDING_STREAM, COMMITTED_STREAM)
+
+# AppendRows requests are limited to 10 MB
+DEFAULT_BATCH_BYTES = 8_000_000
+
+
+class StorageWriteError(Exception):
+    pass
+
+
+def table_path(table_name: str) -> str:
+    """`project.dataset.table` to the `projects/.../tables/...` path of the API."""
+    project, dataset, table = table_name.split(".")
+    return f"projects/{project}/datasets/{dataset}/tables/{table}"
+
+
+def record_batches(table: "pa.Table", max_bytes: int = DEFAULT_BATCH_BYTES):
+    """Slices of `table` of at most about `max_bytes` each."""
+    n_rows = table.num_rows
+    rows = n_rows if not table.nbytes else max(1, int(n_rows * max_bytes / table.nbytes))
+    for start in range(0, n_rows, rows):
+        yield from table.slice(start, rows).combine_chunks().to_batches()
+
+
+class BigQueryWriteAPI:
+    """The write operations of `bigquery_storage_v1.BigQueryWriteClient`."""
+
+    def __init__(self, client) -> None:
+        from google.cloud.bigquery_storage_v1 import types
+
+        self.client = client
+        self.types = types
+
+    def create_stream(self, path: str, stream_type: str) -> str:
+        type_ = self.types.WriteStream.Type.PENDING if stream_type == PENDING_STREAM else self.types.WriteStream.Type.COMMITTED
+        return self.client.create_write_stream(parent=path, write_stream=self.types.WriteStream(type_=type_)).name
+
+    def append(self, stream: str, schema: bytes, batches) -> None:
+        """Send `(offset, serialized batch)` pairs on one connection and check every response."""
+        types = self.types
+
+        def requests():
+            for i, (offset, batch) in enumerate(batches):
+                arrow_rows = types.AppendRowsRequest.ArrowData(rows=types.ArrowRecordBatch(serialized_record_batch=batch))
+                if i == 0:
+                    arrow_rows.writer_schema = types.ArrowSchema(serialized_schema=schema)
+                yield types.AppendRowsRequest(write_stream=stream, offset=offset, arrow_rows=arrow_rows)
+
+        for response in self.client.append_rows(requests()):
+            if response.error.code:
+                raise StorageWriteError(f"Append to {stream} failed: {response.error.message}")
+            if response.row_errors:
+                raise StorageWriteError(f"Append to {stream} rejected rows: {response.row_errors[0].message}")
+
+    def finalize(self, stream: str) -> int:
+        return self.client.finalize_write_stream(name=stream).row_count
+
+    def commit(self, path: str, streams) -> None:
+        request = self.types.BatchCommitWriteStreamsRequest(parent=path, write_streams=list(streams))
+        response = self.client.batch_commit_write_streams(request)
+        if response.stream_errors:
+            raise StorageWriteError(f"Commit to {path} failed: {response.stream_errors[0].error_message}")
+
+
+class LocalWriteClient:
+    """In-memory stand-in for `BigQueryWriteAPI` with the same stream semantics.
+
+    Appends must come at the next offset of their stream; rows of a pending
+    stream become visible in `rows()` when the stream is committed.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._streams = {}
+        self._tables = {}
+
+    def create_stream(self, path: str, stream_type: str) -> str:
+        with self._lock:
+            name = f"{path}/streams/{next(self._ids)}"
+            self._streams[name] = {"path": path, "type": stream_type, "batches": [], "rows": 0, "finalized": False}
+            return name
+
+    def append(self, stream: str, schema: bytes, batches) -> None:
+        import pyarrow as pa
+
+        schema = pa.ipc.read_schema(pa.py_buffer(schema))
+        for offset, batch in batches:
+            batch = pa.ipc.read_record_batch(pa.py_buffer(batch), schema)
+            with self._lock:
+                state = self._streams[stream]
+                if state["finalized"]:
+                    raise StorageWriteError(f"Stream {stream} is finalized")
+                if offset != state["rows"]:
+                    raise StorageWriteError(f"Append to {stream} at offset {offset}, expected {state['rows']}")
+                state["rows"] += batch.num_rows
+                if state["type"] == COMMITTED_STREAM:
+                    self._tables.setdefault(state["path"], []).append(batch)
+                else:
+                    state["batches"].append(batch)
+
+    def finalize(self, stream: str) -> int:
+        with self._lock:
+            self._streams[stream]["finalized"] = True
+            return self._streams[stream]["rows"]
+
+    def commit(self, path: str, streams) -> None:
+        with self._lock:
+            for stream in streams:
+                state = self._streams[stream]
+                if not state["finalized"]:
+                    raise StorageWriteError(f"Stream {stream} is not finalized")
+                self._tables.setdefault(path, []).extend(state["batches"])
+                state["batches"] = []
+
+    def rows(self, path: str) -> "pa.Table":
+        import pyarrow as pa
+
+        with self._lock:
+            batches = list(self._tables.get(path, []))
+        return pa.Table.from_batches(batches) if batches else None
+
+    def truncate(self, path: str) -> None:
+        with self._lock:
+            self._tables.pop(path, None)
+
+
+def write_table(api, path: str, table: "pa.Table", stream_type: str = PENDING_STREAM, max_bytes: int = DEFAULT_BATCH_BYTES) -> int:
+    """Write all the rows of `table` on one stream of `stream_type`; returns the number of rows written.
+
+    Each record batch is serialized as the stream asks for it, so no more than
+    the batches in flight are held in memory besides the table.
+    """
+    if stream_type not in STREAM_TYPES:
+        raise ValueError(f"Unknown write stream type {stream_type!r}, expected one of {', '.join(STREAM_TYPES)}")
+    stream = api.create_stream(path, stream_type)
+    # the API may consume the batches on another thread: record into the job's metrics explicitly
+    job_metrics = metrics.current()
+    serializing = [0.0]
+
+    def serialized():
+        offset = 0
+        for batch in record_batches(table, max_bytes):
+            with metrics.recording(job_metrics):
+                start = time.perf_counter()
+                data = batch.serialize().to_pybytes()
+                serializing[0] += time.perf_counter() - start
+                metrics.count(metrics.LOAD_BYTES, len(data))
+                metrics.count_call("storage_write")
+            yield offset, data
+            offset += batch.num_rows
+
+    start = time.perf_counter()
+    if table.num_rows:
+        api.append(stream, table.schema.serialize().to_pybytes(), serialized())
+    n_rows = api.finalize(stream)
+    if stream_type == PENDING_STREAM:
+        api.commit(path, [stream])
+    if job_metrics is not None:
+        job_metrics.add_time(metrics.SERIALIZATION, serializing[0])
+        job_metrics.add_time(metrics.LOAD_WAIT, time.perf_counter() - start - serializing[0])
+    return n_rows
@@ -0,0 +1,14 @@
+"""
+The gs2gbq modules import each other by their bare names (they are run as
+`python gs2gbq/manager.py`), so the package directory has to be importable,
+and so does the benchmark directory for the API fakes some tests run against.
+"""
+import os
+import sys
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIRECTORY = os.path.join(os.path.dirname(PACKAGE_DIRECTORY), "benchmarks")
+
+for directory in [BENCHMARK_DIRECTORY, PACKAGE_DIRECTORY]:
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
@@ -0,0 +1,72 @@
+"""
+Provides a base test class running JobManager against the API fakes.
+
+The state files go to a temporary directory and the rate limits are lifted,
+so that tests neither touch gs2gbq/state nor share the quota of the run.
+"""
+import os
+import tempfile
+from unittest import mock
+
+from clients import registry
+from conf import settings
+from fakes import FakeBigQueryClient, FakeSpreadsheet, install
+from jobconfig import REQUIRED_COLUMNS
+from ratelimit import BIGQUERY_LOAD, SHEETS_READ, SHEETS_WRITE, TokenBucket, limiter
+from .base_test import BaseTestCase
+
+PROJECT = "project"
+CONFIG_URL = "https://fake/config"
+
+
+def config_row(url: str, table: str, range: str = "A:C", sheet: str = "data", **optional) -> dict:
+    """One daily job of the job config; `optional` sets the mode, key, sink and fetch columns."""
+    row = dict(zip(REQUIRED_COLUMNS, [url, table, "1", range, "d", "job", sheet, "2"]))
+    row.update(optional)
+    return row
+
+
+class FakeJobsTestCase(BaseTestCase):
+    """
+    Superclass for test cases running jobs against FakeSpreadsheet and FakeBigQueryClient.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        state = {
+            "WATERMARK_FILE": "watermarks.json",
+            "FINGERPRINT_FILE": "fingerprints.json",
+            "CONFIG_CACHE_FILE": "jobconfig.json",
+            "JOB_STATE_FILE": "jobs.sqlite",
+            "SNAPSHOT_DIR": "snapshots",
+        }
+        for name, file_name in state.items():
+            self.patch(mock.patch.object(settings, name, os.path.join(self.directory, file_name)))
+        self.patch(mock.patch.object(settings, "LOG_BACKEND", "jsonl"))
+        self.patch(mock.patch.object(settings, "FORCE_REFRESH", False))
+        quotas = {name: TokenBucket(name, 0) for name in [SHEETS_READ, SHEETS_WRITE, BIGQUERY_LOAD]}
+        self.patch(mock.patch.dict(limiter._buckets, quotas))
+        self.addCleanup(registry.invalidate)
+        self.client = FakeBigQueryClient()
+        install(registry, settings.CREDENTIAL_FILE, bigquery_clients={PROJECT: self.client})
+
+    def patch(self, patcher):
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def spreadsheet(self, url: str, rows: list, sheet: str = "data") -> FakeSpreadsheet:
+        spreadsheet = FakeSpreadsheet({sheet: rows})
+        install(registry, settings.CREDENTIAL_FILE, spreadsheets={url: spreadsheet})
+        return spreadsheet
+
+    def manager(self, jobs=(), **kwargs):
+        """A JobManager whose job config holds the `config_row`s of `jobs`."""
+        from manager import JobManager
+
+        columns = list(REQUIRED_COLUMNS)
+        for job in jobs:
+            columns += [c for c in job if c not in columns]
+        self.spreadsheet(CONFIG_URL, [columns] + [[job.get(c, "") for c in columns] for job in jobs], sheet="jobs")
+        return JobManager(CONFIG_URL, os.path.join(self.directory, "log.jsonl"), **kwargs)
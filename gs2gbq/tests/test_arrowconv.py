@@ -0,0 +1,164 @@
+"""
+Tests for typing sheet values straight to Arrow.
+"""
+import datetime
+
+import numpy as np
+import pyarrow as pa
+from google.cloud import bigquery
+
+from arrowconv import cast_to_schema, convert_array, hash_table
+from schema import BOOL, DATE, FLOAT64, INT64, NUMERIC, STRING, TIMESTAMP, schema_types
+from transform import ARROW_ENGINE, PANDAS_ENGINE, transform_values
+from .base_test import BaseTestCase
+
+UTC = datetime.timezone.utc
+
+
+def strings(*values):
+    return pa.array(values, type=pa.string())
+
+
+class TestConvertArray(BaseTestCase):
+    """
+    Tests for convert_array.
+    """
+
+    def test_numbers(self):
+        self.assertEqual(convert_array(strings("1,000", "+2", " ", None), INT64).to_pylist(), [1000, 2, None, None])
+        self.assertEqual(convert_array(strings("1.5", "-2"), FLOAT64).to_pylist(), [1.5, -2.0])
+        self.assertEqual(convert_array(strings("1.25"), NUMERIC).type, pa.decimal128(38, 9))
+        self.assertIsNone(convert_array(strings("1", "n/a"), INT64))
+        self.assertIsNone(convert_array(strings("1.5"), INT64))
+
+    def test_bool(self):
+        self.assertEqual(convert_array(strings("TRUE", "false", ""), BOOL).to_pylist(), [True, False, None])
+        self.assertIsNone(convert_array(strings("yes please"), BOOL))
+
+    def test_date(self):
+        self.assertEqual(
+            convert_array(strings("2024-02-29", ""), DATE).to_pylist(),
+            [datetime.date(2024, 2, 29), None],
+        )
+        self.assertEqual(convert_array(strings("29/02/2024"), DATE).to_pylist(), [datetime.date(2024, 2, 29)])
+        # not rolled over to the first of March
+        self.assertIsNone(convert_array(strings("2024-02-30"), DATE))
+
+    def test_timestamp(self):
+        expected = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC)
+        # naive cells are read as UTC
+        self.assertEqual(convert_array(strings("2024-01-02T03:04:05"), TIMESTAMP).to_pylist(), [expected])
+        self.assertEqual(convert_array(strings("2024-01-02 04:04:05+01:00"), TIMESTAMP).to_pylist(), [expected])
+        self.assertEqual(
+            convert_array(strings("2024-01-02T03:04:05Z", "2024-01-02T03:04:05", None), TIMESTAMP).to_pylist(),
+            [expected, expected, None],
+        )
+        self.assertEqual(
+            convert_array(strings("12/31/2024 10:00:00"), TIMESTAMP).to_pylist(),
+            [datetime.datetime(2024, 12, 31, 10, tzinfo=UTC)],
+        )
+        self.assertIsNone(convert_array(strings("04/31/2024 10:00:00"), TIMESTAMP))
+        self.assertIsNone(convert_array(strings("tomorrow"), TIMESTAMP))
+
+    def test_string_kept(self):
+        raw = strings(" a ", "")
+        self.assertIs(convert_array(raw, STRING), raw)
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            convert_array(strings("1"), "GEOGRAPHY")
+
+
+class TestCastToSchema(BaseTestCase):
+    """
+    Tests for cast_to_schema.
+    """
+
+    def test_cast(self):
+        table = pa.table({"id": ["1", "2"], "amount": [1, 2], "extra": ["x", "y"]})
+        fields = [bigquery.SchemaField("id", "INTEGER"), bigquery.SchemaField("amount", "FLOAT64")]
+        cast = cast_to_schema(table, fields)
+        self.assertEqual(cast.schema.types, [pa.int64(), pa.float64(), pa.string()])
+        self.assertEqual(cast.column_names, ["id", "amount", "extra"])
+        self.assertEqual(cast.column("id").to_pylist(), [1, 2])
+
+    def test_unknown_field_type_kept(self):
+        table = pa.table({"shape": ["POINT(0 0)"]})
+        self.assertTrue(cast_to_schema(table, [bigquery.SchemaField("shape", "GEOGRAPHY")]).equals(table))
+
+
+class TestHashTable(BaseTestCase):
+    """
+    Tests for hash_table.
+    """
+
+    def test_hash(self):
+        table = pa.table({"id": [1, 2], "name": ["a", None]})
+        self.assertEqual(hash_table(table), hash_table(pa.table({"id": [1, 2], "name": ["a", None]})))
+        self.assertNotEqual(hash_table(table), hash_table(pa.table({"id": [1, 2], "name": ["a", "b"]})))
+        self.assertNotEqual(hash_table(table), hash_table(table.rename_columns(["key", "name"])))
+        self.assertNotEqual(hash_table(table), hash_table(table.cast(pa.schema([("id", pa.float64()), ("name", pa.string())]))))
+
+
+class TestEngineParity(BaseTestCase):
+    """
+    Tests that the Arrow and pandas engines type a sheet alike.
+    """
+
+    headers = ["id", "amount", "count", "flag", "day", "at", "name", "empty"]
+    rows = [
+        ["1", "1.5", "1,000", "TRUE", "2024-01-02", "2024-01-02 03:04:05", "x", ""],
+        ["+2", "", "2", "false", "", "2024-01-03T00:00:00", "", ""],
+        ["", "3", "-3", "", "2024-02-29", "", "z", ""],
+    ]
+
+    def transform(self, engine, types=None):
+        data, schema = transform_values(engine, self.headers, np.array(self.rows, dtype=object), types)
+        if engine == PANDAS_ENGINE:
+            data = cast_to_schema(pa.Table.from_pandas(data, preserve_index=False), schema)
+        return data.to_pylist(), schema_types(schema)
+
+    def test_types_and_values(self):
+        values, types = self.transform(ARROW_ENGINE)
+        self.assertEqual(types, [INT64, FLOAT64, INT64, BOOL, DATE, TIMESTAMP, STRING, STRING])
+        self.assertEqual(self.transform(PANDAS_ENGINE), (values, types))
+        self.assertEqual(values[1]["id"], 2)
+        self.assertIsNone(values[1]["amount"])
+        self.assertEqual(values[0]["at"], datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC))
+
+    def test_mixed_offsets(self):
+        # "Z", no offset and another offset in one column: the cells without one are UTC
+        self.rows = [["2024-01-01T10:00:00Z"], ["2024-01-02T11:30:00"], ["2024-01-03 12:00:00+02:00"], [""]]
+        self.headers = ["at"]
+        values, types = self.transform(ARROW_ENGINE)
+        self.assertEqual(types, [TIMESTAMP])
+        self.assertEqual(self.transform(PANDAS_ENGINE), (values, types))
+        self.assertEqual(
+            [row["at"] for row in values],
+            [
+                datetime.datetime(2024, 1, 1, 10, tzinfo=UTC),
+                datetime.datetime(2024, 1, 2, 11, 30, tzinfo=UTC),
+                datetime.datetime(2024, 1, 3, 10, tzinfo=UTC),
+                None,
+            ],
+        )
+
+    def test_invalid_dates(self):
+        self.rows = [["2024-02-30", "12/31/2024 10:00:00"], ["2024-01-01", "04/31/2024 10:00:00"]]
+        self.headers = ["day", "at"]
+        values, types = self.transform(ARROW_ENGINE)
+        self.assertEqual(types, [STRING, STRING])
+        self.assertEqual(self.transform(PANDAS_ENGINE), (values, types))
+
+    def test_fixed_types(self):
+        types = [STRING, FLOAT64, FLOAT64, STRING, STRING, STRING, STRING, STRING]
+        values, fixed = self.transform(ARROW_ENGINE, types)
+        self.assertEqual(fixed, types)
+        self.assertEqual(self.transform(PANDAS_ENGINE, types), (values, fixed))
+        self.assertEqual(values[1]["id"], "+2")
+
+    def test_fixed_type_not_fitting(self):
+        for engine in [ARROW_ENGINE, PANDAS_ENGINE]:
+            with self.subTest(engine=engine):
+                with self.assertRaises(ValueError):
+                    self.transform(engine, [INT64, INT64] + [STRING] * 6)
@@ -0,0 +1,53 @@
+"""
+Tests for the column-parallel typing in columnpool.py.
+"""
+import numpy as np
+
+from columnpool import ColumnPool
+from schema import INT64
+from transform import ARROW_ENGINE, PANDAS_ENGINE, transform_values
+from .base_test import BaseTestCase
+
+
+def values(n_rows, n_cols):
+    kinds = [
+        lambda i: str(i),
+        lambda i: f"{i}.5",
+        lambda i: f"2024-01-{i % 28 + 1:02d}",
+        lambda i: "" if i % 3 else f"text {i}",
+    ]
+    cells = np.empty((n_rows, n_cols), dtype=object)
+    for j in range(n_cols):
+        cells[:, j] = [kinds[j % len(kinds)](i) for i in range(n_rows)]
+    return [f"col_{j}" for j in range(n_cols)], cells
+
+
+class TestColumnPool(BaseTestCase):
+    """
+    Tests for ColumnPool.
+    """
+
+    def setUp(self):
+        self.pool = ColumnPool(processes=2, min_cells=0)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_same_as_in_process(self):
+        headers, cells = values(500, 9)
+        table, schema = self.pool.transform(ARROW_ENGINE, headers, cells)
+        expected, expected_schema = transform_values(ARROW_ENGINE, headers, cells)
+        self.assertTrue(table.equals(expected))
+        self.assertEqual(schema, expected_schema)
+
+    def test_fixed_types_mismatch(self):
+        headers, cells = values(50, 4)
+        with self.assertRaises(ValueError):
+            self.pool.transform(ARROW_ENGINE, headers, cells, types=[INT64] * 4)
+
+    def test_in_process(self):
+        headers, cells = values(50, 4)
+        self.assertTrue(ColumnPool(processes=2, min_cells=1000).in_process(ARROW_ENGINE, cells))
+        self.assertTrue(self.pool.in_process(PANDAS_ENGINE, cells))
+        self.assertTrue(ColumnPool(processes=1, min_cells=0).in_process(ARROW_ENGINE, cells))
+        self.assertFalse(self.pool.in_process(ARROW_ENGINE, cells))
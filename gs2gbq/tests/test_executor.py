@@ -0,0 +1,93 @@
+"""
+Tests for running jobs on the thread pool of JobExecutor.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from executor import JobExecutor, JobTimeout, destination_project, destination_table
+from .base_test import BaseTestCase
+
+
+class Tracker:
+    """A job function sleeping `job["seconds"]`, recording how many jobs ran at once per key."""
+
+    def __init__(self, key) -> None:
+        self.key = key
+        self.lock = threading.Lock()
+        self.running = defaultdict(int)
+        self.peak = defaultdict(int)
+
+    def __call__(self, job):
+        key = self.key(job)
+        with self.lock:
+            self.running[key] += 1
+            self.peak[key] = max(self.peak[key], self.running[key])
+        try:
+            time.sleep(job.get("seconds", 0.02))
+            if job.get("error"):
+                raise job["error"]
+            return job["name"]
+        finally:
+            with self.lock:
+                self.running[key] -= 1
+
+
+def job(name, table, **kwargs):
+    return dict(name=name, table=table, **kwargs)
+
+
+class TestDestination(BaseTestCase):
+    """
+    Tests for destination_project and destination_table.
+    """
+
+    def test_destination(self):
+        self.assertEqual(destination_project("p.d.t"), "p")
+        self.assertEqual(destination_project("d.t"), "")
+        self.assertEqual(destination_table(" P.D.Table "), "p.d.table")
+
+
+class TestJobExecutor(BaseTestCase):
+    """
+    Tests for JobExecutor.
+    """
+
+    def test_results_in_submission_order(self):
+        jobs = [job(f"job{i}", f"p.d.t{i}", seconds=0.02 * (4 - i)) for i in range(4)]
+        jobs.append(job("failed", "p.d.failed", error=ValueError("bad")))
+        tracker = Tracker(lambda job: "all")
+        results = list(JobExecutor(tracker, max_workers=4).map(jobs))
+        self.assertEqual([j["name"] for j, _ in results], ["job0", "job1", "job2", "job3", "failed"])
+        self.assertEqual([r for _, r in results[:4]], ["job0", "job1", "job2", "job3"])
+        self.assertIsInstance(results[4][1], ValueError)
+        self.assertGreater(tracker.peak["all"], 1)
+
+    def test_same_table_serialized(self):
+        jobs = [job(f"job{i}", "p.d.T" if i % 2 else "p.d.t") for i in range(4)]
+        jobs += [job("other", "p.d.other"), job("other2", "p.d.other2")]
+        tracker = Tracker(lambda job: destination_table(job["table"]))
+        list(JobExecutor(tracker, max_workers=6).map(jobs))
+        self.assertEqual(tracker.peak["p.d.t"], 1)
+
+    def test_per_project_cap(self):
+        jobs = [job(f"a{i}", f"a.d.t{i}", seconds=0.05) for i in range(5)]
+        jobs += [job(f"b{i}", f"b.d.t{i}", seconds=0.05) for i in range(3)]
+        tracker = Tracker(lambda job: destination_project(job["table"]))
+        list(JobExecutor(tracker, max_workers=8, max_workers_per_project=2).map(jobs))
+        self.assertEqual(tracker.peak["a"], 2)
+        self.assertEqual(tracker.peak["b"], 2)
+
+    def test_timeout_counted_from_job_start(self):
+        # the second job waits for the only worker longer than the timeout, then runs within it
+        jobs = [job("first", "p.d.t1", seconds=0.3), job("second", "p.d.t2", seconds=0.1)]
+        results = list(JobExecutor(Tracker(lambda job: "all"), max_workers=1, job_timeout=0.25).map(jobs))
+        self.assertIsInstance(results[0][1], JobTimeout)
+        self.assertEqual(results[1][1], "second")
+
+    def test_timeout(self):
+        start = time.monotonic()
+        results = list(JobExecutor(Tracker(lambda job: "all"), job_timeout=0.05).map([job("slow", "p.d.t", seconds=0.5)]))
+        self.assertIsInstance(results[0][1], JobTimeout)
+        # not waited on
+        self.assertLess(time.monotonic() - start, 0.4)
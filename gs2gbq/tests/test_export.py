@@ -0,0 +1,81 @@
+"""
+Tests for reading sheets from their CSV export.
+"""
+from unittest import mock
+
+from conf import settings
+from gshandler import EXPORT_FETCH, VALUES_FETCH, GSHandler, assemble_ranges, column_span, csv_to_grid, select_ranges
+from .base_test import BaseTestCase
+
+CSV = (
+    b'id,name,note,,extra\r\n'
+    b'1,"a, b",,,\r\n'
+    b',,,,\r\n'
+    b'3,"multi\nline",x,,y\r\n'
+    b'4,,,,\r\n'
+    b',,,,\r\n'
+)
+
+
+class TestExportParsing(BaseTestCase):
+    """
+    Tests for csv_to_grid and select_ranges.
+    """
+
+    def test_column_span(self):
+        self.assertEqual(column_span("A:C"), (0, 2))
+        self.assertEqual(column_span("AA"), (26, 26))
+        self.assertEqual(column_span(None), (0, None))
+        self.assertIsNone(column_span("A2:C10"))
+
+    def test_csv_to_grid(self):
+        grid = csv_to_grid(CSV)
+        self.assertEqual(grid.shape, (6, 5))
+        self.assertEqual(grid[1, 1], "a, b")
+        self.assertEqual(grid[3, 1], "multi\nline")
+        self.assertEqual(grid[2, 0], "")
+        self.assertEqual(csv_to_grid(b"").shape, (0, 0))
+
+    def test_select_ranges_matches_api_blocks(self):
+        # What values:batchGet returns for A:B and C:E: no trailing empty cells or rows.
+        blocks = [
+            [["id", "name"], ["1", "a, b"], [], ["3", "multi\nline"], ["4"]],
+            [["note", "", "extra"], [], [], ["x", "", "y"]],
+        ]
+        values = select_ranges(csv_to_grid(CSV), [(0, 1), (2, 4)])
+        self.assert_array_equal(values, assemble_ranges(blocks))
+
+    def test_select_whole_sheet(self):
+        values = select_ranges(csv_to_grid(b"a,b,\r\n1,,\r\n,,\r\n"), [(0, None)])
+        self.assertEqual(values.tolist(), [["a", "b"], ["1", None]])
+
+
+class TestFetchEngine(BaseTestCase):
+    """
+    Tests for the choice of GSHandler.fetch_values.
+    """
+
+    def fetch(self, ranges, engine, row_count=1000, column_count=1000):
+        handler = GSHandler("https://sheet", "data", ranges)
+        properties = {"sheetId": 7, "gridProperties": {"rowCount": row_count, "columnCount": column_count}}
+        with mock.patch.object(handler, "sheet_properties", return_value=properties), mock.patch.object(
+            handler, "read_values", return_value=VALUES_FETCH
+        ), mock.patch.object(handler, "export_values", return_value=EXPORT_FETCH) as export_values, mock.patch.object(
+            settings, "EXPORT_MIN_CELLS", 500_000
+        ):
+            used = handler.fetch_values(2, engine=engine)
+        if used == EXPORT_FETCH:
+            self.assertEqual(export_values.call_args.kwargs["gid"], None if engine == EXPORT_FETCH else 7)
+        return used
+
+    def test_auto_by_size(self):
+        self.assertEqual(self.fetch("A:C", "auto"), EXPORT_FETCH)
+        self.assertEqual(self.fetch("A:C", "auto", row_count=10), VALUES_FETCH)
+
+    def test_row_bounded_ranges_not_exported(self):
+        self.assertEqual(self.fetch("A2:C100", "auto"), VALUES_FETCH)
+        self.assertEqual(self.fetch("A:C,D5:E", EXPORT_FETCH), VALUES_FETCH)
+
+    def test_explicit_engine(self):
+        self.assertEqual(self.fetch("A:C", EXPORT_FETCH, row_count=10), EXPORT_FETCH)
+        self.assertEqual(self.fetch("A:C", VALUES_FETCH), VALUES_FETCH)
@@ -0,0 +1,115 @@
+"""
+Tests for skipping the loads of unchanged sources.
+"""
+import os
+import tempfile
+from unittest import mock
+
+import pyarrow as pa
+
+from conf import settings
+from fingerprint import FingerprintCache, hash_data
+from watermark import WatermarkStore
+from .fake_jobs import PROJECT, FakeJobsTestCase, config_row
+from .base_test import BaseTestCase
+
+URL = "https://fake/data"
+TABLE = f"{PROJECT}.dataset.table"
+
+
+class TestFingerprintCache(BaseTestCase):
+    """
+    Tests for FingerprintCache.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "fingerprints.json")
+
+    def test_put_get(self):
+        cache = FingerprintCache(self.path)
+        self.assertIsNone(cache.get("job"))
+        cache.put("job", "r1", "hash")
+        # a later put keeps what it does not set
+        cache.put("job", "r2")
+        entry = FingerprintCache(self.path).get("job")
+        self.assertEqual((entry["revision"], entry["values_hash"]), ("r2", "hash"))
+
+    def test_least_recently_used_evicted(self):
+        cache = FingerprintCache(self.path, max_entries=2)
+        times = iter(range(10))
+        with mock.patch("fingerprint.time.time", lambda: next(times)):
+            cache.put("a", "r")
+            cache.put("b", "r")
+            # read since: "b" is now the oldest
+            cache.get("a")
+            cache.put("c", "r")
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_hash_data(self):
+        table = pa.table({"id": [1, 2], "name": ["a", "b"]})
+        self.assertEqual(hash_data(table), hash_data(pa.table({"id": [1, 2], "name": ["a", "b"]})))
+        self.assertNotEqual(hash_data(table), hash_data(pa.table({"id": [1, 2], "name": ["a", "c"]})))
+        self.assertEqual(hash_data(table.to_pandas()), hash_data(table.to_pandas()))
+
+
+class TestUnchangedSources(FakeJobsTestCase):
+    """
+    Tests for the UNCHANGED and force paths of JobManager.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sheet = self.spreadsheet(URL, [["id", "name"], ["1", "a"], ["2", "b"]])
+
+    def run_job(self, force=False, **optional):
+        # every fake job config has the same revision: drop the cached one
+        if os.path.exists(settings.CONFIG_CACHE_FILE):
+            os.remove(settings.CONFIG_CACHE_FILE)
+        manager = self.manager([config_row(URL, TABLE, range="A:B", **optional)], force=force)
+        row = manager.job_config_handler.config[0]
+        # run again the same day
+        with mock.patch.object(manager.job_state, "done_on", return_value=False):
+            status = manager.run_job(row)[4]
+        return status, manager.fingerprints.get(WatermarkStore.job_key(row))
+
+    def test_unchanged_revision(self):
+        self.assertEqual(self.run_job()[0], "SUCCESS")
+        loads = len(self.client.jobs)
+        self.assertEqual(self.run_job()[0], "UNCHANGED")
+        self.assertEqual(len(self.client.jobs), loads)
+
+    def test_unchanged_values(self):
+        _, fingerprint = self.run_job()
+        # an edit that leaves the values alone
+        self.sheet.touch()
+        loads = len(self.client.jobs)
+        status, new_fingerprint = self.run_job()
+        self.assertEqual(status, "UNCHANGED")
+        self.assertEqual(len(self.client.jobs), loads)
+        self.assertNotEqual(new_fingerprint["revision"], fingerprint["revision"])
+        self.assertEqual(new_fingerprint["values_hash"], fingerprint["values_hash"])
+
+    def test_changed_values(self):
+        _, fingerprint = self.run_job()
+        self.sheet.worksheets["data"].rows[2] = ["2", "B"]
+        self.sheet.touch()
+        status, new_fingerprint = self.run_job()
+        self.assertEqual(status, "SUCCESS")
+        self.assertNotEqual(new_fingerprint["values_hash"], fingerprint["values_hash"])
+
+    def test_force(self):
+        self.run_job()
+        loads = len(self.client.jobs)
+        self.assertEqual(self.run_job(force=True)[0], "SUCCESS")
+        self.assertGreater(len(self.client.jobs), loads)
+
+    def test_changed_config(self):
+        self.run_job()
+        # the same sheet, table and revision read from another row or in another mode
+        self.assertEqual(self.run_job(startingrow="3")[0], "SUCCESS")
+        self.assertEqual(self.client.tables[TABLE].num_rows, 1)
+        self.assertEqual(self.run_job(mode="append")[0], "SUCCESS")
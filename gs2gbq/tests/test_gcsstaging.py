@@ -0,0 +1,133 @@
+"""
+Tests for the loads staged in Cloud Storage.
+"""
+import io
+import os
+import tempfile
+from unittest import mock
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from clients import registry
+from conf import settings
+from gcsstaging import LocalBucket, upload_shards
+from gshandler import APPEND_MODE, GCS_SINK, LOAD_SINK, GSHandler
+from ratelimit import BIGQUERY_LOAD, TokenBucket, limiter
+from .base_test import BaseTestCase
+
+TABLE = "project.dataset.table"
+
+
+class Job:
+    def __init__(self, error=None) -> None:
+        self.error = error
+
+    def result(self, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class FailingBucket(LocalBucket):
+    def upload(self, name, data):
+        if name.endswith("part-00002.parquet"):
+            raise ConnectionError("upload failed")
+        super().upload(name, data)
+
+
+class UriClient:
+    """Records the load jobs, reading the rows of the URIs from `bucket`."""
+
+    def __init__(self, bucket, fail_loads=False) -> None:
+        self.bucket = bucket
+        self.fail_loads = fail_loads
+        self.loads = []
+
+    def get_table(self, table_name):
+        return type("Table", (), {"schema": []})()
+
+    def delete_table(self, table_name, not_found_ok=False):
+        pass
+
+    def load_table_from_uri(self, source_uris, table_name, job_config=None):
+        rows = sum(pq.read_metadata(io.BytesIO(self.bucket.read(uri))).num_rows for uri in source_uris)
+        self.loads.append(("uri", table_name, len(source_uris), rows))
+        return Job(ConnectionError("connection reset") if self.fail_loads else None)
+
+    def load_table_from_file(self, file_obj, table_name, job_config=None):
+        self.loads.append(("file", table_name, 1, pq.read_metadata(file_obj).num_rows))
+        return Job()
+
+
+class TestGCSStaging(BaseTestCase):
+    """
+    Tests for upload_shards and the gcs sink of GSHandler.push_data_to_big_query.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.bucket = LocalBucket("staging", self.directory.name)
+        self.data = pa.table({"id": list(range(1000)), "name": [f"name {i}" for i in range(1000)]})
+        self.settings = mock.patch.multiple(settings, GCS_STAGING_BUCKET="staging", GCS_SHARD_BYTES=4000)
+        self.settings.start()
+        # keep the load job quota of the process for the other tests
+        self.quota = mock.patch.dict(limiter._buckets, {BIGQUERY_LOAD: TokenBucket(BIGQUERY_LOAD, 0)})
+        self.quota.start()
+
+    def tearDown(self):
+        self.quota.stop()
+        self.settings.stop()
+        registry.invalidate()
+        self.directory.cleanup()
+
+    def objects(self):
+        return [os.path.join(root, name) for root, _, names in os.walk(self.directory.name) for name in names]
+
+    def client(self, **kwargs):
+        client = UriClient(self.bucket, **kwargs)
+        credential_file = os.path.abspath(settings.CREDENTIAL_FILE)
+        registry._bigquery_clients[(credential_file, "project")] = client
+        registry._staging_buckets[(credential_file, "staging")] = self.bucket
+        return client
+
+    def test_upload_shards(self):
+        names = upload_shards(self.bucket, "prefix", self.data, 300, workers=3)
+        self.assertEqual(names, [f"prefix/part-{i:05d}.parquet" for i in range(4)])
+        shards = [pq.read_table(self.bucket.path(name)) for name in names]
+        self.assertTrue(pa.concat_tables(shards).equals(self.data))
+
+    def test_failed_upload_deletes_shards(self):
+        bucket = FailingBucket("staging", self.directory.name)
+        with self.assertRaises(ConnectionError):
+            upload_shards(bucket, "prefix", self.data, 100, workers=2)
+        self.assertEqual(self.objects(), [])
+
+    def test_gcs_sink_loads_all_shards_in_one_job(self):
+        client = self.client()
+        GSHandler("https://sheet", "data").push_data_to_big_query(self.data, TABLE, mode=APPEND_MODE, sink=GCS_SINK)
+        (load,) = client.loads
+        self.assertEqual(load[0], "uri")
+        self.assertGreater(load[2], 1)
+        self.assertEqual(load[3], 1000)
+        self.assertEqual(self.objects(), [])
+
+    def test_failed_load_deletes_shards(self):
+        self.client(fail_loads=True)
+        with self.assertRaises(ConnectionError):
+            GSHandler("https://sheet", "data").push_data_to_big_query(self.data, TABLE, mode=APPEND_MODE, sink=GCS_SINK)
+        self.assertEqual(self.objects(), [])
+
+    def test_load_sink_uses_bucket_above_min_bytes(self):
+        client = self.client()
+        handler = GSHandler("https://sheet", "data")
+        with mock.patch.object(settings, "GCS_MIN_BYTES", self.data.nbytes + 1):
+            handler.push_data_to_big_query(self.data, TABLE, mode=APPEND_MODE, sink=LOAD_SINK)
+        with mock.patch.object(settings, "GCS_MIN_BYTES", self.data.nbytes):
+            handler.push_data_to_big_query(self.data, TABLE, mode=APPEND_MODE, sink=LOAD_SINK)
+        self.assertEqual([load[0] for load in client.loads], ["file", "uri"])
+
+    def test_gcs_sink_needs_bucket(self):
+        with mock.patch.object(settings, "GCS_STAGING_BUCKET", ""):
+            with self.assertRaises(ValueError):
+                GSHandler("https://sheet", "data").push_data_to_big_query(self.data, TABLE, sink=GCS_SINK)
@@ -0,0 +1,119 @@
+"""
+Tests for the helpers of GSHandler.
+"""
+from unittest import mock
+
+import google.api_core.exceptions
+import pyarrow as pa
+from google.cloud import bigquery
+
+from conf import settings
+from gshandler import GSHandler, assemble_ranges, block_widths, data_nbytes, rows_per_chunk
+from .fake_jobs import PROJECT, FakeJobsTestCase
+from .base_test import BaseTestCase
+
+TABLE = f"{PROJECT}.dataset.table"
+
+
+class TestAssembleRanges(BaseTestCase):
+    """
+    Tests for assemble_ranges and block_widths.
+    """
+
+    def test_block_widths(self):
+        self.assertEqual(block_widths([[["a", "b"], ["c"]], [], [["d"], ["e", "f", "g"]]]), [2, 0, 3])
+
+    def test_ranges_of_different_lengths(self):
+        # the second range has fewer rows and a ragged row, the third is empty
+        blocks = [
+            [["id", "name"], ["1", "a"], ["2"], ["3", "c"]],
+            [["note"], ["x"]],
+            [],
+        ]
+        values = assemble_ranges(blocks)
+        self.assertEqual(values.shape, (4, 3))
+        self.assertEqual(
+            values.tolist(),
+            [["id", "name", "note"], ["1", "a", "x"], ["2", None, None], ["3", "c", None]],
+        )
+
+    def test_widths_forced(self):
+        blocks = [[["1", "a", "extra"]], [["x"], ["y"]]]
+        values = assemble_ranges(blocks, widths=[2, 2])
+        self.assertEqual(values.tolist(), [["1", "a", "x", None], [None, None, "y", None]])
+
+    def test_no_rows(self):
+        self.assertEqual(assemble_ranges([[], []], widths=[2, 1]).shape, (0, 3))
+        self.assertEqual(assemble_ranges([]).shape, (0, 0))
+
+
+class TestRowsPerChunk(BaseTestCase):
+    """
+    Tests for rows_per_chunk.
+    """
+
+    def test_rows_per_chunk(self):
+        data = pa.table({"id": list(range(100))})
+        size = data_nbytes(data)
+        self.assertEqual(rows_per_chunk(data, 0), 100)
+        self.assertEqual(rows_per_chunk(data, size), 100)
+        self.assertEqual(rows_per_chunk(data, size // 4), 25)
+        # evenly sized chunks rather than a small last one
+        self.assertEqual(rows_per_chunk(data, size // 3 + 1), 34)
+        self.assertEqual(rows_per_chunk(data, 1), 1)
+        self.assertEqual(rows_per_chunk(data.slice(0, 0), 10), 1)
+        self.assertEqual(rows_per_chunk(data.to_pandas(), 0), 100)
+
+
+class TestLoadInChunks(FakeJobsTestCase):
+    """
+    Tests for GSHandler._load_in_chunks.
+    """
+
+    def load(self, data, max_job_rows=None):
+        """Load `data`, the load jobs of more than `max_job_rows` rows failing as too large."""
+        load_job = GSHandler._load_job
+
+        def limited_load_job(handler, client, chunk, table_name, job_config):
+            if max_job_rows is not None and chunk.shape[0] > max_job_rows:
+                raise google.api_core.exceptions.from_http_status(413, "Request payload size exceeds the limit")
+            return load_job(handler, client, chunk, table_name, job_config)
+
+        job_config = bigquery.LoadJobConfig(write_disposition="WRITE_APPEND")
+        with mock.patch.object(GSHandler, "_load_job", limited_load_job):
+            GSHandler("https://fake/data", "data")._load_in_chunks(self.client, data, TABLE, job_config)
+        return [n_rows for table, n_rows in self.client.jobs if table == TABLE]
+
+    def test_one_job(self):
+        self.assertEqual(self.load(pa.table({"id": list(range(10))})), [10])
+
+    def test_split_by_size(self):
+        data = pa.table({"id": list(range(100))})
+        self.patch(mock.patch.object(settings, "LOAD_CHUNK_BYTES", data_nbytes(data) // 4))
+        self.assertEqual(self.load(data), [25, 25, 25, 25])
+        self.assertEqual(self.client.tables[TABLE].num_rows, 100)
+
+    def test_dataframe_split_by_size(self):
+        data = pa.table({"id": list(range(10))}).to_pandas()
+        self.patch(mock.patch.object(settings, "LOAD_CHUNK_BYTES", data_nbytes(data) // 2))
+        self.assertEqual(sum(self.load(data)), 10)
+        self.assertGreater(len(self.client.jobs), 1)
+
+    def test_too_large_halved(self):
+        self.assertEqual(self.load(pa.table({"id": list(range(10))}), max_job_rows=3), [2, 2, 2, 2, 2])
+        self.assertEqual(self.client.tables[TABLE].num_rows, 10)
+
+    def test_single_row_too_large(self):
+        with self.assertRaises(google.api_core.exceptions.GoogleAPICallError) as raised:
+            self.load(pa.table({"id": [1, 2]}), max_job_rows=0)
+        self.assertEqual(raised.exception.code, 413)
+
+    def test_other_error_raised(self):
+        def failing_load_job(*args):
+            raise google.api_core.exceptions.BadRequest("bad row")
+
+        with mock.patch.object(GSHandler, "_load_job", failing_load_job):
+            with self.assertRaises(google.api_core.exceptions.BadRequest):
+                GSHandler("https://fake/data", "data")._load_in_chunks(
+                    self.client, pa.table({"id": [1]}), TABLE, bigquery.LoadJobConfig()
+                )
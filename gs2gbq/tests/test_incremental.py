@@ -0,0 +1,197 @@
+"""
+Tests for the incremental (append and merge) ingestion modes.
+"""
+import os
+import tempfile
+
+import pyarrow as pa
+from google.cloud import bigquery
+
+from clients import registry
+from conf import settings
+from fakes import install
+from gshandler import APPEND_MODE, MERGE_MODE, STORAGE_WRITE_SINK, GSHandler, merge_statement, offset_range
+from schema import INT64, STRING, schema_types
+from storagewrite import LocalWriteClient, table_path
+from watermark import WatermarkStore
+from .fake_jobs import PROJECT, FakeJobsTestCase, config_row
+from .base_test import BaseTestCase
+
+URL = "https://fake/data"
+TABLE = f"{PROJECT}.dataset.table"
+
+
+class TestRanges(BaseTestCase):
+    """
+    Tests for offset_range and merge_statement.
+    """
+
+    def test_offset_range(self):
+        self.assertEqual(offset_range("A:H", 5), "A5:H")
+        self.assertEqual(offset_range("B", 1, 1), "B1:B1")
+        self.assertEqual(offset_range(" C3:D ", 10, 20), "C10:D20")
+        with self.assertRaises(ValueError):
+            offset_range("Sheet1!A:B", 2)
+
+    def test_merge_statement(self):
+        self.assertEqual(
+            merge_statement("p.d.t", "p.d.t__delta", ["id", "name"], "id"),
+            "MERGE `p.d.t` T USING `p.d.t__delta` S ON T.`id` = S.`id`"
+            " WHEN MATCHED THEN UPDATE SET `name` = S.`name`"
+            " WHEN NOT MATCHED THEN INSERT (`id`, `name`) VALUES (`id`, `name`)",
+        )
+
+    def test_merge_statement_key_only(self):
+        self.assertEqual(
+            merge_statement("p.d.t", "p.d.s", ["id"], "id"),
+            "MERGE `p.d.t` T USING `p.d.s` S ON T.`id` = S.`id` WHEN NOT MATCHED THEN INSERT (`id`) VALUES (`id`)",
+        )
+
+
+class TestWatermarkStore(BaseTestCase):
+    """
+    Tests for WatermarkStore.
+    """
+
+    def test_set_get_reset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "watermarks.json")
+            store = WatermarkStore(path)
+            self.assertIsNone(store.get("job"))
+            store.set("job", 12)
+            store.set("other", 3)
+            store.set("job", 20)
+            # kept in the file
+            self.assertEqual(WatermarkStore(path).get("job"), 20)
+            store.reset("job")
+            store.reset("missing")
+            self.assertIsNone(WatermarkStore(path).get("job"))
+            self.assertEqual(store.get("other"), 3)
+
+    def test_job_key(self):
+        row = config_row(URL, TABLE, range="A:B")
+        self.assertEqual(WatermarkStore.job_key(row), f"{URL}|data|A:B|{TABLE}|2|full")
+        self.assertEqual(WatermarkStore.job_key(dict(row, mode=" Append ")), f"{URL}|data|A:B|{TABLE}|2|append")
+        self.assertNotEqual(WatermarkStore.job_key(dict(row, startingrow="3")), WatermarkStore.job_key(row))
+
+    def test_adopt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = WatermarkStore(os.path.join(directory, "watermarks.json"))
+            store.set("old", 12)
+            store.adopt("new", "old")
+            self.assertEqual((store.get("old"), store.get("new")), (None, 12))
+            store.set("old", 3)
+            store.adopt("new", "old")
+            self.assertEqual(store.get("new"), 12)
+
+    def test_truncated_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "watermarks.json")
+            with open(path, "w") as f:
+                f.write('{"job": 1')
+            store = WatermarkStore(path)
+            self.assertIsNone(store.get("job"))
+            store.set("job", 5)
+            self.assertEqual(WatermarkStore(path).get("job"), 5)
+
+
+class TestIncrementalReads(FakeJobsTestCase):
+    """
+    Tests for GSHandler.read_values with `from_row`.
+    """
+
+    def test_two_ranges_from_row(self):
+        rows = [["id", "name", "skipped", "note"]] + [[str(i), f"n{i}", "", "x" if i == 2 else ""] for i in range(1, 6)]
+        self.spreadsheet(URL, rows)
+        headers, values = GSHandler(URL, "data", "A:B,D").read_values(from_row=4)
+        self.assertEqual(headers, ["id", "name", "note"])
+        # the note range is empty past row 3 but keeps its column
+        self.assertEqual(values.tolist(), [["3", "n3", None], ["4", "n4", None], ["5", "n5", None]])
+
+
+class TestIncrementalLoads(FakeJobsTestCase):
+    """
+    Tests for the append and merge branches of push_data_to_big_query.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.handler = GSHandler(URL, "data")
+        schema = [bigquery.SchemaField("id", "INTEGER"), bigquery.SchemaField("name", "STRING")]
+        self.handler.push_data_to_big_query(pa.table({"id": [1, 2], "name": ["a", "b"]}), TABLE, schema)
+
+    def test_append(self):
+        data = pa.table({"id": ["3"], "name": ["c"]})
+        self.handler.push_data_to_big_query(data, TABLE, mode=APPEND_MODE)
+        table = self.client.tables[TABLE]
+        self.assertEqual(table.num_rows, 3)
+        # the delta is cast to the types already in the table
+        self.assertEqual(schema_types(table.schema), [INT64, STRING])
+
+    def test_append_creates_missing_table(self):
+        self.client.tables.clear()
+        self.handler.push_data_to_big_query(pa.table({"id": [3]}), TABLE, mode=APPEND_MODE)
+        self.assertEqual(self.client.tables[TABLE].num_rows, 1)
+
+    def test_merge(self):
+        self.client.jobs.clear()
+        data = pa.table({"id": [2, 3], "name": ["B", "c"]})
+        self.handler.push_data_to_big_query(data, TABLE, mode=MERGE_MODE, key="id")
+        delta = f"{TABLE}__delta"
+        self.assertEqual(
+            self.client.jobs,
+            [(delta, 2), ("query", merge_statement(TABLE, delta, ["id", "name"], "id"))],
+        )
+        self.assertNotIn(delta, self.client.tables)
+
+    def test_merge_new_column(self):
+        data = pa.table({"id": [2, 3], "name": ["B", "c"], "note": ["x", None]})
+        schema = [bigquery.SchemaField("id", "INTEGER"), bigquery.SchemaField("name", "STRING"), bigquery.SchemaField("note", "STRING")]
+        self.handler.push_data_to_big_query(data, TABLE, schema, mode=MERGE_MODE, key="id")
+        self.assertEqual([field.name for field in self.client.tables[TABLE].schema], ["id", "name", "note"])
+        self.assertEqual(self.client.jobs[-1], ("query", merge_statement(TABLE, f"{TABLE}__delta", ["id", "name", "note"], "id")))
+
+    def test_new_column_without_type(self):
+        with self.assertRaises(ValueError):
+            self.handler.push_data_to_big_query(pa.table({"id": [3], "note": ["x"]}), TABLE, mode=MERGE_MODE, key="id")
+
+    def test_storage_write_new_column(self):
+        writer = LocalWriteClient()
+        install(registry, settings.CREDENTIAL_FILE, storage_write_client=writer)
+        data = pa.table({"id": [3], "name": ["c"], "note": ["x"]})
+        schema = [bigquery.SchemaField("id", "INTEGER"), bigquery.SchemaField("name", "STRING"), bigquery.SchemaField("note", "STRING")]
+        self.handler.push_data_to_big_query(data, TABLE, schema, mode=APPEND_MODE, sink=STORAGE_WRITE_SINK)
+        self.assertEqual([field.name for field in self.client.tables[TABLE].schema], ["id", "name", "note"])
+        self.assertEqual(writer.rows(table_path(TABLE)).column("note").to_pylist(), ["x"])
+
+    def test_merge_needs_key(self):
+        with self.assertRaises(ValueError):
+            self.handler.push_data_to_big_query(pa.table({"id": [1]}), TABLE, mode=MERGE_MODE)
+
+
+class TestWatermarks(FakeJobsTestCase):
+    """
+    Tests for the watermark of append jobs across runs.
+    """
+
+    def run_job(self):
+        manager = self.manager([config_row(URL, TABLE, range="A:B", mode=APPEND_MODE)], force=True)
+        manager.run()
+        return manager.watermarks.get(WatermarkStore.job_key(manager.job_config_handler.config[0]))
+
+    def test_advance_and_reset(self):
+        sheet = self.spreadsheet(URL, [["id", "name"]] + [[str(i), f"n{i}"] for i in range(1, 4)])
+        self.assertEqual(self.run_job(), 4)
+        self.assertEqual(self.client.tables[TABLE].num_rows, 3)
+
+        sheet.worksheets["data"].rows += [["4", "n4"], ["5", "n5"]]
+        sheet.touch()
+        self.assertEqual(self.run_job(), 6)
+        # only the new rows were appended
+        self.assertEqual(self.client.jobs[-1], (TABLE, 2))
+        self.assertEqual(self.client.tables[TABLE].num_rows, 5)
+
+        # without a watermark the table is loaded again from the start
+        WatermarkStore(os.path.join(self.directory, "watermarks.json")).reset(f"{URL}|data|A:B|{TABLE}|2|append")
+        self.assertEqual(self.run_job(), 6)
+        self.assertEqual(self.client.tables[TABLE].num_rows, 5)
@@ -0,0 +1,151 @@
+"""
+Tests for loading the job config sheet.
+"""
+import os
+import tempfile
+from unittest import mock
+
+from clients import registry
+from conf import settings
+from configcache import ConfigCache
+from fakes import FakeSpreadsheet, install
+from gshandler import GSHandler
+from jobconfig import DEFAULT_CONFIG_RANGE, JOB_CONFIG_SHEET, OPTIONAL_COLUMNS, PASS, REQUIRED_COLUMNS, ConfigLoader
+from manager import JobContext
+from ratelimit import SHEETS_READ, TokenBucket, limiter
+from .base_test import BaseTestCase
+
+URL = "https://config"
+
+
+class TestConfigLoader(BaseTestCase):
+    """
+    Tests for ConfigLoader.
+    """
+
+    def setUp(self):
+        quota = mock.patch.dict(limiter._buckets, {SHEETS_READ: TokenBucket(SHEETS_READ, 0)})
+        quota.start()
+        self.addCleanup(quota.stop)
+        self.addCleanup(registry.invalidate)
+
+    def load(self, rows):
+        install(registry, settings.CREDENTIAL_FILE, spreadsheets={URL: FakeSpreadsheet({"jobs": rows})})
+        return ConfigLoader(URL)
+
+    def test_default_range_covers_every_column(self):
+        self.assertEqual(DEFAULT_CONFIG_RANGE, "A:L")
+
+    def test_optional_columns_reach_job_context(self):
+        row = ["https://sheet", "dataset.table", "1", "A:C", "* * * * *", "job", "data", "2"]
+        config = self.load(
+            [
+                REQUIRED_COLUMNS + OPTIONAL_COLUMNS,
+                row + ["merge", "id", "storage_write", "export"],
+            ]
+        )
+        self.assertEqual(config.sanity_check().outcome, PASS)
+        ctx = JobContext(config.config[0])
+        self.assertEqual((ctx.mode, ctx.key, ctx.sink, ctx.fetch), ("merge", "id", "storage_write", "export"))
+
+    def test_rows(self):
+        row = ["https://sheet", "dataset.table", "1", "A:C", "* * * * *", "job", "data", "2"]
+        config = self.load([REQUIRED_COLUMNS, row, row[:5]])
+        self.assertEqual(len(config.config), 2)
+        job = config.config[0]
+        self.assertEqual((job["table"], job.job_id, job.mode), ("dataset.table", "1", ""))
+        # the cells past the last filled one are None, like the API leaves them out
+        self.assertIsNone(config.config[1].sheet)
+        with self.assertRaises(AttributeError):
+            job.missing
+
+    def test_missing_optional_columns_default(self):
+        row = ["https://sheet", "dataset.table", "1", "A:C", "* * * * *", "job", "data", "2"]
+        config = self.load([REQUIRED_COLUMNS, row])
+        self.assertEqual(config.sanity_check().outcome, PASS)
+        ctx = JobContext(config.config[0])
+        self.assertEqual((ctx.mode, ctx.key, ctx.sink, ctx.fetch), ("full", None, "load", settings.FETCH_ENGINE))
+
+    def test_fetch_column_read_alone(self):
+        # The last column, with the other optional ones left empty.
+        row = ["https://sheet", "dataset.table", "1", "A:C", "* * * * *", "job", "data", "2"]
+        config = self.load([REQUIRED_COLUMNS + OPTIONAL_COLUMNS, row + ["", "", "", "values"]])
+        ctx = JobContext(config.config[0])
+        self.assertEqual((ctx.mode, ctx.sink, ctx.fetch), ("full", "load", "values"))
+
+
+class TestConfigCache(BaseTestCase):
+    """
+    Tests for ConfigLoader reading the job config through ConfigCache.
+    """
+
+    def setUp(self):
+        quota = mock.patch.dict(limiter._buckets, {SHEETS_READ: TokenBucket(SHEETS_READ, 0)})
+        quota.start()
+        self.addCleanup(quota.stop)
+        self.addCleanup(registry.invalidate)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "jobconfig.json")
+        self.key = ConfigCache.key(URL, JOB_CONFIG_SHEET, DEFAULT_CONFIG_RANGE)
+        self.sheet = FakeSpreadsheet({"jobs": [REQUIRED_COLUMNS, self.job("job")]})
+        install(registry, settings.CREDENTIAL_FILE, spreadsheets={URL: self.sheet})
+
+    @staticmethod
+    def job(name):
+        return ["https://sheet", "dataset.table", "1", "A:C", "* * * * *", name, "data", "2"]
+
+    def load(self, ttl=0):
+        config = ConfigLoader(URL, cache=ConfigCache(self.path, ttl))
+        return [row["job_name"] for row in config.config]
+
+    def edit(self, rows):
+        self.sheet.worksheets["jobs"].rows = rows
+        self.sheet.touch()
+
+    def test_fresh_copy_used(self):
+        self.assertEqual(self.load(ttl=300), ["job"])
+        self.edit([REQUIRED_COLUMNS, self.job("edited")])
+        requests = self.sheet.requests
+        self.assertEqual(self.load(ttl=300), ["job"])
+        self.assertEqual(self.sheet.requests, requests)
+
+    def test_unchanged_revision_revalidated(self):
+        self.load()
+        fetched_at = ConfigCache(self.path).get(self.key)["fetched_at"]
+        requests = self.sheet.requests
+        self.assertEqual(self.load(), ["job"])
+        # only the revision was read
+        self.assertEqual(self.sheet.requests, requests)
+        self.assertGreaterEqual(ConfigCache(self.path).get(self.key)["fetched_at"], fetched_at)
+
+    def test_changed_revision_read(self):
+        self.load()
+        self.edit([REQUIRED_COLUMNS, self.job("edited")])
+        self.assertEqual(self.load(), ["edited"])
+        columns, rows = ConfigCache.table(ConfigCache(self.path).get(self.key))
+        self.assertEqual(rows[0][columns.index("job_name")], "edited")
+
+    def test_last_good_copy_on_api_failure(self):
+        self.load()
+        with mock.patch.object(GSHandler, "revision", side_effect=ConnectionError("offline")):
+            self.assertEqual(self.load(), ["job"])
+
+    def test_api_failure_without_copy(self):
+        with mock.patch.object(GSHandler, "revision", side_effect=ConnectionError("offline")):
+            with self.assertRaises(ConnectionError):
+                self.load()
+
+    def test_only_passing_config_cached(self):
+        self.edit([REQUIRED_COLUMNS[1:], self.job("broken")[1:]])
+        config = ConfigLoader(URL, cache=ConfigCache(self.path, 0))
+        self.assertNotEqual(config.sanity_check().outcome, PASS)
+        self.assertIsNone(ConfigCache(self.path).get(self.key))
+
+        self.edit([REQUIRED_COLUMNS, self.job("job")])
+        self.load()
+        self.edit([REQUIRED_COLUMNS[1:], self.job("broken")[1:]])
+        self.load()
+        # the broken config did not replace the last good copy
+        with mock.patch.object(GSHandler, "revision", side_effect=ConnectionError("offline")):
+            self.assertEqual(self.load(), ["job"])
@@ -0,0 +1,78 @@
+"""
+Tests for the SQLite job state store.
+"""
+import os
+import tempfile
+from datetime import date, timedelta
+
+from jobstate import LOAD, RUNNING, JobStateStore
+from .base_test import BaseTestCase
+
+KEY = "https://sheet|data|A:C|project.dataset.table"
+
+
+class TestJobStateStore(BaseTestCase):
+    """
+    Tests for JobStateStore.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = JobStateStore(os.path.join(self.directory.name, "state", "jobs.sqlite"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run_lifecycle(self):
+        self.assertIsNone(self.store.get(KEY))
+        self.store.start(KEY, "run-1", "rev-1")
+        self.store.phase(KEY, "run-1", LOAD)
+        state = self.store.get(KEY)
+        self.assertEqual((state["phase"], state["status"]), (LOAD, RUNNING))
+        self.assertFalse(self.store.done_on(KEY))
+
+        self.store.loaded(KEY, "run-1", 120, "hash")
+        self.store.finish(KEY, "run-1", "SUCCESS")
+        self.assertTrue(self.store.done_on(KEY))
+        self.assertFalse(self.store.done_on(KEY, date.today() + timedelta(days=1)))
+        self.assertEqual(self.store.get(KEY)["rows_loaded"], 120)
+
+    def test_failed_job_not_done(self):
+        self.store.start(KEY, "run-1")
+        self.store.finish(KEY, "run-1", "FAIL")
+        self.assertFalse(self.store.done_on(KEY))
+
+    def test_only_own_run_finishes(self):
+        self.store.start(KEY, "run-2")
+        self.store.finish(KEY, "run-1", "SUCCESS")
+        self.assertEqual(self.store.get(KEY)["status"], RUNNING)
+
+    def test_resume_point(self):
+        self.store.start(KEY, "run-1", "rev-1")
+        self.store.checkpoint(KEY, "run-1", 1000, 1002)
+        # the process died: no finish
+        self.assertEqual(self.store.resume_point(KEY, "rev-1"), (1000, 1002))
+        self.assertIsNone(self.store.resume_point(KEY, "rev-2"))
+
+        self.store.start(KEY, "run-2", "rev-1", keep_offset=True)
+        self.assertEqual(self.store.resume_point(KEY, "rev-1"), (1000, 1002))
+        self.store.start(KEY, "run-3", "rev-1")
+        self.assertIsNone(self.store.resume_point(KEY, "rev-1"))
+
+    def test_no_resume_after_success(self):
+        self.store.start(KEY, "run-1", "rev-1")
+        self.store.checkpoint(KEY, "run-1", 1000, 1002)
+        self.store.loaded(KEY, "run-1", 2000)
+        self.store.finish(KEY, "run-1", "SUCCESS")
+        self.assertIsNone(self.store.resume_point(KEY, "rev-1"))
+
+    def test_interrupted(self):
+        self.assertFalse(self.store.interrupted(KEY))
+        self.store.start(KEY, "run-1", "rev-1")
+        self.assertFalse(self.store.interrupted(KEY))
+        self.store.checkpoint(KEY, "run-1", 1000, 1002)
+        self.store.finish(KEY, "run-1", "FAIL")
+        # of any revision
+        self.assertTrue(self.store.interrupted(KEY))
+        self.store.start(KEY, "run-2", "rev-2")
+        self.assertFalse(self.store.interrupted(KEY))
@@ -0,0 +1,97 @@
+"""
+Tests for the batched waiting on load jobs.
+"""
+import time
+
+from executor import JobTimeout
+from loadbatch import LoadBatch, PendingLoad
+from .base_test import BaseTestCase
+
+
+class Job:
+    """A load job done after `seconds`, failing with `error` if given.
+
+    `cancel` stops it at once unless `commits_on_cancel`, in which case it
+    still succeeds after `seconds`.
+    """
+
+    def __init__(self, seconds=0.0, error=None, commits_on_cancel=False) -> None:
+        self.done_at = time.monotonic() + seconds
+        self.error = error
+        self.commits_on_cancel = commits_on_cancel
+        self.cancelled = False
+        self.polls = 0
+
+    def cancel(self):
+        self.cancelled = True
+        if not self.commits_on_cancel:
+            self.error = RuntimeError("Job execution was cancelled")
+            self.done_at = time.monotonic()
+        return True
+
+    def done(self):
+        self.polls += 1
+        return time.monotonic() >= self.done_at
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class TestLoadBatch(BaseTestCase):
+    """
+    Tests for LoadBatch.
+    """
+
+    def test_wait_resolves_every_load(self):
+        batch = LoadBatch(poll_interval=0.01)
+        finished = []
+        loads = [
+            batch.add(PendingLoad(f"p.d.t{i}", Job(0.05 * i), lambda i=i: finished.append(i) or f"ok {i}"))
+            for i in range(3)
+        ]
+        failed = batch.add(PendingLoad("p.d.failed", Job(error=ValueError("bad row")), lambda: "not called"))
+        start = time.monotonic()
+        self.assertEqual(len(batch.wait()), 4)
+        # waited on together, not one after the other
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual([load.outcome for load in loads], ["ok 0", "ok 1", "ok 2"])
+        self.assertEqual(sorted(finished), [0, 1, 2])
+        self.assertIsInstance(failed.outcome, ValueError)
+        self.assertEqual(len(batch), 0)
+
+    def test_timeout_cancels_job(self):
+        batch = LoadBatch(poll_interval=0.01, timeout=0.05)
+        job = Job(10)
+        load = batch.add(PendingLoad("p.d.t", job, lambda: "ok"))
+        batch.wait()
+        self.assertTrue(job.cancelled)
+        self.assertIsInstance(load.outcome, JobTimeout)
+
+    def test_job_committed_while_cancelled(self):
+        # the rows are in the table: the load is finished like any other
+        batch = LoadBatch(poll_interval=0.01, timeout=0.05)
+        job = Job(0.1, commits_on_cancel=True)
+        load = batch.add(PendingLoad("p.d.t", job, lambda: "ok"))
+        batch.wait()
+        self.assertTrue(job.cancelled)
+        self.assertEqual(load.outcome, "ok")
+
+    def test_cancel_not_taking_effect(self):
+        batch = LoadBatch(poll_interval=0.01, timeout=0.05, cancel_grace=0.05)
+        load = batch.add(PendingLoad("p.d.t", Job(10, commits_on_cancel=True), lambda: "ok"))
+        start = time.monotonic()
+        batch.wait()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertIsInstance(load.outcome, JobTimeout)
+        self.assertIn("may yet be committed", str(load.outcome))
+
+    def test_wait_table(self):
+        batch = LoadBatch(poll_interval=0.01)
+        load = batch.add(PendingLoad("p.d.T", Job(0.02), lambda: "ok"))
+        other = batch.add(PendingLoad("p.d.other", Job(), lambda: "ok"))
+        batch.wait_table("p.d.t")
+        self.assertEqual(load.outcome, "ok")
+        self.assertIsNone(other.outcome)
+        self.assertEqual(batch.wait(), [other])
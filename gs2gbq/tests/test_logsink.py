@@ -0,0 +1,122 @@
+"""
+Tests for the buffered run log and its sinks.
+"""
+import csv
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from logsink import FILE_BACKEND, JSONL_BACKEND, BufferedLogSink, FileSink, JsonlSink, make_sink
+from .base_test import BaseTestCase
+
+
+class Sink:
+    """Keep the rows of every flush, failing while `error` is set."""
+
+    def __init__(self) -> None:
+        self.flushes = []
+        self.error = None
+
+    def write_rows(self, rows):
+        if self.error is not None:
+            raise self.error
+        self.flushes.append(rows)
+
+
+class TestBufferedLogSink(BaseTestCase):
+    """
+    Tests for BufferedLogSink.
+    """
+
+    def setUp(self):
+        self.sink = Sink()
+        # not flushed at the exit of the test run
+        patcher = mock.patch("logsink.atexit.register")
+        self.register = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flush_rows(self):
+        buffer = BufferedLogSink(self.sink, flush_rows=3)
+        for i in range(7):
+            buffer.write_row([i])
+        self.assertEqual(self.sink.flushes, [[[0], [1], [2]], [[3], [4], [5]]])
+        buffer.flush()
+        self.assertEqual(self.sink.flushes[-1], [[6]])
+        # nothing left to write
+        buffer.flush()
+        self.assertEqual(len(self.sink.flushes), 3)
+
+    def test_flush_interval(self):
+        buffer = BufferedLogSink(self.sink, flush_rows=0, flush_interval=0.05)
+        buffer.write_row(["first"])
+        buffer.write_row(["second"])
+        self.assertEqual(self.sink.flushes, [])
+        time.sleep(0.06)
+        buffer.write_row(["late"])
+        self.assertEqual(self.sink.flushes, [[["first"], ["second"], ["late"]]])
+        # the interval starts again from the next row
+        buffer.write_row(["next"])
+        self.assertEqual(len(self.sink.flushes), 1)
+
+    def test_failed_flush_keeps_rows(self):
+        buffer = BufferedLogSink(self.sink, flush_rows=0)
+        buffer.write_row(["a"])
+        self.sink.error = ConnectionError("quota exceeded")
+        with self.assertRaises(ConnectionError):
+            buffer.flush()
+        buffer.write_row(["b"])
+        self.sink.error = None
+        buffer.flush()
+        self.assertEqual(self.sink.flushes, [[["a"], ["b"]]])
+
+    def test_flush_at_exit(self):
+        buffer = BufferedLogSink(self.sink, flush_rows=0)
+        self.register.assert_called_once_with(buffer._flush_at_exit)
+        buffer.write_row(["a"])
+        buffer._flush_at_exit()
+        self.assertEqual(self.sink.flushes, [[["a"]]])
+
+    def test_failed_flush_at_exit_logs_rows(self):
+        buffer = BufferedLogSink(self.sink, flush_rows=0)
+        buffer.write_row(["lost"])
+        self.sink.error = ConnectionError("offline")
+        with self.assertLogs("logsink", "ERROR") as logs:
+            buffer._flush_at_exit()
+        self.assertIn("Could not flush 1 log rows: offline", logs.output[0])
+        self.assertIn("['lost']", logs.output[1])
+
+
+class TestSinks(BaseTestCase):
+    """
+    Tests for FileSink, JsonlSink and make_sink.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_file_sink(self):
+        path = os.path.join(self.directory, "log.csv")
+        sink = make_sink(FILE_BACKEND, path)
+        self.assertIsInstance(sink, FileSink)
+        sink.write_rows([["job", 1], ["other, job", 2]])
+        sink.write_rows([["last", 3]])
+        with open(path, newline="") as f:
+            self.assertEqual(list(csv.reader(f)), [["job", "1"], ["other, job", "2"], ["last", "3"]])
+
+    def test_jsonl_sink(self):
+        path = os.path.join(self.directory, "log.jsonl")
+        sink = make_sink(JSONL_BACKEND, path)
+        self.assertIsInstance(sink, JsonlSink)
+        sink.write_rows([["job", 1], ["other", None]])
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["row"] for line in lines], [["job", 1], ["other", None]])
+        self.assertIn("time", lines[0])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            make_sink("syslog", "target")
@@ -0,0 +1,34 @@
+"""
+Tests for the job metrics in metrics.py.
+"""
+import metrics
+from .base_test import BaseTestCase
+
+
+class TestRecording(BaseTestCase):
+    """
+    Tests for the recording helpers.
+    """
+
+    def test_records_into_current_job(self):
+        job_metrics = metrics.JobMetrics({"job_id": 1, "job_name": "a", "table": "d.t"})
+        with metrics.recording(job_metrics):
+            with metrics.timer(metrics.FETCH):
+                pass
+            metrics.count(metrics.ROWS, 10)
+            metrics.count_call("sheets_read")
+            metrics.count_call("sheets_read")
+        metrics.count(metrics.ROWS, 5)  # outside of a job: ignored
+        data = job_metrics.to_dict()
+        self.assertIn(metrics.FETCH, data["phases"])
+        self.assertEqual(data["counters"], {metrics.ROWS: 10})
+        self.assertEqual(data["api_calls"], {"sheets_read": 2})
+
+    def test_prometheus_text(self):
+        job_metrics = metrics.JobMetrics({"job_id": 1, "job_name": 'say "hi"', "table": "d.t"})
+        job_metrics.count(metrics.ROWS, 3)
+        job_metrics.finish("SUCCESS")
+        text = metrics.prometheus_text([job_metrics], run_time=1)
+        self.assertIn('gs2gbq_job_rows{job_id="1",job_name="say \\"hi\\"",table="d.t"} 3', text)
+        self.assertIn('gs2gbq_job_success{job_id="1",job_name="say \\"hi\\"",table="d.t"} 1', text)
+        self.assertTrue(text.endswith("gs2gbq_last_run_timestamp_seconds 1\n"))
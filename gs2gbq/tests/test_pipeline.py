@@ -0,0 +1,74 @@
+"""
+Tests for the asyncio job pipeline.
+"""
+import time
+
+from executor import JobTimeout
+from pipeline import AsyncPipeline
+from .base_test import BaseTestCase
+
+
+class Context:
+    def __init__(self, job) -> None:
+        self.job = job
+        self.result = "skipped" if job.get("skip") else None
+        self.stream = False
+        self.headers = self.values = None
+
+
+def prepare(job):
+    return Context(job)
+
+
+def fetch(ctx):
+    if ctx.job.get("fail"):
+        raise ValueError("unreadable")
+    time.sleep(ctx.job.get("read", 0))
+    ctx.headers, ctx.values = ["a"], [ctx.job["name"]]
+
+
+def transform(headers, values):
+    return [v.upper() for v in values], headers
+
+
+def pipeline(load, **kwargs):
+    return AsyncPipeline(prepare, fetch, transform, load, transform_processes=1, **kwargs)
+
+
+class TestAsyncPipeline(BaseTestCase):
+    """
+    Tests for AsyncPipeline.
+    """
+
+    def test_results_in_order(self):
+        """Test that results come back in job order whatever the stage they stop in."""
+        jobs = [
+            {"name": "x", "table": "d.t1", "read": 0.2},
+            {"name": "y", "table": "d.t2", "skip": True},
+            {"name": "z", "table": "d.t3", "fail": True},
+            {"name": "w", "table": "d.t4"},
+        ]
+        results = [r for _, r in pipeline(lambda ctx, data, schema: data[0]).map(jobs)]
+        self.assertEqual(results[:2], ["X", "skipped"])
+        self.assertIsInstance(results[2], ValueError)
+        self.assertEqual(results[3], "W")
+
+    def test_same_table_serialized(self):
+        """Test that two jobs on one table never load at the same time."""
+        running = []
+
+        def load(ctx, data, schema):
+            running.append(ctx.job["name"])
+            self.assertEqual(len(running), 1)
+            time.sleep(0.1)
+            running.remove(ctx.job["name"])
+            return data[0]
+
+        jobs = [{"name": n, "table": "d.t"} for n in "abc"]
+        self.assertEqual([r for _, r in pipeline(load).map(jobs)], ["A", "B", "C"])
+
+    def test_timeout(self):
+        jobs = [{"name": "slow", "table": "d.t", "read": 1}, {"name": "fast", "table": "d.u"}]
+        results = [r for _, r in pipeline(lambda ctx, data, schema: data[0], job_timeout=0.3).map(jobs)]
+        self.assertIsInstance(results[0], JobTimeout)
+        self.assertEqual(results[1], "FAST")
@@ -0,0 +1,95 @@
+"""
+Tests for the rate limiter in ratelimit.py.
+"""
+import google.api_core.exceptions
+
+from ratelimit import RateLimiter, TokenBucket, is_rate_limited, retry_after
+from .base_test import BaseTestCase
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code, headers=None) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TestTokenBucket(BaseTestCase):
+    """
+    Tests for TokenBucket.
+    """
+
+    def test_burst_then_rate(self):
+        """Test that calls beyond the burst are spaced at the bucket rate."""
+        clock = FakeClock()
+        bucket = TokenBucket("read", per_minute=60, burst=2, clock=clock, sleep=clock.sleep)
+        waits = [bucket.acquire() for _ in range(4)]
+        self.assertEqual(waits, [0, 0, 1, 1])
+        self.assertEqual(bucket.stats()["calls"], 4)
+        self.assertEqual(bucket.stats()["waited"], 2)
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket("read", per_minute=0, clock=clock, sleep=clock.sleep)
+        bucket.pause(5)
+        self.assertEqual(bucket.acquire(), 5)
+        self.assertEqual(bucket.acquire(), 0)
+
+
+class TestRateLimiter(BaseTestCase):
+    """
+    Tests for RateLimiter.
+    """
+
+    def test_retries_rate_limited_calls(self):
+        limiter = RateLimiter({"load": 0}, max_retries=2)
+        clock = FakeClock()
+        limiter._buckets["load"] = TokenBucket("load", 0, clock=clock, sleep=clock.sleep)
+        error = google.api_core.exceptions.TooManyRequests("slow down", response=Response(429, {"Retry-After": "3"}))
+        outcomes = [error, "done"]
+
+        def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(limiter.call("load", call), "done")
+        self.assertGreaterEqual(clock.now, 3)
+        self.assertEqual(limiter.stats()["load"]["throttled"], 1)
+
+    def test_other_errors_raised(self):
+        limiter = RateLimiter({})
+
+        def call():
+            raise google.api_core.exceptions.BadRequest("bad")
+
+        with self.assertRaises(google.api_core.exceptions.BadRequest):
+            limiter.call("load", call)
+
+
+class TestErrors(BaseTestCase):
+    """
+    Tests for the rate limit error helpers.
+    """
+
+    def test_is_rate_limited(self):
+        quota = google.api_core.exceptions.Forbidden("quota", errors=[{"reason": "quotaExceeded"}])
+        rate = google.api_core.exceptions.Forbidden("rate", errors=[{"reason": "rateLimitExceeded"}])
+        self.assertFalse(is_rate_limited(quota))
+        self.assertTrue(is_rate_limited(rate))
+
+    def test_retry_after(self):
+        error = google.api_core.exceptions.TooManyRequests("slow down", response=Response(429, {"Retry-After": "7"}))
+        self.assertEqual(retry_after(error), 7)
+        self.assertIsNone(retry_after(google.api_core.exceptions.TooManyRequests("slow down")))
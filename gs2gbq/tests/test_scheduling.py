@@ -0,0 +1,98 @@
+"""
+Tests for the schedules in scheduling.py and the daemon running them.
+"""
+import itertools
+import time as real_time
+from datetime import date, datetime, time
+from types import SimpleNamespace
+from unittest import mock
+
+import manager
+from conf import settings
+from scheduling import ScheduleIndex, compile_schedule
+from .fake_jobs import PROJECT, FakeJobsTestCase, config_row
+from .base_test import BaseTestCase
+
+URL = "https://fake/data"
+TABLE = f"{PROJECT}.dataset.table"
+
+
+class TestCompileSchedule(BaseTestCase):
+    """
+    Tests for compile_schedule.
+    """
+
+    def test_expressions(self):
+        monday, wednesday = date(2024, 1, 1), date(2024, 1, 3)
+        self.assertTrue(compile_schedule("d").matches(monday))
+        self.assertTrue(compile_schedule("Mo, We").matches(wednesday))
+        self.assertFalse(compile_schedule("Mo,We").matches(date(2024, 1, 2)))
+        self.assertTrue(compile_schedule("m").matches(monday))
+        self.assertFalse(compile_schedule("m").matches(wednesday))
+        self.assertTrue(compile_schedule("1,15").matches(date(2024, 2, 15)))
+
+    def test_never(self):
+        for expression in ["", "x", None, float("nan")]:
+            self.assertIsNone(compile_schedule(expression).next_run(datetime(2024, 1, 1)))
+
+    def test_next_run(self):
+        schedule = compile_schedule("31")
+        self.assertEqual(schedule.next_run(datetime(2024, 2, 1), time(6)), datetime(2024, 3, 31, 6))
+        self.assertEqual(schedule.next_run(datetime(2024, 3, 31, 6), time(6)), datetime(2024, 3, 31, 6))
+        self.assertEqual(schedule.next_run(datetime(2024, 3, 31, 7), time(6)), datetime(2024, 5, 31, 6))
+
+
+class TestScheduleIndex(BaseTestCase):
+    """
+    Tests for ScheduleIndex.
+    """
+
+    def test_pop_due(self):
+        jobs = [{"name": "weekly", "schedule": "Mo"}, {"name": "daily", "schedule": "d"}, {"name": "never", "schedule": ""}]
+        index = ScheduleIndex(jobs, after=datetime(2024, 1, 1))
+        self.assertEqual(len(index), 2)
+        self.assertEqual([job["name"] for job in index.pop_due(datetime(2024, 1, 1, 12))], ["weekly", "daily"])
+        self.assertEqual(index.next_time(), datetime(2024, 1, 2))
+        self.assertEqual([job["name"] for job in index.pop_due(datetime(2024, 1, 5))], ["daily"])
+        self.assertEqual(index.pop_due(datetime(2024, 1, 5, 1)), [])
+        self.assertEqual(index.next_time(), datetime(2024, 1, 6))
+
+
+class StopDaemon(BaseException):
+    """Ends run_forever from a test, past its handling of errors."""
+
+
+class TestRunForever(FakeJobsTestCase):
+    """
+    Tests for JobManager.run_forever.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sleeps = []
+        self.spreadsheet(URL, [["id", "name"], ["1", "a"]])
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        raise StopDaemon()
+
+    def test_sleep_not_negative(self):
+        # every read of the clock is 6 seconds later: the wake up time passes between the check and the sleep
+        clock = itertools.count(start=0, step=6)
+        self.patch(mock.patch.object(manager, "time", SimpleNamespace(time=lambda: next(clock), sleep=self.sleep)))
+        with self.assertRaises(StopDaemon):
+            self.manager().run_forever(config_refresh=10)
+        self.assertEqual(self.sleeps, [0])
+
+    def test_failed_cycle_logged(self):
+        self.patch(mock.patch.object(manager, "time", SimpleNamespace(time=real_time.time, sleep=self.sleeps.append)))
+        job_manager = self.manager([config_row(URL, TABLE, range="A:B")])
+        loader = mock.Mock(side_effect=[ConnectionError("offline"), StopDaemon()])
+        with mock.patch.object(manager, "ConfigLoader", loader), self.assertLogs(level="ERROR") as logs:
+            with self.assertRaises(StopDaemon):
+                job_manager.run_forever(config_refresh=0)
+        # the jobs due at start ran, the failed read of the config was retried later
+        self.assertEqual(self.client.tables[TABLE].num_rows, 1)
+        self.assertIn("daemon cycle failed: offline", logs.output[0])
+        self.assertEqual(self.sleeps, [settings.DAEMON_RETRY_DELAY])
+        self.assertEqual(loader.call_count, 2)
@@ -0,0 +1,83 @@
+"""
+Tests for the schema inference in schema.py.
+"""
+import datetime
+import decimal
+
+import numpy as np
+import pandas as pd
+
+from schema import classify_columns, infer_schema, BOOL, DATE, FLOAT64, INT64, NUMERIC, STRING, TIMESTAMP
+from .base_test import BaseTestCase
+
+
+def frame(columns):
+    n_rows = max(len(values) for values in columns.values())
+    padded = {name: values + [None] * (n_rows - len(values)) for name, values in columns.items()}
+    return pd.DataFrame({name: np.array(values, dtype=object) for name, values in padded.items()})
+
+
+class TestClassifyColumns(BaseTestCase):
+    """
+    Tests for classify_columns.
+    """
+
+    def test_types(self):
+        """Test that each column gets the most specific type matching all its cells."""
+        df = frame(
+            {
+                "int": ["1", "-2", "1,234"],
+                "float": ["1.5", "2", "1e3"],
+                "numeric": ["12345678901234567890", "5"],
+                "bool": ["TRUE", "false"],
+                "date": ["2024-01-15", "2024-2-1"],
+                "timestamp": ["1/15/2024 13:45:00", "2024-01-15T10:00:00Z"],
+                "string": ["abc", "1"],
+            }
+        )
+        self.assertEqual(
+            classify_columns(df.to_numpy(dtype=object)),
+            [INT64, FLOAT64, NUMERIC, BOOL, DATE, TIMESTAMP, STRING],
+        )
+
+    def test_empty_cells_ignored(self):
+        """Test that empty and missing cells do not change the type."""
+        df = frame({"a": ["1", "", None, "3"]})
+        self.assertEqual(classify_columns(df.to_numpy(dtype=object)), [INT64])
+
+    def test_all_empty(self):
+        """Test that a column without any value is a string."""
+        df = frame({"a": ["", None]})
+        self.assertEqual(classify_columns(df.to_numpy(dtype=object)), [STRING])
+
+
+class TestInferSchema(BaseTestCase):
+    """
+    Tests for infer_schema.
+    """
+
+    def test_schema_covers_all_columns(self):
+        df = frame({"a": ["1", "2"], "b": ["x", "y"], "c": ["TRUE", ""]})
+        _, schema = infer_schema(df)
+        self.assertEqual([(f.name, f.field_type) for f in schema], [("a", "INTEGER"), ("b", "STRING"), ("c", "BOOLEAN")])
+
+    def test_converted_values(self):
+        df = frame(
+            {
+                "int": ["123456789012345678", ""],
+                "numeric": ["12345678901234567.25", "1.1"],
+                "date": ["1/31/2024", "2/1/2024"],
+            }
+        )
+        typed, _ = infer_schema(df)
+        self.assertEqual(typed["int"].tolist()[0], 123456789012345678)
+        self.assertTrue(pd.isna(typed["int"].tolist()[1]))
+        self.assertEqual(typed["numeric"].tolist(), [decimal.Decimal("12345678901234567.25"), decimal.Decimal("1.1")])
+        self.assertEqual(typed["date"].tolist(), [datetime.date(2024, 1, 31), datetime.date(2024, 2, 1)])
+
+    def test_fallback_to_string_outside_sample(self):
+        """Test that a cell outside the sample that does not convert turns the column into a string."""
+        df = frame({"a": ["1"] * 50 + ["oops"]})
+        typed, schema = infer_schema(df, sample_size=10)
+        self.assertEqual(schema[0].field_type, "STRING")
+        self.assertEqual(typed["a"].tolist()[-1], "oops")
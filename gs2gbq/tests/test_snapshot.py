@@ -0,0 +1,76 @@
+"""
+Tests for the snapshot cache of raw sheet cells.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from snapshot import SnapshotCache
+from .base_test import BaseTestCase
+
+
+def cells(n_rows):
+    values = np.empty((n_rows, 3), dtype=object)
+    values[:, 0] = [str(i) for i in range(n_rows)]
+    values[:, 1] = ["x" * 100] * n_rows
+    values[:, 2] = None
+    return ["id", "text", "empty"], values
+
+
+class TestSnapshotCache(BaseTestCase):
+    """
+    Tests for SnapshotCache.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SnapshotCache(os.path.join(self.directory.name, "snapshots"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def key(self, revision="rev-1", first_row=2):
+        return SnapshotCache.key("https://sheet", "data", "A:C", revision, first_row)
+
+    def test_round_trip(self):
+        headers, values = cells(10)
+        self.cache.put(self.key(), headers, values)
+        cached_headers, cached_values = self.cache.get(self.key())
+        self.assertEqual(cached_headers, headers)
+        self.assertEqual(cached_values.dtype, object)
+        self.assert_array_equal(cached_values, values)
+
+    def test_other_revision_or_row_misses(self):
+        self.cache.put(self.key(), *cells(10))
+        self.assertIsNone(self.cache.get(self.key(revision="rev-2")))
+        self.assertIsNone(self.cache.get(self.key(first_row=5)))
+
+    def test_uncompressed(self):
+        cache = SnapshotCache(self.cache.directory, compression="")
+        headers, values = cells(10)
+        cache.put(self.key(), headers, values)
+        self.assert_array_equal(cache.get(self.key())[1], values)
+
+    def test_least_recently_used_evicted(self):
+        headers, values = cells(1000)
+        for revision in ["rev-1", "rev-2"]:
+            self.cache.put(self.key(revision), headers, values)
+        size = os.path.getsize(self.cache.path(self.key("rev-1")))
+        # rev-1 used last
+        past = time.time() - 60
+        os.utime(self.cache.path(self.key("rev-2")), (past, past))
+        self.cache.get(self.key("rev-1"))
+
+        self.cache.max_bytes = 2 * size + size // 2
+        self.cache.put(self.key("rev-3"), headers, values)
+        self.assertIsNone(self.cache.get(self.key("rev-2")))
+        self.assertIsNotNone(self.cache.get(self.key("rev-1")))
+        self.assertIsNotNone(self.cache.get(self.key("rev-3")))
+
+    def test_disabled(self):
+        cache = SnapshotCache(self.cache.directory, max_bytes=0)
+        cache.put(self.key(), *cells(10))
+        self.assertIsNone(cache.get(self.key()))
+        self.assertFalse(os.path.exists(self.cache.directory))
@@ -0,0 +1,143 @@
+"""
+Tests for the staged full loads of GSHandler.push_data_to_big_query.
+"""
+import os
+from unittest import mock
+
+import google.api_core.exceptions
+import pyarrow as pa
+from google.cloud import bigquery
+
+from clients import registry
+from conf import settings
+from gshandler import APPEND_MODE, GSHandler, staging_table_name
+from ratelimit import BIGQUERY_LOAD, TokenBucket, limiter
+from .base_test import BaseTestCase
+
+TABLE = "project.dataset.table"
+
+
+class Job:
+    def __init__(self, error=None) -> None:
+        self.error = error
+
+    def result(self, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class RecordingClient:
+    """Records the calls made to BigQuery, optionally failing the load jobs."""
+
+    def __init__(self, tables=(), fail_loads=False) -> None:
+        self.tables = set(tables)
+        self.fail_loads = fail_loads
+        self.calls = []
+
+    def get_table(self, table_name):
+        if table_name not in self.tables:
+            raise google.api_core.exceptions.NotFound(table_name)
+        return type("Table", (), {"schema": []})()
+
+    def delete_table(self, table_name, not_found_ok=False):
+        self.calls.append(("delete", table_name))
+        self.tables.discard(table_name)
+
+    def load_table_from_file(self, file_obj, table_name, job_config=None):
+        self.calls.append(("load", table_name))
+        if self.fail_loads:
+            return Job(ConnectionError("connection reset"))
+        self.tables.add(table_name)
+        return Job()
+
+    def create_table(self, table, exists_ok=False):
+        table_name = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        self.calls.append(("create", table_name, [(field.name, field.field_type) for field in table.schema]))
+        self.tables.add(table_name)
+        return table
+
+    def copy_table(self, source, destination, job_config=None):
+        self.calls.append(("copy", source, destination, job_config.write_disposition))
+        if source not in self.tables:
+            return Job(google.api_core.exceptions.NotFound(source))
+        self.tables.add(destination)
+        return Job()
+
+
+class TestStagedLoads(BaseTestCase):
+    """
+    Tests for full loads going through a staging table.
+    """
+
+    def setUp(self):
+        self.handler = GSHandler("https://sheet", "data")
+        quota = mock.patch.dict(limiter._buckets, {BIGQUERY_LOAD: TokenBucket(BIGQUERY_LOAD, 0)})
+        quota.start()
+        self.addCleanup(quota.stop)
+        self.data = pa.table({"id": [1, 2, 3]})
+
+    def tearDown(self):
+        registry.invalidate()
+
+    def client(self, **kwargs):
+        client = RecordingClient(**kwargs)
+        registry._bigquery_clients[(os.path.abspath(settings.CREDENTIAL_FILE), "project")] = client
+        return client
+
+    def test_full_load_replaces_table_with_copy(self):
+        client = self.client(tables=[TABLE])
+        self.handler.push_data_to_big_query(self.data, TABLE, staged=True)
+        staging = staging_table_name(TABLE)
+        self.assertEqual(
+            client.calls,
+            [("delete", staging), ("load", staging), ("copy", staging, TABLE, "WRITE_TRUNCATE"), ("delete", staging)],
+        )
+        self.assertEqual(client.tables, {TABLE})
+
+    def test_failed_load_leaves_table_alone(self):
+        client = self.client(tables=[TABLE], fail_loads=True)
+        with self.assertRaises(ConnectionError):
+            self.handler.push_data_to_big_query(self.data, TABLE, staged=True)
+        self.assertNotIn(("delete", TABLE), client.calls)
+        self.assertEqual(client.tables, {TABLE})
+
+    def test_unstaged_full_load_deletes_table(self):
+        client = self.client(tables=[TABLE])
+        self.handler.push_data_to_big_query(self.data, TABLE, staged=False)
+        self.assertEqual(client.calls, [("delete", TABLE), ("load", TABLE)])
+
+    def test_append_is_not_staged(self):
+        client = self.client(tables=[TABLE])
+        self.handler.push_data_to_big_query(self.data, TABLE, mode=APPEND_MODE, staged=True)
+        self.assertEqual(client.calls, [("load", TABLE)])
+
+    def test_empty_table(self):
+        # a header-only sheet: no load job, the table is replaced by an empty one
+        client = self.client(tables=[TABLE])
+        schema = [bigquery.SchemaField("id", "INTEGER")]
+        self.handler.push_data_to_big_query(self.data.slice(0, 0), TABLE, schema, staged=True)
+        staging = staging_table_name(TABLE)
+        self.assertEqual(
+            client.calls,
+            [
+                ("delete", staging),
+                ("create", staging, [("id", "INTEGER")]),
+                ("copy", staging, TABLE, "WRITE_TRUNCATE"),
+                ("delete", staging),
+            ],
+        )
+        self.assertEqual(client.tables, {TABLE})
+
+    def test_empty_table_without_schema(self):
+        client = self.client()
+        self.handler.push_data_to_big_query(self.data.slice(0, 0), TABLE, staged=True)
+        self.assertIn(("create", staging_table_name(TABLE), [("id", "STRING")]), client.calls)
+        self.assertEqual(client.tables, {TABLE})
+
+    def test_missing_table_not_retried(self):
+        client = self.client()
+        client.create_table = lambda table, exists_ok=False: table
+        with self.assertRaises(google.api_core.exceptions.NotFound):
+            self.handler.push_data_to_big_query(self.data.slice(0, 0), TABLE, staged=True)
+        self.assertEqual(len([call for call in client.calls if call[0] == "copy"]), 1)
@@ -0,0 +1,69 @@
+"""
+Tests for what importing the package loads and sets up.
+"""
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+import conf
+from .base_test import BaseTestCase
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a root logger without the file handler of logging.ini
+LOGGING_INI = """
+[loggers]
+keys=root
+
+[handlers]
+keys=nullHandler
+
+[formatters]
+keys=
+
+[logger_root]
+level=WARNING
+handlers=nullHandler
+
+[handler_nullHandler]
+class=NullHandler
+args=()
+"""
+
+
+class TestStartup(BaseTestCase):
+    """
+    Tests for the lazy imports and the one-time logging configuration.
+    """
+
+    def test_import_manager_defers_bigquery(self):
+        modules = ["google.cloud.bigquery", "arrowconv", "numpy", "pandas", "pyarrow", "gspread", "google.oauth2"]
+        code = f"import sys, manager; print(*[name in sys.modules for name in {modules!r}])"
+        env = dict(os.environ, PYTHONPATH=PACKAGE)
+        out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+        self.assertEqual(dict(zip(modules, out.stdout.split())), dict.fromkeys(modules, "False"))
+
+    def test_configure_logging_keeps_existing_loggers(self):
+        logger = logging.getLogger("gshandler")
+        root = logging.getLogger()
+        configured = conf._logging_configured
+        handlers, level = root.handlers[:], root.level
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "logging.ini")
+            with open(path, "w") as f:
+                f.write(LOGGING_INI)
+            try:
+                conf._logging_configured = False
+                conf.configure_logging(path)
+                self.assertFalse(logger.disabled)
+                self.assertTrue(conf._logging_configured)
+                # configured once: a second call does not even read its file
+                conf.configure_logging(os.path.join(directory, "missing.ini"))
+            finally:
+                conf._logging_configured = configured
+                for handler in root.handlers:
+                    handler.close()
+                root.handlers[:] = handlers
+                root.setLevel(level)
@@ -0,0 +1,76 @@
+"""
+Tests for the Storage Write API sink in storagewrite.py.
+"""
+from unittest import mock
+
+import pyarrow as pa
+
+import metrics
+import storagewrite
+from storagewrite import COMMITTED_STREAM, PENDING_STREAM, LocalWriteClient, StorageWriteError, table_path, write_table
+from .base_test import BaseTestCase
+
+PATH = table_path("project.dataset.table")
+
+
+def table(n_rows):
+    return pa.table({"id": pa.array(range(n_rows), pa.int64()), "name": pa.array([f"row {i}" for i in range(n_rows)])})
+
+
+class TestWriteTable(BaseTestCase):
+    """
+    Tests for write_table against the local writer.
+    """
+
+    def test_pending_rows_visible_after_commit(self):
+        api = LocalWriteClient()
+        self.assertEqual(write_table(api, PATH, table(1000), PENDING_STREAM, max_bytes=2000), 1000)
+        self.assertEqual(api.rows(PATH).to_pydict(), table(1000).to_pydict())
+
+    def test_pending_rows_invisible_until_commit(self):
+        api = LocalWriteClient()
+        stream = api.create_stream(PATH, PENDING_STREAM)
+        batch = table(3).to_batches()[0]
+        api.append(stream, batch.schema.serialize().to_pybytes(), [(0, batch.serialize().to_pybytes())])
+        self.assertIsNone(api.rows(PATH))
+        api.finalize(stream)
+        api.commit(PATH, [stream])
+        self.assertEqual(api.rows(PATH).num_rows, 3)
+
+    def test_committed_stream(self):
+        api = LocalWriteClient()
+        write_table(api, PATH, table(10), COMMITTED_STREAM)
+        write_table(api, PATH, table(5), COMMITTED_STREAM)
+        self.assertEqual(api.rows(PATH).num_rows, 15)
+
+    def test_offset_mismatch(self):
+        api = LocalWriteClient()
+        stream = api.create_stream(PATH, COMMITTED_STREAM)
+        batch = table(3).to_batches()[0]
+        with self.assertRaises(StorageWriteError):
+            api.append(stream, batch.schema.serialize().to_pybytes(), [(1, batch.serialize().to_pybytes())])
+
+    def test_batches_streamed(self):
+        produced = []
+        record_batches = storagewrite.record_batches
+
+        def counted(*args):
+            for batch in record_batches(*args):
+                produced.append(batch)
+                yield batch
+
+        class Api(LocalWriteClient):
+            def append(self, stream, schema, batches):
+                def checked():
+                    for i, item in enumerate(batches, 1):
+                        # nothing is serialized ahead of the stream
+                        assert len(produced) == i
+                        yield item
+
+                super().append(stream, schema, checked())
+
+        job_metrics = metrics.JobMetrics()
+        with mock.patch.object(storagewrite, "record_batches", counted), metrics.recording(job_metrics):
+            self.assertEqual(write_table(Api(), PATH, table(1000), max_bytes=2000), 1000)
+        self.assertGreater(len(produced), 1)
+        self.assertEqual(job_metrics.api_calls["storage_write"], len(produced))
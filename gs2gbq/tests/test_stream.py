@@ -0,0 +1,180 @@
+"""
+Tests for reading and loading sheets block by block.
+"""
+from unittest import mock
+
+from conf import settings
+from gshandler import FULL_MODE, GSHandler, retype_statement, staging_table_name
+from schema import DATE, FLOAT64, INT64, NUMERIC, STRING, common_type, schema_types
+from transform import ARROW_ENGINE, PANDAS_ENGINE
+from watermark import WatermarkStore
+from .fake_jobs import PROJECT, FakeJobsTestCase, config_row
+from .base_test import BaseTestCase
+
+URL = "https://fake/data"
+TABLE = f"{PROJECT}.dataset.table"
+
+
+def sheet_rows(n_rows: int, bad_row: int = None) -> list:
+    """Header and `n_rows` rows of id, name and amount; the id of data row `bad_row` is not a number."""
+    rows = [["id", "name", "amount"]]
+    for i in range(1, n_rows + 1):
+        rows.append(["n/a" if i == bad_row else str(i), f"name {i}", f"{i}.5"])
+    return rows
+
+
+class TestCommonType(BaseTestCase):
+    """
+    Tests for common_type and retype_statement.
+    """
+
+    def test_common_type(self):
+        self.assertEqual(common_type(INT64, INT64), INT64)
+        self.assertEqual(common_type(INT64, FLOAT64), FLOAT64)
+        self.assertEqual(common_type(NUMERIC, INT64), NUMERIC)
+        self.assertEqual(common_type(FLOAT64, NUMERIC), FLOAT64)
+        self.assertEqual(common_type(INT64, STRING), STRING)
+        self.assertEqual(common_type(DATE, INT64), STRING)
+
+    def test_retype_statement(self):
+        self.assertEqual(
+            retype_statement("p.d.t", {"id": STRING, "n": FLOAT64}),
+            "CREATE OR REPLACE TABLE `p.d.t` AS SELECT * REPLACE "
+            "(CAST(`id` AS STRING) AS `id`, CAST(`n` AS FLOAT64) AS `n`) FROM `p.d.t`",
+        )
+
+
+class TestIterValues(FakeJobsTestCase):
+    """
+    Tests for GSHandler.iter_values.
+    """
+
+    def test_blocks(self):
+        self.spreadsheet(URL, sheet_rows(25))
+        blocks = list(GSHandler(URL, "data", "A:C").iter_values(2, chunk_rows=10))
+        self.assertEqual([first_row for _, _, first_row in blocks], [2, 12, 22])
+        self.assertEqual([values.shape for _, values, _ in blocks], [(10, 3), (10, 3), (5, 3)])
+        self.assertEqual(blocks[0][0], ["id", "name", "amount"])
+        self.assertEqual(blocks[2][1][-1].tolist(), ["25", "name 25", "25.5"])
+
+    def test_ranges_padded_alike(self):
+        # B is only filled on the first rows: every block keeps the width of the header
+        rows = [["id", "note", "amount"]] + [[str(i), "x" if i < 3 else "", str(i)] for i in range(1, 8)]
+        self.spreadsheet(URL, rows)
+        blocks = list(GSHandler(URL, "data", "A:B,C").iter_values(2, chunk_rows=4))
+        self.assertEqual(blocks[0][0], ["id", "note", "amount"])
+        self.assertEqual(blocks[1][1].tolist(), [["5", None, "5"], ["6", None, "6"], ["7", None, "7"]])
+
+    def test_trailing_empty_rows_dropped(self):
+        self.spreadsheet(URL, sheet_rows(12) + [["", "", ""]] * 10)
+        blocks = list(GSHandler(URL, "data", "A:C").iter_values(2, chunk_rows=10))
+        self.assertEqual([values.shape[0] for _, values, _ in blocks], [10, 2])
+
+
+class TestStreamJob(FakeJobsTestCase):
+    """
+    Tests for JobManager.stream_job.
+    """
+
+    def stream(self, rows, engine=ARROW_ENGINE, load_mode=FULL_MODE):
+        self.spreadsheet(URL, rows)
+        manager = self.manager()
+        manager.engine = engine
+        manager.stream_chunk_rows = 10
+        return manager.stream_job(GSHandler(URL, "data", "A:C"), TABLE, 2, load_mode)
+
+    def field_types(self, table):
+        schema = self.client.tables[table].schema
+        return dict(zip([field.name for field in schema], schema_types(schema)))
+
+    def test_blocks_loaded(self):
+        self.assertEqual(self.stream(sheet_rows(25)), (25, 26))
+        self.assertEqual(self.client.tables[TABLE].num_rows, 25)
+        self.assertEqual(self.field_types(TABLE), {"id": INT64, "name": STRING, "amount": FLOAT64})
+        self.assertNotIn(staging_table_name(TABLE), self.client.tables)
+
+    def test_later_block_widens_column(self):
+        for engine in [ARROW_ENGINE, PANDAS_ENGINE]:
+            with self.subTest(engine=engine):
+                self.client.tables.clear()
+                self.assertEqual(self.stream(sheet_rows(25, bad_row=21), engine), (25, 26))
+                self.assertEqual(self.client.tables[TABLE].num_rows, 25)
+                self.assertEqual(self.field_types(TABLE), {"id": STRING, "name": STRING, "amount": FLOAT64})
+                retypes = [sql for kind, sql in self.client.jobs if kind == "query"]
+                self.assertIn("CAST(`id` AS STRING)", retypes[-1])
+
+    def test_number_column_widened_to_float(self):
+        rows = sheet_rows(15)
+        rows[13][0] = "13.25"
+        self.stream(rows)
+        self.assertEqual(self.field_types(TABLE)["id"], FLOAT64)
+
+    def test_empty_column_not_widened(self):
+        # amount is empty in the second block: it fits any type and keeps its own
+        rows = sheet_rows(15, bad_row=12)
+        for row in rows[11:]:
+            row[2] = ""
+        self.stream(rows)
+        self.assertEqual(self.field_types(TABLE), {"id": STRING, "name": STRING, "amount": FLOAT64})
+
+    def test_unstaged(self):
+        self.patch(mock.patch.object(settings, "STAGED_WRITES", False))
+        self.assertEqual(self.stream(sheet_rows(25, bad_row=21)), (25, 26))
+        self.assertEqual(self.field_types(TABLE)["id"], STRING)
+
+
+class TestStreamResume(FakeJobsTestCase):
+    """
+    Tests for carrying on a staged streamed load interrupted by an error.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sheet = self.spreadsheet(URL, sheet_rows(25))
+        self.staging = staging_table_name(TABLE)
+
+    def run_job(self, fail_at_block: int = None):
+        manager = self.manager([config_row(URL, TABLE)])
+        manager.stream_chunk_rows = 10
+        push = GSHandler.push_data_to_big_query
+        calls = []
+
+        def failing_push(handler, data, table_name, *args, **kwargs):
+            calls.append(table_name)
+            if len(calls) == fail_at_block:
+                raise ConnectionError("connection reset")
+            return push(handler, data, table_name, *args, **kwargs)
+
+        with mock.patch.object(GSHandler, "push_data_to_big_query", failing_push):
+            manager.run()
+        row = manager.job_config_handler.config[0]
+        return manager.job_state.get(WatermarkStore.job_key(row)), calls
+
+    def test_resume_after_error(self):
+        state, calls = self.run_job(fail_at_block=3)
+        self.assertEqual((state["status"], state["rows_loaded"], state["next_row"]), ("FAIL", 20, 22))
+        # the staging table and its two blocks are kept for the next run
+        self.assertEqual(self.client.tables[self.staging].num_rows, 20)
+        self.assertNotIn(TABLE, self.client.tables)
+
+        state, calls = self.run_job()
+        self.assertEqual(calls, [self.staging])
+        self.assertEqual(state["status"], "SUCCESS")
+        self.assertEqual(self.client.tables[TABLE].num_rows, 25)
+        self.assertNotIn(self.staging, self.client.tables)
+
+    def test_error_before_checkpoint_drops_staging(self):
+        state, _ = self.run_job(fail_at_block=1)
+        self.assertEqual((state["status"], state["next_row"]), ("FAIL", None))
+        self.assertNotIn(self.staging, self.client.tables)
+
+    def test_changed_source_drops_staging(self):
+        self.run_job(fail_at_block=2)
+        self.assertIn(self.staging, self.client.tables)
+        self.sheet.touch()
+        # the new revision is read again from the start
+        self.sheet.worksheets["data"].rows = sheet_rows(5)
+        state, calls = self.run_job()
+        self.assertEqual(calls, [TABLE])
+        self.assertEqual((state["status"], self.client.tables[TABLE].num_rows), ("SUCCESS", 5))
+        self.assertNotIn(self.staging, self.client.tables)
@@ -0,0 +1,22 @@
+"""
+CPU stage of a job: typing the raw cells read from a sheet.
+
+Kept free of any client or handler so that it can run in a worker process.
+The conversion modules (and BigQuery's) are only imported by the first sheet
+typed.
+"""
+
+PANDAS_ENGINE = "pandas"
+ARROW_ENGINE = "arrow"
+
+
+def transform_values(engine: str, headers, values, types=None):
+    """Type the raw cells with `engine`: a DataFrame (pandas) or an Arrow table (arrow), plus its schema."""
+    if engine == ARROW_ENGINE:
+        from arrowconv import values_to_table
+
+        return values_to_table(headers, values, types=types)
+    import pandas as pd
+    from schema import infer_schema
+
+    return infer_schema(pd.DataFrame(values, columns=headers), types=types)
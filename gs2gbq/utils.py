@@ -1,13 +1,16 @@
 import functools
+import json
+import os
 import time
 import random
 import inspect
 
-import gspread
 import smtplib
 import traceback
 from email.mime.text import MIMEText
 
+import metrics
+
 import logging.config
 
 logger = logging.getLogger(__name__)
@@ -74,6 +77,18 @@ def lineno():
     return inspect.currentframe().f_back.f_lineno
 
 def backoff_hdlr(details):
+    metrics.count(metrics.BACKOFFS)
     print ("Backing off {wait:0.1f} seconds after {tries} tries "
            "calling function {target} with args {args} and kwargs "
-           "{kwargs}".format(**details))
\ No newline at end of file
+           "{kwargs}".format(**details))
+
+def write_json_atomic(path, data):
+    """Write `data` as JSON to a temporary file and rename it over `path`,
+    so a crash never leaves a truncated file behind."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp_path, path)
@@ -0,0 +1,59 @@
+import json
+import threading
+
+import utils
+from gshandler import FULL_MODE
+
+
+class WatermarkStore:
+    """Last ingested sheet row per job, kept in a local JSON file.
+
+    The watermark is a row number: incremental jobs assume rows are only ever
+    appended at the bottom of the sheet, never inserted, sorted or deleted.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def job_key(row) -> str:
+        """Key of the state of a job: a new first row or mode starts it afresh, as a new source or table does."""
+        parts = [str(row[c]).strip() for c in ["gs", "sheet", "range", "table", "startingrow"]]
+        return "|".join(parts + [(row.get("mode") or FULL_MODE).strip().lower()])
+
+    @staticmethod
+    def legacy_key(row) -> str:
+        """`job_key` as it was before the starting row and mode were part of it."""
+        return "|".join(str(row[c]).strip() for c in ["gs", "sheet", "range", "table"])
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key: str):
+        with self._lock:
+            return self._load().get(key)
+
+    def set(self, key: str, last_row: int) -> None:
+        with self._lock:
+            marks = self._load()
+            marks[key] = last_row
+            utils.write_json_atomic(self.path, marks)
+
+    def adopt(self, key: str, old_key: str) -> None:
+        """Move the watermark kept under `old_key` to `key`, unless `key` has one already."""
+        with self._lock:
+            marks = self._load()
+            if old_key in marks and key not in marks:
+                marks[key] = marks.pop(old_key)
+                utils.write_json_atomic(self.path, marks)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            marks = self._load()
+            if marks.pop(key, None) is not None:
+                utils.write_json_atomic(self.path, marks)